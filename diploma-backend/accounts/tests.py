@@ -1,3 +1,55 @@
-from django.test import TestCase
+import tempfile
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from megano.testing import EndpointBudgetMixin
+from orders.seed import SEED_PASSWORD, SEED_USERNAME_PREFIX
+
+
+class AccountEndpointBudgetTestCase(EndpointBudgetMixin, TestCase):
+    """
+    Бюджеты SQL-запросов и задержки эндпоинтов пользователей на синтетическом наборе данных.
+    Вход, регистрация и смена пароля вычисляют хэш пароля, поэтому их бюджет задержки больше
+    """
+    password_repeat = 5
+
+    def setUp(self):
+        self.user = get_user_model().objects.get(username=f'{SEED_USERNAME_PREFIX}0')
+
+    def test_sign_in_and_out(self):
+        self.assertWithinBudget('post', reverse('accounts:sign-in'), 10, 1500,
+                                {'username': self.user.username, 'password': SEED_PASSWORD},
+                                repeat=self.password_repeat, content_type='application/json')
+        self.assertWithinBudget('post', reverse('accounts:sign-out'), 4, 50,
+                                prepare=lambda: self.client.force_login(self.user))
+        # Повторный выход без сессии
+        self.assertWithinBudget('post', reverse('accounts:sign-out'), 0, 50)
+
+    def test_sign_up(self):
+        self.assertWithinBudget('post', reverse('accounts:sign-up'), 11, 1500,
+                                {'name': 'New Buyer', 'username': 'new-buyer', 'password': 'Megano-2024!'},
+                                repeat=self.password_repeat, content_type='application/json')
+
+    def test_profile(self):
+        self.client.force_login(self.user)
+        self.assertWithinBudget('get', reverse('accounts:profile'), 2, 50)
+        self.assertWithinBudget('post', reverse('accounts:profile'), 5, 50,
+                                {'fullName': 'Seed Buyer', 'email': self.user.email, 'phone': self.user.phone},
+                                content_type='application/json')
+
+    def test_change_password(self):
+        # Смена пароля меняет ключ сессии, а новая сессия откатывается вместе с выполнением - входим заново
+        self.assertWithinBudget('post', reverse('accounts:change-password'), 12, 3000,
+                                {'currentPassword': SEED_PASSWORD, 'newPassword': 'Megano-2024!'},
+                                repeat=self.password_repeat, prepare=lambda: self.client.force_login(self.user),
+                                content_type='application/json')
+
+    def test_avatar_upload(self):
+        self.client.force_login(self.user)
+        with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+            # Загруженный файл читается запросом один раз, поэтому - одно выполнение
+            avatar = SimpleUploadedFile('avatar.png', b'avatar', content_type='image/png')
+            self.assertWithinBudget('post', reverse('accounts:avatar-upload'), 3, 50, {'avatar': avatar}, repeat=1)
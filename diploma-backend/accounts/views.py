@@ -83,9 +83,9 @@ class SignInView(APIView):
 class SignOutView(APIView):
     """Выход авторизированного пользователя"""
     def post(self, request: Request):
-        if request.user.is_authenticated:
-            logout(request)
-            return Response({'message': 'Successfully signed out'}, status=status.HTTP_200_OK)
+        # Повторный выход (сессия уже завершена) тоже успешен
+        logout(request)
+        return Response({'message': 'Successfully signed out'}, status=status.HTTP_200_OK)
 
 
 class ProfileUserView(APIView):
@@ -0,0 +1,227 @@
+"""
+Инструментирование запросов.
+
+InstrumentationMiddleware замеряет для каждого запроса:
+- количество SQL-запросов и их суммарное время (через connection.execute_wrapper);
+- время сериализации ответа (рендеринг DRF Response в JSON);
+- общее время обработки запроса (view вместе с остальными middleware).
+Запросы дольше SLOW_QUERY_THRESHOLD_MS дополнительно попадают в журнал медленных запросов (megano/slow_queries.py).
+Замеры отдаются в заголовке Server-Timing (видны во вкладке Network браузера), пишутся строкой JSON
+в лог megano.instrumentation и накапливаются в гистограммах по маршруту URL.
+Гистограммы отдаёт в текстовом формате Prometheus эндпоинт /internal/metrics, доступный с заголовком
+Authorization: Bearer <METRICS_TOKEN> или с адресов METRICS_ALLOWED_IPS (по умолчанию - ни с каких).
+Гистограммы хранятся в памяти процесса: при нескольких воркерах каждый отдаёт свои.
+Отключается настройкой INSTRUMENTATION_ENABLED.
+"""
+import bisect
+import json
+import logging
+import threading
+from contextlib import ExitStack
+from time import perf_counter
+from typing import Dict, Tuple
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.http import Http404, HttpResponse
+
+from .slow_queries import capture_slow_query
+
+logger = logging.getLogger(__name__)
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)    # сек
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100)
+UNMATCHED_ROUTE = '<unmatched>'
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class Histogram:
+    """Гистограмма с фиксированными границами корзин; счётчики корзин не накопительные"""
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class RequestMetrics:
+    """Гистограммы и счётчики запросов по (метод, маршрут)"""
+    histograms = (
+        # (метрика, описание, границы корзин)
+        ('megano_http_request_duration_seconds', 'Request processing time', DURATION_BUCKETS),
+        ('megano_http_request_db_duration_seconds', 'Time spent in SQL queries per request', DURATION_BUCKETS),
+        ('megano_http_request_render_duration_seconds', 'Response serialization time', DURATION_BUCKETS),
+        ('megano_http_request_db_queries', 'SQL queries per request', QUERY_COUNT_BUCKETS),
+    )
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.series: Dict[Tuple[str, str], Tuple[Histogram, ...]] = {}
+        self.responses: Dict[Tuple[str, str, int], int] = {}
+
+    def observe(self, method: str, route: str, status: int, *values: float):
+        """values - в порядке histograms"""
+        key = (method, route)
+        with self.lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = tuple(Histogram(buckets) for _, _, buckets in self.histograms)
+            for histogram, value in zip(series, values):
+                histogram.observe(value)
+            self.responses[(method, route, status)] = self.responses.get((method, route, status), 0) + 1
+
+    def reset(self):
+        with self.lock:
+            self.series.clear()
+            self.responses.clear()
+
+    def render(self) -> str:
+        """Метрики в текстовом формате Prometheus"""
+        with self.lock:
+            lines = [
+                '# HELP megano_http_requests_total Responses by route and status',
+                '# TYPE megano_http_requests_total counter',
+            ]
+            for (method, route, status), count in sorted(self.responses.items()):
+                lines.append(f'megano_http_requests_total{{{labels(method, route)},status="{status}"}} {count}')
+
+            for index, (name, description, buckets) in enumerate(self.histograms):
+                lines += [f'# HELP {name} {description}', f'# TYPE {name} histogram']
+                for (method, route), series in sorted(self.series.items()):
+                    histogram, route_labels = series[index], labels(method, route)
+                    cumulative = 0
+                    for bound, count in zip(buckets + ('+Inf',), histogram.counts):
+                        cumulative += count
+                        lines.append(f'{name}_bucket{{{route_labels},le="{bound}"}} {cumulative}')
+                    lines.append(f'{name}_sum{{{route_labels}}} {histogram.sum:.6f}')
+                    lines.append(f'{name}_count{{{route_labels}}} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+
+def escape_label(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def labels(method: str, route: str) -> str:
+    return f'method="{escape_label(method)}",route="{escape_label(route)}"'
+
+
+metrics = RequestMetrics()
+
+
+class QueryTimer:
+    """
+    Обёртка выполнения SQL (connection.execute_wrapper): количество запросов и их суммарное время.
+    Запросы дольше SLOW_QUERY_THRESHOLD_MS записываются в журнал медленных запросов (megano/slow_queries.py)
+    """
+
+    def __init__(self, request=None):
+        self.request = request
+        self.count = 0
+        self.duration = 0.0
+        self.slow_threshold = settings.SLOW_QUERY_THRESHOLD_MS / 1000
+        self.paused = False
+
+    def __call__(self, execute, sql, params, many, context):
+        if self.paused:
+            return execute(sql, params, many, context)
+        started = perf_counter()
+        try:
+            result = execute(sql, params, many, context)
+        finally:
+            elapsed = perf_counter() - started
+            self.duration += elapsed
+            self.count += 1
+        if elapsed >= self.slow_threshold:
+            # Собственные запросы журнала (EXPLAIN) не учитываются и не проверяются
+            self.paused = True
+            try:
+                capture_slow_query(context['connection'], sql, params, many, elapsed,
+                                   route=get_route(self.request) if self.request is not None else None,
+                                   view=getattr(self.request, 'instrumentation_view', None))
+            finally:
+                self.paused = False
+        return result
+
+
+def get_route(request) -> str:
+    """Шаблон маршрута URL ('api/product/<int:pk>'), чтобы метрики не разрастались по id"""
+    match = getattr(request, 'resolver_match', None)
+    return match.route if match is not None and match.route else UNMATCHED_ROUTE
+
+
+class InstrumentationMiddleware:
+    """
+    Замеры времени и SQL-запросов каждого запроса: заголовок Server-Timing, строка лога и гистограммы.
+    Подключается первым в MIDDLEWARE, чтобы замер включал остальные middleware
+    """
+
+    def __init__(self, get_response):
+        if not settings.INSTRUMENTATION_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timer = QueryTimer(request)
+        request._render_duration = 0.0
+        started = perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(timer))
+            response = self.get_response(request)
+        duration = perf_counter() - started
+        render_duration = request._render_duration
+
+        response['Server-Timing'] = (
+            f'db;desc="{timer.count} queries";dur={timer.duration * 1000:.1f}, '
+            f'render;desc="serialization";dur={render_duration * 1000:.1f}, '
+            f'total;dur={duration * 1000:.1f}'
+        )
+        route = get_route(request)
+        metrics.observe(request.method, route, response.status_code,
+                        duration, timer.duration, render_duration, timer.count)
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(json.dumps({
+                'method': request.method,
+                'route': route,
+                'path': request.path,
+                'status': response.status_code,
+                'duration_ms': round(duration * 1000, 1),
+                'db_queries': timer.count,
+                'db_ms': round(timer.duration * 1000, 1),
+                'render_ms': round(render_duration * 1000, 1),
+            }))
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        """View запроса - для места вызова медленных запросов"""
+        view = getattr(view_func, 'view_class', view_func)
+        request.instrumentation_view = f'{view.__module__}.{view.__qualname__}'
+
+    def process_template_response(self, request, response):
+        """Ответ рендерится (DRF - в JSON) сразу после этого метода: замеряем до вызова post-render callback"""
+        started = perf_counter()
+
+        def rendered(response):
+            request._render_duration = perf_counter() - started
+
+        response.add_post_render_callback(rendered)
+        return response
+
+
+def metrics_view(request) -> HttpResponse:
+    """Гистограммы запросов в формате Prometheus; доступны с токеном METRICS_TOKEN или с METRICS_ALLOWED_IPS"""
+    token = settings.METRICS_TOKEN
+    authorized = request.META.get('REMOTE_ADDR') in settings.METRICS_ALLOWED_IPS or (
+        token and request.META.get('HTTP_AUTHORIZATION') == f'Bearer {token}')
+    if not authorized:
+        raise Http404
+    return HttpResponse(metrics.render(), content_type=PROMETHEUS_CONTENT_TYPE)
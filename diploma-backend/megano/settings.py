@@ -19,6 +19,8 @@ from os import getenv
 BASE_DIR = Path(__file__).resolve().parent.parent
 DATABASE_DIR = BASE_DIR / "database"
 DATABASE_DIR.mkdir(exist_ok=True)
+LOGS_DIR = BASE_DIR / "logs"
+LOGS_DIR.mkdir(exist_ok=True)
 
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/5.2/howto/deployment/checklist/
@@ -65,11 +67,13 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'megano.instrumentation.InstrumentationMiddleware',     # первым: замер включает остальные middleware
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'orders.basket.BasketMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -105,6 +109,25 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+
+# По умолчанию - локальный кэш процесса, при заданном DJANGO_REDIS_URL - общий кэш Redis (нужен пакет redis)
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+if getenv('DJANGO_REDIS_URL'):
+    CACHES['default'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': getenv('DJANGO_REDIS_URL'),
+    }
+
+# Время жизни закэшированных ответов эндпоинтов товаров, сек (см. products/cache.py)
+PRODUCTS_CACHE_TIMEOUT = int(getenv('PRODUCTS_CACHE_TIMEOUT') or 300)
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -173,6 +196,42 @@ SPECTACULAR_SETTINGS = {
     'SERVE_INCLUDE_SCHEMA': False,                         # Отключение схемы
 }
 
+# Рейтинг популярных товаров (см. products/popular.py)
+POPULAR_PRODUCTS_LIMIT = 8                                                    # количество товаров в рейтинге
+POPULAR_PRODUCTS_MAX_AGE = int(getenv('POPULAR_PRODUCTS_MAX_AGE') or 3600)   # допустимая давность рейтинга, сек
+
+# Бэкенд полнотекстового поиска товаров (см. products/search.py), по умолчанию - по типу БД
+PRODUCT_SEARCH_BACKEND = getenv('PRODUCT_SEARCH_BACKEND') or None
+
+# Время, на которое резервируется товар под неоплаченный заказ, сек (см. orders/inventory.py)
+STOCK_RESERVATION_TTL = int(getenv('STOCK_RESERVATION_TTL') or 900)
+
+# Наибольшая давность настроек доставки в памяти процесса, сек (см. orders/pricing.py)
+PRICING_RULES_MAX_AGE = int(getenv('PRICING_RULES_MAX_AGE') or 60)
+
+# Хранилище корзины анонимного посетителя: 'cookie' или 'cache' (см. orders/basket.py)
+BASKET_ANONYMOUS_STORE = getenv('BASKET_ANONYMOUS_STORE') or 'cookie'
+BASKET_ANONYMOUS_TIMEOUT = 60 * 60 * 24 * 14                                    # время жизни корзины, сек
+
+# Множитель бюджетов задержки в тестах производительности эндпоинтов (см. megano/testing.py)
+TEST_LATENCY_BUDGET_FACTOR = float(getenv('TEST_LATENCY_BUDGET_FACTOR') or 1)
+# Запуск тестов: без INSTRUMENTATION_LOGLEVEL строка лога на каждый запрос не выводится (см. megano/testing.py)
+TEST_RUNNER = 'megano.testing.TestRunner'
+
+# Замеры запросов: Server-Timing, лог megano.instrumentation и метрики /internal/metrics (см. megano/instrumentation.py)
+INSTRUMENTATION_ENABLED = (getenv('INSTRUMENTATION_ENABLED') or 'true').lower() == 'true'
+INSTRUMENTATION_LOGLEVEL = (getenv('INSTRUMENTATION_LOGLEVEL') or 'info').upper()
+# Доступ к метрикам: с заголовком Authorization: Bearer <METRICS_TOKEN> или с адресов METRICS_ALLOWED_IPS.
+# За обратным прокси на том же хосте все запросы приходят с 127.0.0.1 - его в список не добавлять
+METRICS_TOKEN = getenv('METRICS_TOKEN') or None
+METRICS_ALLOWED_IPS = [ip for ip in getenv('METRICS_ALLOWED_IPS', '').split(',') if ip]
+
+# Журнал медленных SQL-запросов (см. megano/slow_queries.py, команда slow_queries)
+SLOW_QUERY_THRESHOLD_MS = int(getenv('SLOW_QUERY_THRESHOLD_MS') or 200)
+SLOW_QUERY_EXPLAIN_INTERVAL = int(getenv('SLOW_QUERY_EXPLAIN_INTERVAL') or 3600)  # EXPLAIN отпечатка, сек; 0 - без
+# Файл пишут все воркеры (дописывание в конец); ротация - внешним logrotate, файл переоткрывается после переименования
+SLOW_QUERY_LOG_PATH = Path(getenv('SLOW_QUERY_LOG_PATH') or LOGS_DIR / 'slow_queries.log')
+
 LOGLEVEL = getenv('DJANGO_LOGLEVEL', 'info').upper()
 
 logging.config.dictConfig({
@@ -182,12 +241,26 @@ logging.config.dictConfig({
         "console": {
             "format": "%(asctime)s [%(levelname)s] [%(name)s:%(lineno)s] %(module)s %(message)s",
         },
+        "structured": {                 # строка JSON без префикса - для сборщиков логов
+            "format": "%(message)s",
+        },
     },
     "handlers": {                       # Обработчики (handlers): куда отправляются логи
         "console": {                    # <— выводит логи в консоль
             "class": "logging.StreamHandler",
             "formatter": "console",
         },
+        "structured": {
+            "class": "logging.StreamHandler",
+            "formatter": "structured",
+        },
+        "slow_queries": {               # журнал для команды slow_queries, общий для всех воркеров
+            "class": "logging.handlers.WatchedFileHandler",
+            "filename": SLOW_QUERY_LOG_PATH,
+            "encoding": "utf-8",
+            "delay": True,
+            "formatter": "structured",
+        },
     },
     "loggers": {
         "": {
@@ -196,5 +269,19 @@ logging.config.dictConfig({
                 "console",
             ],
         },
+        "megano.instrumentation": {
+            "level": INSTRUMENTATION_LOGLEVEL,
+            "handlers": [
+                "structured",
+            ],
+            "propagate": False,
+        },
+        "megano.slow_queries": {
+            "level": "WARNING",
+            "handlers": [
+                "slow_queries",
+            ],
+            "propagate": False,
+        },
     },
 })
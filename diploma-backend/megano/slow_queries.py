@@ -0,0 +1,175 @@
+"""
+Журнал медленных SQL-запросов.
+
+QueryTimer (megano/instrumentation.py) передаёт сюда запросы дольше SLOW_QUERY_THRESHOLD_MS.
+Запрос записывается строкой JSON в лог megano.slow_queries (файл SLOW_QUERY_LOG_PATH) вместе с:
+- отпечатком: SQL без значений параметров, по которому группируются запросы одного вида;
+- местом вызова: view, сериализатор и ближайшая строка кода проекта;
+- планом EXPLAIN - не чаще раза в SLOW_QUERY_EXPLAIN_INTERVAL секунд на отпечаток в процессе.
+Значения параметров в журнал не пишутся.
+Файл журнала общий для воркеров gunicorn: каждая запись дописывается в конец одной операцией записи,
+а ротацию выполняет внешний logrotate (WatchedFileHandler переоткрывает файл после переименования).
+Команда slow_queries собирает журнал (вместе с файлами ротации) и выводит отпечатки с наибольшим суммарным временем.
+"""
+import gzip
+import hashlib
+import json
+import logging
+import re
+import sys
+import threading
+from pathlib import Path
+from time import monotonic
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+from django.conf import settings
+from django.db import DatabaseError, transaction
+from rest_framework.serializers import BaseSerializer, ListSerializer
+
+logger = logging.getLogger(__name__)
+
+FINGERPRINT_PATTERNS = (
+    (re.compile(r"'(?:[^']|'')*'"), '?'),                      # строки
+    (re.compile(r'\b\d+(?:\.\d+)?\b'), '?'),                   # числа
+    (re.compile(r'%s'), '?'),                                  # параметры
+    (re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)'), '(?+)'),       # списки IN любой длины
+    (re.compile(r'\s+'), ' '),
+)
+
+# Время последнего EXPLAIN по отпечатку в этом процессе, от старых к новым
+explained_at: Dict[str, float] = {}
+EXPLAINED_MAX_FINGERPRINTS = 1000
+explained_lock = threading.Lock()
+
+
+def normalize_sql(sql: str) -> str:
+    """SQL без значений: запросы, отличающиеся только параметрами, совпадают"""
+    for pattern, replacement in FINGERPRINT_PATTERNS:
+        sql = pattern.sub(replacement, sql)
+    return sql.strip()
+
+
+def get_fingerprint(normalized_sql: str) -> str:
+    return hashlib.md5(normalized_sql.encode()).hexdigest()[:12]
+
+
+def get_call_site() -> dict:
+    """Сериализатор и ближайшая к запросу строка кода проекта по стеку вызовов"""
+    project_dir, serializer, location = str(settings.BASE_DIR), None, None
+    frame = sys._getframe(1)
+    while frame is not None and (serializer is None or location is None):
+        filename, instance = frame.f_code.co_filename, frame.f_locals.get('self')
+        # Middleware (у экземпляра есть get_response) - не место вызова: view записывается отдельно
+        if location is None and filename.startswith(project_dir) and 'site-packages' not in filename \
+                and not filename.startswith(str(Path(__file__).parent)) and not hasattr(instance, 'get_response'):
+            location = f'{Path(filename).relative_to(project_dir)}:{frame.f_lineno} {frame.f_code.co_name}'
+        if serializer is None and isinstance(instance, BaseSerializer):
+            serializer = (f'{type(instance.child).__name__}(many=True)' if isinstance(instance, ListSerializer)
+                          else type(instance).__name__)
+        frame = frame.f_back
+    return {'serializer': serializer, 'location': location}
+
+
+def explain(connection, sql: str, params) -> Optional[str]:
+    """План запроса; выполняется в точке сохранения, чтобы ошибка не прервала транзакцию запроса"""
+    try:
+        with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+            cursor.execute(f'{connection.ops.explain_query_prefix()} {sql}', params)
+            return '\n'.join(str(row[-1]) for row in cursor.fetchall())
+    except DatabaseError as exp:
+        logger.debug('EXPLAIN failed: %s', exp)
+        return None
+
+
+def should_explain(fingerprint: str, sql: str, many: bool) -> bool:
+    interval = settings.SLOW_QUERY_EXPLAIN_INTERVAL
+    if not interval or many or not sql.lstrip().upper().startswith(('SELECT', 'WITH')):
+        return False
+    now = monotonic()
+    with explained_lock:
+        if now - explained_at.get(fingerprint, -interval) < interval:
+            return False
+        explained_at.pop(fingerprint, None)
+        explained_at[fingerprint] = now
+        # Вытесняем устаревшие отпечатки и самые старые сверх EXPLAINED_MAX_FINGERPRINTS
+        while len(explained_at) > EXPLAINED_MAX_FINGERPRINTS or now - next(iter(explained_at.values())) >= interval:
+            del explained_at[next(iter(explained_at))]
+    return True
+
+
+def capture_slow_query(connection, sql: str, params, many: bool, duration: float,
+                       route: str = None, view: str = None):
+    """Записать медленный запрос в журнал; запросы EXPLAIN QueryTimer не учитывает (см. QueryTimer.paused)"""
+    normalized = normalize_sql(sql)
+    fingerprint = get_fingerprint(normalized)
+    record = {
+        'fingerprint': fingerprint,
+        'duration_ms': round(duration * 1000, 1),
+        'database': connection.alias,
+        'route': route,
+        'view': view,
+        **get_call_site(),
+        'sql': normalized,
+    }
+    if should_explain(fingerprint, sql, many):
+        record['plan'] = explain(connection, sql, params)
+    logger.warning(json.dumps(record, ensure_ascii=False))
+
+
+class FingerprintStats(NamedTuple):
+    """Сводка журнала по отпечатку"""
+    fingerprint: str
+    count: int
+    total_ms: float
+    max_ms: float
+    sql: str
+    call_sites: List[str]
+    plan: Optional[str]
+
+    @property
+    def mean_ms(self) -> float:
+        return self.total_ms / self.count
+
+
+def get_backup_number(path: Path, file: Path) -> Optional[int]:
+    """Номер файла ротации logrotate: path.1, path.2.gz, ...; None - не файл ротации журнала"""
+    number = file.name[len(path.name) + 1:]
+    number = number[:-len('.gz')] if number.endswith('.gz') else number
+    return int(number) if number.isdigit() else None
+
+
+def read_log(path: Path) -> Iterable[dict]:
+    """Записи журнала вместе с файлами ротации (path.1, path.2.gz, ...), от старых к новым"""
+    backups = sorted((file for file in path.parent.glob(f'{path.name}.*') if get_backup_number(path, file) is not None),
+                     key=lambda file: get_backup_number(path, file), reverse=True)
+    for file in [*backups, path]:
+        if not file.is_file():
+            continue
+        with (gzip.open if file.suffix == '.gz' else open)(file, 'rt', encoding='utf-8') as lines:
+            for line in lines:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
+
+
+def aggregate(records: Iterable[dict]) -> List[FingerprintStats]:
+    """Отпечатки по убыванию суммарного времени; план и SQL - из последней записи"""
+    groups: Dict[str, dict] = {}
+    for record in records:
+        group = groups.setdefault(record['fingerprint'], {
+            'count': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'sql': '', 'call_sites': {}, 'plan': None,
+        })
+        group['count'] += 1
+        group['total_ms'] += record['duration_ms']
+        group['max_ms'] = max(group['max_ms'], record['duration_ms'])
+        group['sql'] = record['sql']
+        group['plan'] = record.get('plan') or group['plan']
+        call_site = ' / '.join(filter(None, (record.get('view'), record.get('serializer'), record.get('location'))))
+        group['call_sites'][call_site or 'unknown'] = group['call_sites'].get(call_site or 'unknown', 0) + 1
+    stats = [
+        FingerprintStats(fingerprint, group['count'], group['total_ms'], group['max_ms'], group['sql'],
+                         sorted(group['call_sites'], key=group['call_sites'].get, reverse=True), group['plan'])
+        for fingerprint, group in groups.items()
+    ]
+    return sorted(stats, key=lambda item: item.total_ms, reverse=True)
@@ -0,0 +1,103 @@
+"""
+Бюджеты производительности эндпоинтов для тестов.
+
+Тесты с EndpointBudgetMixin работают на синтетическом наборе данных (orders/seed.py) объёма budget_volumes.
+EndpointBudgetMixin выполняет запрос к эндпоинту несколько раз, каждый раз в откатываемой транзакции,
+и проверяет, что число SQL-запросов не превышает бюджет, а 95-й перцентиль времени ответа укладывается
+в бюджет в миллисекундах (умноженный на TEST_LATENCY_BUDGET_FACTOR - для медленных машин CI).
+При превышении бюджета тест падает со списком выполненных запросов.
+
+TestRunner (TEST_RUNNER) на время тестов поднимает уровень лога megano.instrumentation до WARNING,
+если INSTRUMENTATION_LOGLEVEL не задан явно. При запуске через pytest-django задайте INSTRUMENTATION_LOGLEVEL=warning.
+"""
+import logging
+import math
+from os import getenv
+from time import perf_counter
+from typing import Callable, List, NamedTuple
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.test.runner import DiscoverRunner
+from django.test.utils import CaptureQueriesContext
+
+from orders.seed import SeedVolumes, seed_dataset
+
+BUDGET_VOLUMES = SeedVolumes(products=3000, users=50, reviews=6000, orders=1000)
+
+
+class TestRunner(DiscoverRunner):
+    """Запуск тестов без строки лога megano.instrumentation на каждый запрос"""
+    instrumentation_logger = logging.getLogger('megano.instrumentation')
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.instrumentation_level = self.instrumentation_logger.level
+        if not getenv('INSTRUMENTATION_LOGLEVEL'):
+            self.instrumentation_logger.setLevel(logging.WARNING)
+
+    def teardown_test_environment(self, **kwargs):
+        self.instrumentation_logger.setLevel(self.instrumentation_level)
+        super().teardown_test_environment(**kwargs)
+
+
+class EndpointMeasurement(NamedTuple):
+    """Результат замеров: запросы самого «дорогого» выполнения и время каждого выполнения, мс"""
+    queries: List[dict]
+    timings: List[float]
+    status_code: int
+
+    @property
+    def p95(self) -> float:
+        timings = sorted(self.timings)
+        return timings[max(math.ceil(len(timings) * 0.95) - 1, 0)]
+
+
+class EndpointBudgetMixin:
+    """Проверка бюджета SQL-запросов и задержки эндпоинтов (для TestCase)"""
+    budget_volumes = BUDGET_VOLUMES
+    budget_repeat = 20
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        seed_dataset(cls.budget_volumes)
+
+    def measure_endpoint(self, method: str, url: str, data=None, repeat: int = None,
+                         prepare: Callable[[], None] = None, **extra) -> EndpointMeasurement:
+        """Выполняем запрос repeat раз; prepare вызывается перед каждым выполнением, его запросы не учитываются"""
+        queries, timings, status_code = [], [], None
+        for _ in range(repeat or self.budget_repeat):
+            # Изменения каждого выполнения откатываются, чтобы все выполнения видели одни и те же данные
+            with transaction.atomic():
+                if prepare is not None:
+                    prepare()
+                with CaptureQueriesContext(connection) as context:
+                    started = perf_counter()
+                    response = getattr(self.client, method.lower())(url, data, **extra)
+                    timings.append((perf_counter() - started) * 1000)
+                transaction.set_rollback(True)
+            if len(context.captured_queries) > len(queries) or status_code is None:
+                queries = context.captured_queries
+            status_code = response.status_code
+        return EndpointMeasurement(queries, timings, status_code)
+
+    def assertWithinBudget(self, method: str, url: str, max_queries: int, p95_ms: float, data=None,
+                           status_code: int = 200, repeat: int = None, prepare: Callable[[], None] = None,
+                           **extra) -> EndpointMeasurement:
+        measurement = self.measure_endpoint(method, url, data, repeat, prepare, **extra)
+        name = f'{method.upper()} {url}'
+        self.assertEqual(measurement.status_code, status_code, name)
+
+        if len(measurement.queries) > max_queries:
+            self.fail('{}: {} SQL queries, budget {}:\n{}'.format(
+                name, len(measurement.queries), max_queries,
+                '\n'.join(f'{index}. {query["sql"]}' for index, query in enumerate(measurement.queries, 1)),
+            ))
+
+        latency_budget = p95_ms * settings.TEST_LATENCY_BUDGET_FACTOR
+        if measurement.p95 > latency_budget:
+            self.fail('{}: p95 {:.1f} ms, budget {:.1f} ms (timings: {})'.format(
+                name, measurement.p95, latency_budget, ', '.join(f'{timing:.1f}' for timing in measurement.timings),
+            ))
+        return measurement
@@ -21,6 +21,8 @@ from django.conf.urls.static import static
 
 from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView
 
+from .instrumentation import metrics_view
+
 urlpatterns = [
     # Админка
     path('admin/', admin.site.urls),
@@ -34,6 +36,9 @@ urlpatterns = [
     path('api/schema/', SpectacularAPIView.as_view(), name='schema'),
     path('api/schema/swagger/', SpectacularSwaggerView.as_view(url_name='schema'), name='swagger'),
 
+    # Метрики запросов в формате Prometheus (только INTERNAL_IPS или METRICS_TOKEN)
+    path('internal/metrics', metrics_view, name='metrics'),
+
     # Статические HTML-страницы (frontend)
     path('', include('frontend.urls')),
 ]
@@ -0,0 +1,373 @@
+"""
+Хранилища корзины.
+
+Корзина - словарь {id товара: количество}, каждое изменение записывает только изменённую строку.
+Корзина авторизованного пользователя хранится в БД (BasketItem), анонимного посетителя - в бэкенде,
+заданном BASKET_ANONYMOUS_STORE:
+- 'cookie' - в подписанной cookie (не требует общего хранилища на сервере);
+- 'cache' - в кэше Django, по строке на ключ; в cookie хранится только id корзины.
+При входе пользователя анонимная корзина переносится в БД (см. signals.py).
+Изменения анонимной корзины записываются в cookie ответа в BasketMiddleware.
+"""
+import uuid
+from abc import ABC, abstractmethod
+from typing import Dict, Iterable, NamedTuple, Optional, Tuple
+
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import F
+
+from .models import BasketItem
+
+BASKET_COOKIE_NAME = 'basket'
+BASKET_COOKIE_SALT = 'orders.basket'
+BASKET_CACHE_KEY_PREFIX = 'orders:basket:'
+
+
+class LineChange(NamedTuple):
+    """
+    Итог операций пакета над одним товаром корзины: новое количество max(q + delta, minimum),
+    где q - текущее количество, или absolute после операции set
+    """
+    delta: int = 0
+    minimum: int = 0
+    absolute: Optional[int] = None
+
+    def then(self, op: str, count: int) -> 'LineChange':
+        """Добавляем следующую операцию: add - прибавить, remove - убрать (не ниже 0), set - установить"""
+        if op == 'set':
+            return LineChange(absolute=count)
+        if self.absolute is not None:
+            return LineChange(absolute=self.absolute + count if op == 'add' else max(self.absolute - count, 0))
+        if op == 'add':
+            return LineChange(self.delta + count, self.minimum + count)
+        return LineChange(self.delta - count, max(self.minimum - count, 0))
+
+    def apply(self, quantity: int) -> int:
+        return self.absolute if self.absolute is not None else max(quantity + self.delta, self.minimum)
+
+    def terms(self) -> Tuple[int, int, int]:
+        """Новое количество в виде max(quantity * keep + delta, minimum) для SQL"""
+        if self.absolute is not None:
+            return 0, self.absolute, self.absolute
+        return 1, self.delta, self.minimum
+
+
+def fold_operations(operations: Iterable[dict]) -> Dict[int, LineChange]:
+    """Сводим операции пакета ({'op', 'id', 'count'}) к одному изменению на товар, с сохранением порядка"""
+    changes = {}
+    for operation in operations:
+        changes[operation['id']] = changes.get(operation['id'], LineChange()).then(operation['op'], operation['count'])
+    return changes
+
+
+class BasketStore(ABC):
+    """Базовое хранилище корзины"""
+
+    @abstractmethod
+    def lines(self) -> Dict[int, int]:
+        """Строки корзины в порядке добавления"""
+
+    @abstractmethod
+    def add(self, product_id: int, quantity: int):
+        """Добавляем товар или увеличиваем его количество"""
+
+    @abstractmethod
+    def remove(self, product_id: int, quantity: int):
+        """Уменьшаем количество товара, удаляем строку, если товара не осталось"""
+
+    @abstractmethod
+    def update(self, changes: Dict[int, int]):
+        """Устанавливаем количество нескольких товаров сразу; количество 0 удаляет строку"""
+
+    @abstractmethod
+    def clear(self):
+        """Удаляем все строки корзины"""
+
+    def apply(self, operations: Iterable[dict], before: Dict[int, int]) -> Dict[int, int]:
+        """
+        Применяем операции пакета к корзине со строками before (прочитанными перед этим);
+        возвращаем новое количество изменившихся товаров, 0 - строка удалена
+        """
+        changes = {}
+        for product_id, change in fold_operations(operations).items():
+            quantity = change.apply(before.get(product_id, 0))
+            if quantity != before.get(product_id, 0):
+                changes[product_id] = quantity
+        if changes:
+            self.update(changes)
+        return changes
+
+    def save(self, response):
+        """Записываем изменения в ответ (для хранилищ на cookie)"""
+
+
+class DatabaseBasketStore(BasketStore):
+    """
+    Корзина пользователя в БД.
+    Строка корзины уникальна по (user, product), поэтому добавление товара - один атомарный
+    INSERT ... ON CONFLICT DO UPDATE без чтения строки и без гонки при параллельных запросах
+    """
+
+    def __init__(self, user):
+        self.user = user
+        self.items = BasketItem.objects.filter(user=user)
+
+    def lines(self) -> Dict[int, int]:
+        return dict(self.items.order_by('pk').values_list('product_id', 'quantity'))
+
+    def upsert(self, lines: Dict[int, int]):
+        """Добавляем товары одним запросом: количество уже лежащих в корзине товаров увеличивается"""
+        if not lines:
+            return
+        qn = connection.ops.quote_name
+        table = qn(BasketItem._meta.db_table)
+        values = ', '.join(['(%s, %s, %s)'] * len(lines))
+        params = [value for product_id, quantity in lines.items() for value in (self.user.pk, product_id, quantity)]
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {table} ({qn("user_id")}, {qn("product_id")}, {qn("quantity")}) VALUES {values} '
+                f'ON CONFLICT ({qn("user_id")}, {qn("product_id")}) '
+                f'DO UPDATE SET {qn("quantity")} = {table}.{qn("quantity")} + excluded.{qn("quantity")}',
+                params,
+            )
+
+    def upsert_changes(self, changes: Dict[int, LineChange]) -> Dict[int, int]:
+        """
+        Изменения пакета одним запросом: новое количество (см. LineChange.terms) считает БД,
+        поэтому параллельные пакеты не теряют изменения друг друга.
+        Возвращает новое количество товаров (0 - строку нужно удалить)
+        """
+        if not changes:
+            return {}
+        qn = connection.ops.quote_name
+        table = qn(BasketItem._meta.db_table)
+        greatest = 'MAX' if connection.vendor == 'sqlite' else 'GREATEST'
+        values = ', '.join(['(%s, %s, %s)'] * len(changes))
+        params = [value for product_id, change in changes.items()
+                  for value in (self.user.pk, product_id, change.apply(0))]
+        case = f'CASE {table}.{qn("product_id")} ' + ' '.join(['WHEN %s THEN %s'] * len(changes)) + ' END'
+        for index in range(3):
+            params += [value for product_id, change in changes.items()
+                       for value in (product_id, change.terms()[index])]
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {table} ({qn("user_id")}, {qn("product_id")}, {qn("quantity")}) VALUES {values} '
+                f'ON CONFLICT ({qn("user_id")}, {qn("product_id")}) '
+                f'DO UPDATE SET {qn("quantity")} = {greatest}({table}.{qn("quantity")} * {case} + {case}, {case}) '
+                f'RETURNING {qn("product_id")}, {qn("quantity")}',
+                params,
+            )
+            return dict(cursor.fetchall())
+
+    def add(self, product_id: int, quantity: int):
+        self.upsert({product_id: quantity})
+
+    def remove(self, product_id: int, quantity: int):
+        line = self.items.filter(product_id=product_id)
+        if not line.filter(quantity__gt=quantity).update(quantity=F('quantity') - quantity):
+            line.delete()
+
+    def update(self, changes: Dict[int, int]):
+        removed = [product_id for product_id, quantity in changes.items() if quantity <= 0]
+        if removed:
+            self.items.filter(product_id__in=removed).delete()
+        BasketItem.objects.bulk_create(
+            [BasketItem(user=self.user, product_id=product_id, quantity=quantity)
+             for product_id, quantity in changes.items() if quantity > 0],
+            update_conflicts=True,
+            unique_fields=['user', 'product'],
+            update_fields=['quantity'],
+        )
+
+    def clear(self):
+        self.items.delete()
+
+    def apply(self, operations: Iterable[dict], before: Dict[int, int]) -> Dict[int, int]:
+        """Все операции - одним upsert с изменениями относительно текущего количества в БД (без чтения-записи)"""
+        changes = fold_operations(operations)
+        after = self.upsert_changes(changes)
+        # Строки, количество которых стало 0, удаляются условием по количеству - без гонки с параллельным add
+        if any(quantity <= 0 for quantity in after.values()):
+            self.items.filter(product_id__in=changes, quantity__lte=0).delete()
+        return {product_id: after[product_id] for product_id in changes
+                if after[product_id] != before.get(product_id, 0)}
+
+    def merge(self, lines: Dict[int, int]):
+        """Переносим строки другой корзины: количество одинаковых товаров складывается"""
+        self.upsert(lines)
+
+
+class SignedCookieBasketStore(BasketStore):
+    """Анонимная корзина в подписанной cookie"""
+
+    def __init__(self, request):
+        try:
+            data = signing.loads(request.COOKIES[BASKET_COOKIE_NAME], salt=BASKET_COOKIE_SALT)
+            self.data = {int(product_id): int(quantity) for product_id, quantity in data.items()}
+        except (KeyError, signing.BadSignature, ValueError, AttributeError):
+            self.data = {}
+        self.changed = False
+
+    def lines(self) -> Dict[int, int]:
+        return dict(self.data)
+
+    def add(self, product_id: int, quantity: int):
+        self.data[product_id] = self.data.get(product_id, 0) + quantity
+        self.changed = True
+
+    def remove(self, product_id: int, quantity: int):
+        if self.data.get(product_id, 0) > quantity:
+            self.data[product_id] -= quantity
+        else:
+            self.data.pop(product_id, None)
+        self.changed = True
+
+    def update(self, changes: Dict[int, int]):
+        for product_id, quantity in changes.items():
+            if quantity > 0:
+                self.data[product_id] = quantity
+            else:
+                self.data.pop(product_id, None)
+        self.changed = True
+
+    def clear(self):
+        self.data = {}
+        self.changed = True
+
+    def save(self, response):
+        if not self.changed:
+            return
+        if self.data:
+            response.set_cookie(
+                BASKET_COOKIE_NAME, signing.dumps(self.data, salt=BASKET_COOKIE_SALT, compress=True),
+                max_age=settings.BASKET_ANONYMOUS_TIMEOUT, httponly=True, samesite='Lax',
+            )
+        else:
+            response.delete_cookie(BASKET_COOKIE_NAME, samesite='Lax')
+
+
+class CacheBasketStore(BasketStore):
+    """
+    Анонимная корзина в кэше Django: список товаров и количество каждого товара хранятся под отдельными ключами,
+    поэтому изменение количества записывает один ключ
+    """
+
+    def __init__(self, request):
+        self.basket_id = request.COOKIES.get(BASKET_COOKIE_NAME)
+        self.is_new = False
+        try:
+            uuid.UUID(self.basket_id or '')
+        except ValueError:
+            self.basket_id = None
+
+    @property
+    def index_key(self) -> str:
+        return f'{BASKET_CACHE_KEY_PREFIX}{self.basket_id}'
+
+    def line_key(self, product_id: int) -> str:
+        return f'{BASKET_CACHE_KEY_PREFIX}{self.basket_id}:{product_id}'
+
+    def get_index(self) -> list:
+        return cache.get(self.index_key, []) if self.basket_id else []
+
+    def set_index(self, product_ids: list):
+        if self.basket_id is None:
+            self.basket_id = uuid.uuid4().hex
+            self.is_new = True
+        cache.set(self.index_key, product_ids, settings.BASKET_ANONYMOUS_TIMEOUT)
+
+    def lines(self) -> Dict[int, int]:
+        product_ids = self.get_index()
+        if not product_ids:
+            return {}
+        quantities = cache.get_many([self.line_key(product_id) for product_id in product_ids])
+        return {product_id: quantities[self.line_key(product_id)] for product_id in product_ids
+                if quantities.get(self.line_key(product_id))}
+
+    def add(self, product_id: int, quantity: int):
+        if self.basket_id is not None:
+            try:
+                cache.incr(self.line_key(product_id), quantity)
+                return
+            except ValueError:
+                pass
+        product_ids = self.get_index()
+        if product_id not in product_ids:
+            self.set_index(product_ids + [product_id])
+        cache.set(self.line_key(product_id), quantity, settings.BASKET_ANONYMOUS_TIMEOUT)
+
+    def remove(self, product_id: int, quantity: int):
+        if self.basket_id is None:
+            return
+        if cache.get(self.line_key(product_id), 0) > quantity:
+            cache.decr(self.line_key(product_id), quantity)
+            return
+        cache.delete(self.line_key(product_id))
+        product_ids = self.get_index()
+        if product_id in product_ids:
+            product_ids.remove(product_id)
+            self.set_index(product_ids)
+
+    def update(self, changes: Dict[int, int]):
+        product_ids = self.get_index()
+        removed = {product_id for product_id, quantity in changes.items() if quantity <= 0}
+        changed = {product_id: quantity for product_id, quantity in changes.items() if quantity > 0}
+        new_product_ids = [product_id for product_id in product_ids if product_id not in removed]
+        new_product_ids += [product_id for product_id in changed if product_id not in new_product_ids]
+        if new_product_ids != product_ids:
+            self.set_index(new_product_ids)
+        if self.basket_id is None:
+            return
+        cache.set_many({self.line_key(product_id): quantity for product_id, quantity in changed.items()},
+                       settings.BASKET_ANONYMOUS_TIMEOUT)
+        cache.delete_many([self.line_key(product_id) for product_id in removed])
+
+    def clear(self):
+        if self.basket_id is None:
+            return
+        cache.delete_many([self.index_key] + [self.line_key(product_id) for product_id in self.get_index()])
+
+    def save(self, response):
+        if self.is_new:
+            response.set_cookie(BASKET_COOKIE_NAME, self.basket_id, max_age=settings.BASKET_ANONYMOUS_TIMEOUT,
+                                httponly=True, samesite='Lax')
+
+
+ANONYMOUS_BASKET_STORES = {
+    'cookie': SignedCookieBasketStore,
+    'cache': CacheBasketStore,
+}
+
+
+def get_anonymous_basket_store(request) -> BasketStore:
+    """Хранилище анонимной корзины; одно на запрос, чтобы BasketMiddleware записал его изменения"""
+    request = getattr(request, '_request', request)    # HttpRequest из запроса DRF
+    store: Optional[BasketStore] = getattr(request, '_anonymous_basket', None)
+    if store is None:
+        store = ANONYMOUS_BASKET_STORES[settings.BASKET_ANONYMOUS_STORE](request)
+        request._anonymous_basket = store
+    return store
+
+
+def get_basket_store(request) -> BasketStore:
+    """Хранилище корзины текущего посетителя"""
+    if request.user.is_authenticated:
+        return DatabaseBasketStore(request.user)
+    return get_anonymous_basket_store(request)
+
+
+class BasketMiddleware:
+    """Записываем изменения анонимной корзины в cookie ответа"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        store = getattr(request, '_anonymous_basket', None)
+        if store is not None:
+            store.save(response)
+        return response
@@ -0,0 +1,124 @@
+"""
+Оформление заказа из корзины.
+
+Весь заказ создаётся в одной транзакции минимальным числом запросов:
+выборка корзины вместе с ценами и данными товаров, вставка заказа с уже посчитанной суммой, одна вставка строк заказа,
+резервирование остатков (см. inventory.py) и одно удаление корзины.
+Строки заказа сохраняют данные товара на момент покупки (название, цену, категорию, изображение и т.д.).
+"""
+from decimal import Decimal
+from typing import Dict, Iterable, List, Tuple
+
+from django.db import transaction
+from django.db.models import F, OuterRef, Subquery
+
+from products.models import Product, ProductImage
+
+from .inventory import reserve_stock
+from .models import BasketItem, Order, OrderProduct
+
+
+def get_user_basket_lines(user) -> List[Tuple[int, int, Decimal]]:
+    """Строки корзины из БД: id товара, количество, текущая цена - одним запросом"""
+    return list(BasketItem.objects.filter(user=user, product__is_deleted=False).values_list(
+        'product_id', 'quantity', 'product__effective_price'))
+
+
+def get_basket_lines(basket: Dict[int, int]) -> List[Tuple[int, int, Decimal]]:
+    """Строки анонимной корзины с текущими ценами товаров"""
+    prices = dict(Product.objects.visible().filter(pk__in=basket).values_list('pk', 'effective_price'))
+    return [(product_id, quantity, prices[product_id])
+            for product_id, quantity in basket.items() if product_id in prices]
+
+
+def get_snapshot_lines(queryset, prefix: str = '', *fields: str) -> List[dict]:
+    """
+    Данные товаров для строк заказа одним запросом;
+    prefix - путь к товару от модели queryset ('product__' для корзины в БД), fields - дополнительные поля
+    """
+    images = ProductImage.objects.filter(product=OuterRef(f'{prefix}pk')).order_by('pk')
+    return list(queryset.values(
+        *fields,
+        product_pk=F(f'{prefix}pk'),
+        unit_price=F(f'{prefix}effective_price'),
+        snapshot_title=F(f'{prefix}title'),
+        snapshot_description=F(f'{prefix}description'),
+        snapshot_category=F(f'{prefix}category_id'),
+        snapshot_date=F(f'{prefix}date'),
+        snapshot_free_delivery=F(f'{prefix}freeDelivery'),
+        snapshot_reviews=F(f'{prefix}reviews_count'),
+        snapshot_rating=F(f'{prefix}rating'),
+        snapshot_image=Subquery(images.values('src')[:1]),
+        snapshot_image_alt=Subquery(images.values('alt')[:1]),
+    ))
+
+
+def get_snapshot_tags(product_ids: Iterable[int]) -> Dict[int, List[dict]]:
+    """Теги товаров для строк заказа одним запросом: {id товара: [{"id": ..., "name": ...}]}"""
+    tags = {}
+    for product_id, tag_id, name in Product.tags.through.objects.filter(
+            product__in=list(product_ids)).order_by('tag_id').values_list('product_id', 'tag_id', 'tag__name'):
+        tags.setdefault(product_id, []).append({'id': tag_id, 'name': name})
+    return tags
+
+
+def get_user_contacts(user) -> Dict[str, str]:
+    """Контактные данные заказа из профиля пользователя"""
+    return {
+        'fullName': user.fullName or user.first_name + user.last_name or user.username.title(),
+        'email': user.email or '',
+        'phone': user.phone or '',
+    }
+
+
+@transaction.atomic
+def checkout(user=None, basket: Dict[int, int] = None) -> Order:
+    """
+    Создаём заказ из корзины пользователя (или из строк анонимной корзины basket)
+    и резервируем товары. Если товара не хватает, выбрасывается OutOfStock и ничего не сохраняется.
+    Товары, снятые с продажи (is_deleted), в заказ не попадают
+    """
+    if user is not None:
+        lines = get_snapshot_lines(BasketItem.objects.filter(user=user, product__is_deleted=False).order_by('pk'),
+                                   'product__', 'quantity')
+        contacts = get_user_contacts(user)
+    else:
+        basket = basket or {}
+        positions = {product_id: position for position, product_id in enumerate(basket)}
+        lines = sorted(get_snapshot_lines(Product.objects.visible().filter(pk__in=basket)),
+                       key=lambda line: positions[line['product_pk']])
+        for line in lines:
+            line['quantity'] = basket[line['product_pk']]
+        contacts = {}
+
+    quantities = {line['product_pk']: line['quantity'] for line in lines}
+    total = sum((line['unit_price'] * line['quantity'] for line in lines), Decimal('0'))
+
+    tags = get_snapshot_tags(quantities)
+    order = Order.objects.create(user=user, totalCost=total, **contacts)
+    OrderProduct.objects.bulk_create([
+        OrderProduct(
+            order=order,
+            product_id=line['product_pk'],
+            count=line['quantity'],
+            price=line['unit_price'] * line['quantity'],
+            unitPrice=line['unit_price'],
+            title=line['snapshot_title'],
+            description=line['snapshot_description'],
+            categoryId=line['snapshot_category'],
+            productDate=line['snapshot_date'],
+            image=line['snapshot_image'] or '',
+            imageAlt=line['snapshot_image_alt'] or '',
+            freeDelivery=line['snapshot_free_delivery'],
+            tags=tags.get(line['product_pk'], []),
+            reviewsCount=line['snapshot_reviews'],
+            rating=line['snapshot_rating'],
+        )
+        for line in lines
+    ])
+    reserve_stock(order, quantities)
+
+    if user is not None:
+        # Только заказанные строки: строка, добавленная в корзину после её чтения, остаётся
+        BasketItem.objects.filter(user=user, product_id__in=quantities).delete()
+    return order
@@ -0,0 +1,158 @@
+"""
+Резервирование остатков товаров под заказы.
+
+Остатки всех строк заказа уменьшаются одним условным UPDATE ... WHERE count >= n: строка товара блокируется
+только на время этого запроса, поэтому параллельные оформления заказов не ждут друг друга и не могут
+продать больше, чем есть на складе. Резерв держится STOCK_RESERVATION_TTL секунд до оплаты заказа,
+просроченные резервы возвращаются на склад командой release_expired_reservations.
+Остатки меняются через UPDATE без сигналов модели, поэтому кэш ответов и фасетов товаров сбрасывается явно
+после фиксации транзакции (invalidate_stock_caches).
+"""
+import logging
+from datetime import timedelta
+from typing import Dict, List, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Q, Value, When
+from django.utils import timezone
+
+from products.cache import bump_cache_version
+from products.facets import invalidate_facets
+from products.models import Product
+
+from .models import Order, StockReservation
+
+log = logging.getLogger(__name__)
+
+METRICS_KEY_PREFIX = 'orders:inventory:'
+METRIC_NAMES = ('reservations', 'reserved_units', 'conflicts', 'released', 'released_units')
+
+
+class OutOfStock(Exception):
+    """Товаров недостаточно на складе"""
+
+    def __init__(self, product_ids: List[int]):
+        self.product_ids = product_ids
+        super().__init__(f'Not enough stock for products {product_ids}')
+
+
+def count_metric(name: str, delta: int = 1):
+    """
+    Увеличиваем счётчик в кэше Django. Метрики всех процессов видны только с общим кэшем (DJANGO_REDIS_URL),
+    с локальным кэшем (по умолчанию) у каждого процесса свои счётчики
+    """
+    key = METRICS_KEY_PREFIX + name
+    cache.add(key, 0, timeout=None)
+    try:
+        cache.incr(key, delta)
+    except ValueError:
+        cache.set(key, delta, timeout=None)
+
+
+def get_inventory_metrics() -> Dict[str, int]:
+    """Счётчики резервирования: успешные резервы, отказы из-за нехватки товара, возвраты на склад"""
+    values = cache.get_many([METRICS_KEY_PREFIX + name for name in METRIC_NAMES])
+    return {name: values.get(METRICS_KEY_PREFIX + name, 0) for name in METRIC_NAMES}
+
+
+def invalidate_stock_caches():
+    """Остатки товаров изменились: закэшированные ответы и фасеты (наличие) устарели после фиксации транзакции"""
+    transaction.on_commit(bump_cache_version)
+    transaction.on_commit(invalidate_facets)
+
+
+def quantity_case(lines: Dict[int, int]) -> Case:
+    """Количество товара из строки заказа в виде выражения для UPDATE"""
+    return Case(
+        *[When(pk=product_id, then=Value(quantity)) for product_id, quantity in lines.items()],
+        output_field=IntegerField(),
+    )
+
+
+def reserve_stock(order: Order, lines: Dict[int, int]) -> List[StockReservation]:
+    """
+    Резервируем товары заказа: lines - количество по id товара.
+    Списываем остатки всех строк одним запросом; если хотя бы одного товара не хватает,
+    ничего не списываем и выбрасываем OutOfStock
+    """
+    lines = {product_id: quantity for product_id, quantity in lines.items() if quantity > 0}
+    if not lines:
+        return []
+
+    condition = Q()
+    for product_id, quantity in lines.items():
+        condition |= Q(pk=product_id, count__gte=quantity)
+
+    try:
+        with transaction.atomic():
+            updated = Product.objects.filter(condition).update(count=F('count') - quantity_case(lines))
+            if updated != len(lines):
+                raise OutOfStock(list(lines))
+            expires_at = timezone.now() + timedelta(seconds=settings.STOCK_RESERVATION_TTL)
+            reservations = StockReservation.objects.bulk_create([
+                StockReservation(order=order, product_id=product_id, quantity=quantity, expires_at=expires_at)
+                for product_id, quantity in lines.items()
+            ])
+            invalidate_stock_caches()
+    except OutOfStock:
+        stock = dict(Product.objects.filter(pk__in=lines).values_list('pk', 'count'))
+        shortage = [product_id for product_id, quantity in lines.items() if stock.get(product_id, 0) < quantity]
+        count_metric('conflicts')
+        log.warning('Stock reservation for order %s failed, not enough products %s', order.pk, shortage)
+        raise OutOfStock(shortage or list(lines))
+
+    count_metric('reservations')
+    count_metric('reserved_units', sum(lines.values()))
+    return reservations
+
+
+def lock_reservations(order_id: int) -> List[StockReservation]:
+    """
+    Блокируем резервы заказа перед оплатой. Порядок блокировок - резервы, затем заказ - тот же,
+    что в release_expired_reservations, поэтому оплата и возврат на склад не блокируют друг друга взаимно
+    """
+    return list(StockReservation.objects.select_for_update().filter(order_id=order_id))
+
+
+def commit_reservations(order: Order) -> int:
+    """Заказ оплачен: товары окончательно списаны, резерв больше не нужен"""
+    deleted, _ = StockReservation.objects.filter(order=order).delete()
+    return deleted
+
+
+def release_expired_reservations(batch_size: int = 1000) -> Tuple[int, int]:
+    """
+    Возвращаем на склад товары из просроченных резервов, заказы помечаем как 'expired'.
+    Возвращает количество освобождённых резервов и единиц товара
+    """
+    released = units = 0
+    now = timezone.now()
+    while True:
+        with transaction.atomic():
+            # skip_locked позволяет запускать несколько воркеров одновременно
+            expired = list(
+                StockReservation.objects.select_for_update(skip_locked=True).filter(expires_at__lte=now)
+                .order_by('pk').values_list('pk', 'order_id', 'product_id', 'quantity')[:batch_size]
+            )
+            if not expired:
+                break
+
+            lines = {}
+            for _, _, product_id, quantity in expired:
+                lines[product_id] = lines.get(product_id, 0) + quantity
+            Product.objects.filter(pk__in=lines).update(count=F('count') + quantity_case(lines))
+            StockReservation.objects.filter(pk__in=[pk for pk, _, _, _ in expired]).delete()
+            Order.objects.filter(pk__in={order_id for _, order_id, _, _ in expired}).exclude(
+                status='paid').update(status='expired')
+            invalidate_stock_caches()
+
+        released += len(expired)
+        units += sum(lines.values())
+
+    if released:
+        count_metric('released', released)
+        count_metric('released_units', units)
+        log.info('Released %s expired stock reservations (%s units)', released, units)
+    return released, units
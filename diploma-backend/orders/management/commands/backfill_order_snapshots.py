@@ -0,0 +1,67 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Case, DecimalField, F, OuterRef, Q, Subquery, Value, When
+from django.db.models.functions import Coalesce
+
+from orders.checkout import get_snapshot_tags
+from orders.models import OrderProduct
+from products.models import Product, ProductImage
+
+
+class Command(BaseCommand):
+    """Заполнить данные товара в строках заказов, созданных до их сохранения при покупке"""
+    help = 'Backfill product snapshots of order lines created before snapshots were stored'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000, help='Order lines per UPDATE statement')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        lines = OrderProduct.objects.filter(
+            Q(unitPrice__isnull=True) | Q(productDate__isnull=True) | Q(tags__isnull=True)
+        ).order_by('pk').values_list('pk', flat=True)
+        product = Product.objects.filter(pk=OuterRef('product_id'))
+        images = ProductImage.objects.filter(product=OuterRef('product_id')).order_by('pk')
+
+        updated = 0
+        last_id = 0
+        while True:
+            batch = list(lines.filter(pk__gt=last_id)[:batch_size])
+            if not batch:
+                break
+            with transaction.atomic():
+                # Цена за единицу - из сохранённой цены строки, остальное - текущие данные товара
+                OrderProduct.objects.filter(pk__gte=batch[0], pk__lte=batch[-1], unitPrice__isnull=True).update(
+                    unitPrice=Case(
+                        When(count__gt=0, then=F('price') / F('count')),
+                        default=F('price'),
+                        output_field=DecimalField(max_digits=10, decimal_places=2),
+                    ),
+                    title=Subquery(product.values('title')[:1]),
+                    description=Subquery(product.values('description')[:1]),
+                    categoryId=Subquery(product.values('category_id')[:1]),
+                    productDate=Subquery(product.values('date')[:1]),
+                    freeDelivery=Subquery(product.values('freeDelivery')[:1]),
+                    image=Coalesce(Subquery(images.values('src')[:1]), Value('')),
+                    imageAlt=Coalesce(Subquery(images.values('alt')[:1]), Value('')),
+                )
+                # Строки, сохранённые до появления даты товара в снимке
+                OrderProduct.objects.filter(pk__gte=batch[0], pk__lte=batch[-1], productDate__isnull=True).update(
+                    productDate=Subquery(product.values('date')[:1]),
+                )
+                # Строки, сохранённые до появления тегов, отзывов и рейтинга в снимке
+                unfilled = list(OrderProduct.objects.filter(
+                    pk__gte=batch[0], pk__lte=batch[-1], tags__isnull=True).only('pk', 'product_id'))
+                if unfilled:
+                    tags = get_snapshot_tags({line.product_id for line in unfilled})
+                    for line in unfilled:
+                        line.tags = tags.get(line.product_id, [])
+                    OrderProduct.objects.bulk_update(unfilled, ['tags'], batch_size=1000)
+                    OrderProduct.objects.filter(pk__gte=batch[0], pk__lte=batch[-1], reviewsCount__isnull=True).update(
+                        reviewsCount=Subquery(product.values('reviews_count')[:1]),
+                        rating=Subquery(product.values('rating')[:1]),
+                    )
+            updated += len(batch)
+            last_id = batch[-1]
+
+        self.stdout.write(self.style.SUCCESS(f'Backfilled snapshots of {updated} order lines'))
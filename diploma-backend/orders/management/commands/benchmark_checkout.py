@@ -0,0 +1,45 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from orders.checkout import checkout
+from orders.models import BasketItem
+from products.models import Product
+
+
+class Command(BaseCommand):
+    """Измерить количество запросов и время оформления заказа; все изменения откатываются"""
+    help = 'Benchmark statement count and latency of the checkout'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lines', type=int, default=5, help='Products in the basket')
+        parser.add_argument('--repeat', type=int, default=50, help='Number of checkouts')
+
+    def handle(self, *args, **options):
+        product_ids = list(Product.objects.filter(count__gte=1).order_by('pk').values_list('pk', flat=True)[
+            :options['lines']])
+        if len(product_ids) < options['lines']:
+            raise CommandError(f'Need at least {options["lines"]} products in stock, database has {len(product_ids)}')
+
+        timings, statements = [], set()
+        for _ in range(options['repeat']):
+            with transaction.atomic():
+                user = get_user_model().objects.create_user(username='checkout-benchmark')
+                BasketItem.objects.bulk_create([BasketItem(user=user, product_id=pk, quantity=1) for pk in product_ids])
+
+                with CaptureQueriesContext(connection) as queries:
+                    started = time.perf_counter()
+                    checkout(user=user)
+                    timings.append((time.perf_counter() - started) * 1000)
+                statements.add(len(queries))
+                transaction.set_rollback(True)
+
+        timings.sort()
+        self.stdout.write(
+            f'{options["lines"]} lines  statements {", ".join(map(str, sorted(statements)))}  '
+            f'median {timings[len(timings) // 2]:.2f} ms  p95 {timings[int(len(timings) * 0.95) - 1]:.2f} ms'
+        )
+        self.stdout.write(self.style.SUCCESS('Checkout benchmark finished, changes rolled back'))
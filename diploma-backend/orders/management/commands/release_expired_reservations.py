@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from orders.inventory import get_inventory_metrics, release_expired_reservations
+
+
+class Command(BaseCommand):
+    """Вернуть на склад товары из просроченных резервов неоплаченных заказов"""
+    help = 'Release expired stock reservations of unpaid orders'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Reservations per transaction')
+        parser.add_argument('--every', type=int, default=0,
+                            help='Run as a worker: release every N seconds')
+
+    def handle(self, *args, **options):
+        while True:
+            released, units = release_expired_reservations(options['batch_size'])
+            metrics = ', '.join(f'{name}={value}' for name, value in get_inventory_metrics().items())
+            self.stdout.write(self.style.SUCCESS(
+                f'Released {released} reservations ({units} units); {metrics}'
+            ))
+            if not options['every']:
+                break
+            time.sleep(options['every'])
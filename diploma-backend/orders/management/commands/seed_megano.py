@@ -0,0 +1,49 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from orders.seed import SEED_PASSWORD, SEED_PRESETS, SeedVolumes, seed_dataset
+
+
+class Command(BaseCommand):
+    """
+    Заполнить БД синтетическими данными для нагрузочного тестирования и бенчмарков.
+    Объёмы задаются пресетом и переопределяются отдельными параметрами; при одном и том же --seed
+    данные одинаковы. Данные добавляются к существующим
+    """
+    help = 'Generate a synthetic dataset (categories, tags, products, users, reviews, orders) for load testing'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--preset', choices=SEED_PRESETS, default='small', help='Base volumes')
+        for field in SeedVolumes._fields:
+            parser.add_argument(f'--{field.replace("_", "-")}', type=int, dest=field,
+                                help=f'Number of {field.replace("_", " ")} (overrides the preset)')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed')
+        parser.add_argument('--chunk-size', type=int, default=5000, help='Objects per bulk insert transaction')
+
+    def handle(self, *args, **options):
+        volumes = SEED_PRESETS[options['preset']]._replace(**{
+            field: options[field] for field in SeedVolumes._fields if options[field] is not None
+        })
+        self.stdout.write(', '.join(f'{field}={value}' for field, value in volumes._asdict().items()))
+
+        # Данные можно сгенерировать заново, поэтому жертвуем надёжностью записи ради скорости
+        with connection.cursor() as cursor:
+            if connection.vendor == 'sqlite':
+                cursor.execute('PRAGMA synchronous = OFF')
+            elif connection.vendor == 'postgresql':
+                cursor.execute('SET synchronous_commit = off')
+
+        started = time.monotonic()
+
+        def progress(name: str, done: int):
+            self.stdout.write(f'{name}: {done}, {time.monotonic() - started:.1f}s')
+
+        created = seed_dataset(volumes, seed=options['seed'], chunk_size=options['chunk_size'], progress=progress)
+        self.stdout.write(self.style.SUCCESS(
+            'Created {} in {:.1f}s; users password: {}'.format(
+                ', '.join(f'{count} {name}' for name, count in created.items()),
+                time.monotonic() - started, SEED_PASSWORD,
+            )
+        ))
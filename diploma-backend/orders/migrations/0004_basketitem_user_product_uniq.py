@@ -0,0 +1,35 @@
+# Generated by Django 4.2.28 on 2026-10-17 18:46
+
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+def merge_duplicate_basket_items(apps, schema_editor):
+    BasketItem = apps.get_model('orders', 'BasketItem')
+
+    # Складываем количество повторяющихся строк корзины в первую строку, остальные удаляем
+    duplicates = BasketItem.objects.values('user', 'product').annotate(
+        lines=Count('id'), first_id=Min('id'), total=Sum('quantity'),
+    ).filter(lines__gt=1)
+    for duplicate in duplicates:
+        BasketItem.objects.filter(pk=duplicate['first_id']).update(quantity=duplicate['total'])
+        BasketItem.objects.filter(user=duplicate['user'], product=duplicate['product']).exclude(
+            pk=duplicate['first_id']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0003_stockreservation'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            merge_duplicate_basket_items,
+            reverse_code=migrations.RunPython.noop,
+        ),
+        migrations.AddConstraint(
+            model_name='basketitem',
+            constraint=models.UniqueConstraint(fields=('user', 'product'), name='orders_basketitem_user_product_uniq'),
+        ),
+    ]
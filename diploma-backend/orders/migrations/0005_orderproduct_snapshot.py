@@ -0,0 +1,48 @@
+# Generated by Django 4.2.28 on 2026-10-17 18:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0004_basketitem_user_product_uniq'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderproduct',
+            name='categoryId',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='orderproduct',
+            name='description',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name='orderproduct',
+            name='freeDelivery',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='orderproduct',
+            name='image',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='orderproduct',
+            name='imageAlt',
+            field=models.CharField(blank=True, max_length=200),
+        ),
+        migrations.AddField(
+            model_name='orderproduct',
+            name='title',
+            field=models.CharField(blank=True, max_length=150),
+        ),
+        migrations.AddField(
+            model_name='orderproduct',
+            name='unitPrice',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True),
+        ),
+    ]
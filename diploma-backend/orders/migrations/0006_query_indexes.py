@@ -0,0 +1,17 @@
+# Generated by Django 4.2.28 on 2026-10-17 18:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0005_orderproduct_snapshot'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['user', '-createdAt', '-id'], name='orders_live_user_created_idx'),
+        ),
+    ]
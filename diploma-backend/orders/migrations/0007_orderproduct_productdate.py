@@ -0,0 +1,18 @@
+# Generated by Django 4.2.28 on 2026-10-17 19:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0006_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderproduct',
+            name='productDate',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
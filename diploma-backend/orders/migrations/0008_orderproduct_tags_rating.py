@@ -0,0 +1,28 @@
+# Generated by Django 4.2.28 on 2026-10-17 19:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0007_orderproduct_productdate'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderproduct',
+            name='rating',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=3, null=True),
+        ),
+        migrations.AddField(
+            model_name='orderproduct',
+            name='reviewsCount',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='orderproduct',
+            name='tags',
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
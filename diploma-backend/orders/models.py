@@ -1,4 +1,5 @@
 from django.db import models
+from django.db.models import Q
 from django.conf import settings
 
 from products.models import Product
@@ -10,6 +11,12 @@ class BasketItem(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     quantity = models.PositiveIntegerField(default=1)
 
+    class Meta:
+        constraints = [
+            # Одна строка на товар в корзине пользователя; индекс (user, product) используется и для выборки корзины
+            models.UniqueConstraint(fields=['user', 'product'], name='orders_basketitem_user_product_uniq'),
+        ]
+
 
 class Order(models.Model):
     """Модель Order представляет собой заказ"""
@@ -26,6 +33,13 @@ class Order(models.Model):
     address = models.TextField()
     is_deleted = models.BooleanField(default=False, db_index=True)
 
+    class Meta:
+        # История заказов: неудалённые заказы пользователя от новых к старым
+        indexes = [
+            models.Index(fields=['user', '-createdAt', '-id'], condition=Q(is_deleted=False),
+                         name='orders_live_user_created_idx'),
+        ]
+
     def __str__(self):
         return f'Order {self.pk} by user {self.user}'
 
@@ -35,15 +49,50 @@ class OrderProduct(models.Model):
     Модель OrderProduct представляет собой продукт в заказе
     count - количество товара в корзине
     price - их общая цена на момент покупки
+    title, description, unitPrice, categoryId, productDate, image, imageAlt, freeDelivery, tags, reviewsCount,
+    rating - данные товара на момент покупки, по ним отображается заказ (unitPrice, productDate и tags пусты у строк,
+    которые ещё не заполнены командой backfill_order_snapshots)
     """
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='products')
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     count = models.PositiveIntegerField(default=1)
     price = models.DecimalField(max_digits=10, decimal_places=2)
+    title = models.CharField(max_length=150, blank=True)
+    description = models.TextField(blank=True)
+    unitPrice = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    categoryId = models.PositiveIntegerField(null=True, blank=True)
+    productDate = models.DateTimeField(null=True, blank=True)
+    # Путь к файлу изображения товара; не ImageField, чтобы django_cleanup не удалял файл вместе со строкой заказа
+    image = models.CharField(max_length=255, blank=True)
+    imageAlt = models.CharField(max_length=200, blank=True)
+    freeDelivery = models.BooleanField(default=False)
+    tags = models.JSONField(null=True, blank=True)                              # [{"id": 1, "name": "Sale"}]
+    reviewsCount = models.PositiveIntegerField(null=True, blank=True)
+    rating = models.DecimalField(max_digits=3, decimal_places=2, null=True, blank=True)
 
     def __str__(self):
         return f'Product in order №{self.order}'
 
+    @property
+    def is_snapshot_complete(self) -> bool:
+        """Все данные товара сохранены в строке (иначе недостающие берутся из товара)"""
+        return self.unitPrice is not None and self.productDate is not None and self.tags is not None
+
+
+class StockReservation(models.Model):
+    """
+    Модель StockReservation представляет собой товар, зарезервированный под неоплаченный заказ.
+    Остаток товара уменьшается при создании резерва; после оплаты резерв удаляется,
+    а просроченный резерв возвращается на склад командой release_expired_reservations
+    """
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='reservations')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='reservations')
+    quantity = models.PositiveIntegerField()
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f'Reservation of {self.quantity} x product {self.product_id} for order №{self.order_id}'
+
 
 class Payment(models.Model):
     """Модель Payment представляет собой оплату заказа"""
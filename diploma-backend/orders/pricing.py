@@ -0,0 +1,80 @@
+"""
+Правила расчёта стоимости заказа.
+
+Настройки доставки (DeliveryType) меняются редко, а нужны при каждом подтверждении заказа и расчёте корзины,
+поэтому каждый процесс хранит их у себя в памяти. Актуальность проверяется по номеру версии в кэше:
+при сохранении или удалении DeliveryType версия увеличивается (см. signals.py). С общим кэшем (Redis,
+DJANGO_REDIS_URL) все воркеры перечитывают правила при следующем обращении; с кэшем в памяти процесса
+(LocMemCache по умолчанию) версию видит только сохранивший процесс, поэтому правила, кроме того,
+перечитываются не реже раза в PRICING_RULES_MAX_AGE секунд.
+"""
+import time
+from decimal import Decimal
+from typing import Iterable, NamedTuple, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import Http404
+
+from .models import DeliveryType
+
+PRICING_VERSION_KEY = 'orders:pricing-version'
+
+_rules = None
+_rules_version = None
+_rules_loaded_at = 0.0
+
+
+class Quote(NamedTuple):
+    """Стоимость заказа: товары, доставка и итог"""
+    subtotal: Decimal
+    delivery: Decimal
+    total: Decimal
+
+
+def get_pricing_version() -> int:
+    """Текущая версия правил расчёта стоимости"""
+    version = cache.get(PRICING_VERSION_KEY)
+    if version is None:
+        cache.add(PRICING_VERSION_KEY, int(time.time() * 1000), None)
+        version = cache.get(PRICING_VERSION_KEY)
+    return version
+
+
+def invalidate_pricing_rules():
+    """Правила изменились: все процессы перечитают их при следующем обращении"""
+    try:
+        cache.incr(PRICING_VERSION_KEY)
+    except ValueError:
+        get_pricing_version()
+
+
+def get_delivery_rules() -> DeliveryType:
+    """Настройки доставки из памяти процесса, из БД - после изменения версии или по истечении PRICING_RULES_MAX_AGE"""
+    global _rules, _rules_version, _rules_loaded_at
+    version = get_pricing_version()
+    expired = time.monotonic() - _rules_loaded_at >= settings.PRICING_RULES_MAX_AGE
+    if _rules is None or _rules_version != version or expired:
+        rules = DeliveryType.objects.order_by('pk').first()
+        if rules is None:
+            raise Http404('Delivery type is not configured')
+        _rules, _rules_version, _rules_loaded_at = rules, version, time.monotonic()
+    return _rules
+
+
+def get_delivery_cost(subtotal: Decimal, delivery_type: str) -> Decimal:
+    """Стоимость доставки: обычная бесплатна от минимальной суммы заказа, экспресс - всегда платная"""
+    rules = get_delivery_rules()
+    if delivery_type == 'ordinary':
+        if subtotal < rules.min_cost_order_by_free_delivery:
+            return rules.cost_ordinary_delivery
+    elif delivery_type == 'express':
+        return rules.cost_express_delivery
+    return Decimal('0.00')
+
+
+def quote(order_lines: Iterable[Tuple[Decimal, int]], delivery_type: str) -> Quote:
+    """Стоимость заказа по строкам (цена за единицу, количество) и типу доставки"""
+    subtotal = sum((Decimal(price) * quantity for price, quantity in order_lines), Decimal('0.00'))
+    delivery = get_delivery_cost(subtotal, delivery_type)
+    return Quote(subtotal=subtotal, delivery=delivery, total=subtotal + delivery)
@@ -0,0 +1,274 @@
+"""
+Синтетический набор данных магазина для тестов производительности и нагрузочного тестирования.
+
+Данные генерируются детерминированно (random.Random(seed)) и сохраняются пачками по chunk_size:
+теги, дерево категорий, товары с тегами, изображениями и скидками, пользователи, отзывы, заказы со строками.
+Объёмы доходят до миллионов строк, поэтому товары, отзывы и заказы вставляются не через bulk_create, а одним
+executemany по готовым кортежам значений (построение объектов моделей и компиляция INSERT занимают
+большую часть времени bulk_create); id строк назначаются заранее, последовательности сбрасываются в конце.
+Изображения товаров и категорий ссылаются на файлы из фикстур, новых файлов не создаётся.
+Пароль всех созданных пользователей - SEED_PASSWORD (хэш вычисляется один раз).
+"""
+import json
+import random
+from datetime import timedelta
+from decimal import Decimal
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Sequence
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from products.cache import bump_cache_version
+from products.facets import invalidate_facets
+from products.models import Category, Product, ProductImage, Review, Sale, Tag
+from products.popular import refresh_popular_products
+from products.search import get_search_backend
+
+from .checkout import get_snapshot_tags
+from .models import Order, OrderProduct
+
+SEED_PASSWORD = 'megano-seed'
+SEED_USERNAME_PREFIX = 'seed-user-'
+SEED_PRODUCT_IMAGE = 'products/product_1/images/iphone-16-pro-max-black-titanium.png'
+SEED_CATEGORY_IMAGE = 'products/category_1/images/Accessories.png'
+
+PRODUCT_NAMES = ('Smartphone', 'Laptop', 'Headphones', 'Monitor', 'Keyboard', 'Camera', 'Speaker', 'Tablet',
+                 'Watch', 'Router', 'Printer', 'Console')
+PRODUCT_ADJECTIVES = ('Pro', 'Max', 'Lite', 'Ultra', 'Mini', 'Plus', 'Air', 'Neo')
+ORDER_STATUSES = ('created', 'accepted', 'paid', 'expired')
+
+
+class SeedVolumes(NamedTuple):
+    """Количество создаваемых объектов; categories - корневые категории, у каждой subcategories подкатегорий"""
+    tags: int = 20
+    categories: int = 5
+    subcategories: int = 4
+    products: int = 1000
+    users: int = 100
+    reviews: int = 3000
+    orders: int = 1000
+    lines_per_order: int = 3
+
+
+# Готовые объёмы: small - для тестов и разработки, medium и large - для бенчмарков и проверки планов запросов
+SEED_PRESETS = {
+    'small': SeedVolumes(),
+    'medium': SeedVolumes(tags=50, categories=10, subcategories=5, products=100_000, users=10_000,
+                          reviews=1_000_000, orders=100_000),
+    'large': SeedVolumes(tags=200, categories=20, subcategories=10, products=1_000_000, users=100_000,
+                         reviews=10_000_000, orders=1_000_000),
+}
+
+
+class SearchRow(NamedTuple):
+    """Поля товара, которые читает бэкенд поиска при индексации"""
+    pk: int
+    title: str
+    description: str
+    fullDescription: str
+
+
+def chunked(total: int, chunk_size: int):
+    """Границы пачек [start, stop) для total объектов"""
+    for start in range(0, total, chunk_size):
+        yield start, min(start + chunk_size, total)
+
+
+def next_id(model) -> int:
+    """Первый свободный id таблицы модели"""
+    return (model.objects.aggregate(last=Max('pk'))['last'] or 0) + 1
+
+
+def insert_rows(model, fields: Sequence[str], rows: Iterable[tuple]):
+    """
+    Вставляем строки одним executemany; значения должны быть уже приведены к типам БД
+    (дата и время - через connection.ops.adapt_*)
+    """
+    qn = connection.ops.quote_name
+    columns = ', '.join(qn(model._meta.get_field(field).column) for field in fields)
+    placeholders = ', '.join(['%s'] * len(fields))
+    with connection.cursor() as cursor:
+        cursor.executemany(f'INSERT INTO {qn(model._meta.db_table)} ({columns}) VALUES ({placeholders})', rows)
+
+
+def seed_tags(volumes: SeedVolumes) -> List[int]:
+    names = [f'Seed tag {index}' for index in range(volumes.tags)]
+    Tag.objects.bulk_create([Tag(name=name) for name in names], ignore_conflicts=True)
+    return list(Tag.objects.filter(name__in=names).values_list('pk', flat=True))
+
+
+def seed_categories(volumes: SeedVolumes) -> List[int]:
+    """Дерево категорий: товары раскладываются по подкатегориям (или по корневым, если подкатегорий нет)"""
+    leaves = []
+    for index in range(volumes.categories):
+        # save() заполняет материализованный путь, категорий немного - сохраняем по одной
+        root = Category(title=f'Seed category {index}', image=SEED_CATEGORY_IMAGE)
+        root.save()
+        children = []
+        for child_index in range(volumes.subcategories):
+            child = Category(title=f'Seed category {index}.{child_index}', image=SEED_CATEGORY_IMAGE, parent=root)
+            child.save()
+            children.append(child.pk)
+        leaves += children or [root.pk]
+    return leaves
+
+
+@transaction.atomic
+def seed_products_chunk(rng: random.Random, first_id: int, size: int, category_ids: List[int],
+                        tag_ids: List[int]) -> List[int]:
+    """Товары пачки с id от first_id, их теги, изображения и скидки"""
+    now = timezone.now()
+    today = timezone.localdate()
+    adapt_datetime = connection.ops.adapt_datetimefield_value
+    adapt_date = connection.ops.adapt_datefield_value
+
+    products, search_rows, tags, images, sales = [], [], [], [], []
+    for pk in range(first_id, first_id + size):
+        title = f'{rng.choice(PRODUCT_NAMES)} {rng.choice(PRODUCT_ADJECTIVES)} {rng.randrange(1, 1000)}'
+        description = f'{rng.choice(PRODUCT_ADJECTIVES)} {rng.choice(PRODUCT_NAMES).lower()} for everyday use'
+        full_description = ' '.join(rng.choices(PRODUCT_NAMES + PRODUCT_ADJECTIVES, k=30))
+        price = Decimal(rng.randrange(100, 200000)) / 2
+        effective_price = price
+        if rng.random() < 0.05:
+            # действующая скидка: текущая цена товара - цена со скидкой
+            effective_price = (price * Decimal('0.8')).quantize(Decimal('0.01'))
+            sales.append((pk, effective_price, adapt_date(today - timedelta(days=rng.randint(0, 10))),
+                          adapt_date(today + timedelta(days=rng.randint(0, 30)))))
+        products.append((
+            pk, rng.choice(category_ids), title, description, full_description, price, effective_price,
+            # каждый десятый товар - лимитированный (1-3 шт.), часть товаров - не в наличии
+            rng.randint(1, 3) if rng.random() < 0.1 else rng.randint(0, 100),
+            rng.random() < 0.3,
+            adapt_datetime(now - timedelta(minutes=rng.randrange(60 * 24 * 365))),
+            rng.random() < 0.02, 0, 0,
+        ))
+        search_rows.append(SearchRow(pk, title, description, full_description))
+        tags += [(pk, tag_id) for tag_id in rng.sample(tag_ids, k=min(len(tag_ids), rng.randint(0, 3)))]
+        images.append((pk, SEED_PRODUCT_IMAGE, title))
+
+    insert_rows(Product, ('id', 'category', 'title', 'description', 'fullDescription', 'price', 'effective_price',
+                          'count', 'freeDelivery', 'date', 'is_deleted', 'rating', 'reviews_count'), products)
+    insert_rows(Product.tags.through, ('product', 'tag'), tags)
+    insert_rows(ProductImage, ('product', 'src', 'alt'), images)
+    insert_rows(Sale, ('product', 'salePrice', 'dateFrom', 'dateTo'), sales)
+    # Вставка минует сигналы: поисковый индекс обновляем сами
+    get_search_backend().index(search_rows)
+    return [product[0] for product in products]
+
+
+def seed_users(volumes: SeedVolumes, chunk_size: int) -> List[int]:
+    password = make_password(SEED_PASSWORD)
+    User = get_user_model()
+    for start, stop in chunked(volumes.users, chunk_size):
+        User.objects.bulk_create([
+            User(username=f'{SEED_USERNAME_PREFIX}{index}', email=f'{SEED_USERNAME_PREFIX}{index}@example.com',
+                 fullName=f'Seed User {index}', phone=f'+7900{index:07d}', password=password)
+            for index in range(start, stop)
+        ], ignore_conflicts=True)
+    return list(User.objects.filter(username__startswith=SEED_USERNAME_PREFIX).values_list('pk', flat=True))
+
+
+@transaction.atomic
+def seed_reviews_chunk(rng: random.Random, size: int, product_ids: List[int]):
+    date = connection.ops.adapt_datetimefield_value(timezone.now())
+    insert_rows(Review, ('product', 'author', 'email', 'text', 'rate', 'date'), [
+        (rng.choice(product_ids), f'Buyer {rng.randrange(10000)}', 'buyer@example.com', 'Seed review',
+         rng.randint(1, 5), date)
+        for _ in range(size)
+    ])
+
+
+@transaction.atomic
+def seed_orders_chunk(rng: random.Random, first_id: int, size: int, volumes: SeedVolumes, user_ids: List[int],
+                      product_ids: List[int]):
+    """Заказы пачки с id от first_id со строками: данные товаров сохраняются в строках, как при оформлении заказа"""
+    baskets = [rng.sample(product_ids, k=min(len(product_ids), rng.randint(1, volumes.lines_per_order)))
+               for _ in range(size)]
+    products = {row[0]: row[1:] for row in Product.objects.filter(
+        pk__in={pk for basket in baskets for pk in basket}
+    ).values_list('pk', 'title', 'description', 'effective_price', 'category_id', 'freeDelivery', 'date',
+                  'reviews_count', 'rating')}
+    tags = get_snapshot_tags(products)
+    now = timezone.now()
+    adapt_datetime = connection.ops.adapt_datetimefield_value
+
+    orders, lines = [], []
+    for order_id, basket in zip(range(first_id, first_id + size), baskets):
+        total = Decimal(0)
+        for product_id in basket:
+            (title, description, unit_price, category_id, free_delivery, product_date, reviews_count,
+             rating) = products[product_id]
+            count = rng.randint(1, 3)
+            total += unit_price * count
+            lines.append((order_id, product_id, count, unit_price * count, title, description, unit_price,
+                          category_id, adapt_datetime(product_date), SEED_PRODUCT_IMAGE, title, free_delivery,
+                          json.dumps(tags.get(product_id, [])), reviews_count, rating))
+        orders.append((
+            order_id, rng.choice(user_ids) if user_ids else None,
+            adapt_datetime(now - timedelta(minutes=rng.randrange(60 * 24 * 365))),
+            'Seed User', 'buyer@example.com', '+79000000000',
+            rng.choice(('ordinary', 'express')), rng.choice(('online', 'someone')), total,
+            rng.choice(ORDER_STATUSES), 'Moscow', 'Red Square, 1', rng.random() < 0.03,
+        ))
+    insert_rows(Order, ('id', 'user', 'createdAt', 'fullName', 'email', 'phone', 'deliveryType', 'paymentType',
+                        'totalCost', 'status', 'city', 'address', 'is_deleted'), orders)
+    insert_rows(OrderProduct, ('order', 'product', 'count', 'price', 'title', 'description', 'unitPrice',
+                               'categoryId', 'productDate', 'image', 'imageAlt', 'freeDelivery', 'tags',
+                               'reviewsCount', 'rating'), lines)
+
+
+def reset_sequences(models: Sequence[type]):
+    """Сбрасываем последовательности id после вставки строк с явными id (нужно PostgreSQL)"""
+    with connection.cursor() as cursor:
+        for sql in connection.ops.sequence_reset_sql(no_style(), models):
+            cursor.execute(sql)
+
+
+def seed_dataset(volumes: SeedVolumes = SeedVolumes(), seed: int = 0, chunk_size: int = 1000,
+                 progress: Optional[Callable[[str, int], None]] = None) -> Dict[str, int]:
+    """
+    Создаём набор данных и возвращаем количество созданных объектов.
+    progress(name, done) вызывается после каждой пачки
+    """
+    rng = random.Random(seed)
+    report = progress or (lambda name, done: None)
+
+    tag_ids = seed_tags(volumes)
+    category_ids = seed_categories(volumes)
+
+    product_ids = []
+    first_id = next_id(Product)
+    for start, stop in chunked(volumes.products, chunk_size):
+        product_ids += seed_products_chunk(rng, first_id + start, stop - start, category_ids, tag_ids)
+        report('products', stop)
+
+    user_ids = seed_users(volumes, chunk_size)
+    report('users', len(user_ids))
+
+    if product_ids:
+        for start, stop in chunked(volumes.reviews, chunk_size):
+            seed_reviews_chunk(rng, stop - start, product_ids)
+            report('reviews', stop)
+        first_id = next_id(Order)
+        for start, stop in chunked(volumes.orders, chunk_size):
+            seed_orders_chunk(rng, first_id + start, stop - start, volumes, user_ids, product_ids)
+            report('orders', stop)
+
+    # Рейтинги товаров, рейтинг популярных товаров, последовательности id и кэши
+    Product.objects.filter(pk__in=Review.objects.values('product')).refresh_rating()
+    refresh_popular_products()
+    reset_sequences([Product, Order])
+    bump_cache_version()
+    invalidate_facets()
+    return {
+        'tags': len(tag_ids),
+        'categories': Category.objects.filter(title__startswith='Seed category').count(),
+        'products': len(product_ids),
+        'users': len(user_ids),
+        'reviews': volumes.reviews if product_ids else 0,
+        'orders': volumes.orders if product_ids else 0,
+    }
@@ -1,26 +1,29 @@
+from typing import Iterable
+
+from django.db.models import prefetch_related_objects
 from rest_framework import serializers
 
 from .models import BasketItem, Order, OrderProduct, Payment, DeliveryType
 
+from products.models import ProductImage
 from products.serializers import ImageSerializer, TagSerializer, ProductShortSerializer
 
 
 class OrderProductSerializer(serializers.ModelSerializer):
     """
-    Сериализатор общей информации о продукте в заказе
+    Сериализатор общей информации о продукте в заказе.
+    Данные берутся из строки заказа (сохранены при покупке), без обращения к товару.
+    Недостающие данные строк, ещё не заполненных командой backfill_order_snapshots, берутся из товара
+    (загружаются заранее, см. prefetch_incomplete_lines), цена за единицу - из сохранённой цены строки
     """
-    id = serializers.IntegerField(source='product.id')
-    category = serializers.IntegerField(source='product.category_id')
-    price = serializers.DecimalField(source='product.price', max_digits=10, decimal_places=2)
-    count = serializers.IntegerField()
-    date = serializers.DateTimeField(source='product.date')
-    title = serializers.CharField(source='product.title')
-    description = serializers.CharField(source='product.description')
-    freeDelivery = serializers.BooleanField(source='product.freeDelivery')
-    images = ImageSerializer(source='product.images', many=True)
-    tags = TagSerializer(source='product.tags', many=True)
-    reviews = serializers.IntegerField(source='product.reviews_count')
-    rating = serializers.DecimalField(source='product.rating', max_digits=3, decimal_places=2)
+    id = serializers.IntegerField(source='product_id')
+    category = serializers.IntegerField(source='categoryId')
+    price = serializers.DecimalField(source='unitPrice', max_digits=10, decimal_places=2)
+    date = serializers.DateTimeField(source='productDate')
+    images = serializers.SerializerMethodField()
+    tags = serializers.JSONField()
+    reviews = serializers.IntegerField(source='reviewsCount')
+    rating = serializers.DecimalField(max_digits=3, decimal_places=2)
 
     class Meta:
         model = OrderProduct
@@ -36,9 +39,38 @@ class OrderProductSerializer(serializers.ModelSerializer):
             'images',
             'tags',
             'reviews',
-            'rating'
+            'rating',
         )
 
+    def get_images(self, obj: OrderProduct) -> list:
+        if not obj.image:
+            return []
+        url = ProductImage._meta.get_field('src').storage.url(obj.image)
+        request = self.context.get('request')
+        if request is not None:
+            url = request.build_absolute_uri(url)
+        return [{'src': url, 'alt': obj.imageAlt}]
+
+    def to_representation(self, obj: OrderProduct) -> dict:
+        if not obj.is_snapshot_complete:
+            product = obj.product
+            if obj.unitPrice is None:
+                obj.unitPrice = obj.price / obj.count if obj.count else obj.price
+                obj.title, obj.description = obj.title or product.title, obj.description or product.description
+                obj.categoryId, obj.freeDelivery = product.category_id, product.freeDelivery
+            if obj.productDate is None:
+                obj.productDate = product.date
+            if obj.tags is None:
+                obj.tags = [{'id': tag.pk, 'name': tag.name} for tag in product.tags.all()]
+                obj.reviewsCount, obj.rating = product.reviews_count, product.rating
+        return super().to_representation(obj)
+
+
+def prefetch_incomplete_lines(orders: Iterable[Order]):
+    """Товары с тегами для строк заказов, ещё не заполненных backfill_order_snapshots, - без запросов на строку"""
+    lines = [line for order in orders for line in order.products.all() if not line.is_snapshot_complete]
+    prefetch_related_objects(lines, 'product__tags')
+
 
 class BasketItemSerializer(serializers.ModelSerializer):
     """Сериализатор элемента корзины"""
@@ -59,7 +91,7 @@ class BasketItemResponseSerializer(serializers.ModelSerializer):
     """
     id = serializers.IntegerField(source='product.id')
     category = serializers.IntegerField(source='product.category_id')
-    price = serializers.DecimalField(source='product.price', max_digits=10, decimal_places=2)
+    price = serializers.DecimalField(source='product.effective_price', max_digits=10, decimal_places=2)
     count = serializers.IntegerField(source='quantity')
     date = serializers.DateTimeField(source='product.date')
     title = serializers.CharField(source='product.title')
@@ -111,6 +143,15 @@ class OrderSerializer(serializers.ModelSerializer):
         )
 
 
+class OrderSummarySerializer(serializers.Serializer):
+    """Сериализатор краткой информации о заказе для истории заказов"""
+    id = serializers.IntegerField()
+    createdAt = serializers.DateTimeField()
+    status = serializers.CharField()
+    totalCost = serializers.DecimalField(max_digits=10, decimal_places=2)
+    itemsCount = serializers.IntegerField()
+
+
 class PaymentSerializer(serializers.ModelSerializer):
     """Сериализатор оплаты заказа"""
 
@@ -161,3 +202,29 @@ class PaymentSerializer(serializers.ModelSerializer):
         if len(str(value)) != 3:
             raise serializers.ValidationError('The code must be 3 digits')
         return value
+
+
+class QuoteSerializer(serializers.Serializer):
+    """Сериализатор предварительного расчёта стоимости корзины"""
+    count = serializers.IntegerField()
+    deliveryType = serializers.CharField()
+    subtotal = serializers.DecimalField(max_digits=10, decimal_places=2)
+    delivery = serializers.DecimalField(max_digits=10, decimal_places=2)
+    total = serializers.DecimalField(max_digits=10, decimal_places=2)
+
+
+class BasketOperationSerializer(serializers.Serializer):
+    """Операция с товаром корзины: add - добавить, remove - убрать, set - установить количество"""
+    op = serializers.ChoiceField(choices=('add', 'remove', 'set'))
+    id = serializers.IntegerField()
+    count = serializers.IntegerField(min_value=0)
+
+
+class BasketBatchSerializer(serializers.Serializer):
+    """
+    Сериализатор пакетного изменения корзины
+    response - что вернуть: корзину целиком, только изменённые строки или итоговую стоимость
+    """
+    operations = BasketOperationSerializer(many=True, allow_empty=False)
+    response = serializers.ChoiceField(choices=('basket', 'diff', 'totals'), default='basket')
+    deliveryType = serializers.CharField(default='ordinary')
@@ -0,0 +1,26 @@
+from django.contrib.auth.signals import user_logged_in
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .basket import DatabaseBasketStore, get_anonymous_basket_store
+from .models import DeliveryType
+from .pricing import invalidate_pricing_rules
+
+
+@receiver(post_save, sender=DeliveryType)
+@receiver(post_delete, sender=DeliveryType)
+def reset_pricing_rules(sender, **kwargs):
+    """Сбрасываем настройки доставки, закэшированные в процессах"""
+    invalidate_pricing_rules()
+
+
+@receiver(user_logged_in)
+def merge_anonymous_basket(sender, request, user, **kwargs):
+    """Переносим корзину, собранную до входа, в корзину пользователя"""
+    if request is None:
+        return
+    store = get_anonymous_basket_store(request)
+    lines = store.lines()
+    if lines:
+        DatabaseBasketStore(user).merge(lines)
+        store.clear()
@@ -1,3 +1,587 @@
-from django.test import TestCase
+import threading
+from datetime import timedelta
+from decimal import Decimal
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from megano.testing import EndpointBudgetMixin
+from products.cache import get_cache_version
+from products.facets import FACETS_CACHE_KEY
+from products.models import Category, Product
+from products.tests import QueryPlanMixin
+
+from .basket import BasketStore, DatabaseBasketStore, LineChange, fold_operations
+from .checkout import checkout
+from .inventory import OutOfStock, get_inventory_metrics, release_expired_reservations, reserve_stock
+from .models import BasketItem, DeliveryType, Order, OrderProduct, StockReservation
+from .pricing import Quote, get_delivery_rules, quote
+from .seed import SEED_USERNAME_PREFIX
+
+
+class StockReservationTestCase(TestCase):
+    """Резервирование остатков при оформлении заказа"""
+    fixtures = ['categories', 'tags', 'products']
+
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user(username='buyer', password='secret')
+        self.order = Order.objects.create(user=self.user)
+        Product.objects.filter(pk__in=(1, 2)).update(count=3)
+
+    def stock(self, *product_ids):
+        return list(Product.objects.filter(pk__in=product_ids).order_by('pk').values_list('count', flat=True))
+
+    def test_reserve_decrements_all_lines(self):
+        with self.assertNumQueries(4):
+            reserve_stock(self.order, {1: 2, 2: 3})
+        self.assertEqual(self.stock(1, 2), [1, 0])
+        self.assertEqual(StockReservation.objects.filter(order=self.order).count(), 2)
+        self.assertEqual(get_inventory_metrics()['reserved_units'], 5)
+
+    def test_out_of_stock_reserves_nothing(self):
+        with self.assertRaises(OutOfStock) as context:
+            reserve_stock(self.order, {1: 2, 2: 4})
+        self.assertEqual(context.exception.product_ids, [2])
+        self.assertEqual(self.stock(1, 2), [3, 3])
+        self.assertFalse(StockReservation.objects.exists())
+        self.assertEqual(get_inventory_metrics()['conflicts'], 1)
+
+    def test_release_expired(self):
+        reserve_stock(self.order, {1: 2})
+        reserve_stock(Order.objects.create(), {2: 1})
+        StockReservation.objects.filter(order=self.order).update(expires_at=timezone.now() - timedelta(seconds=1))
+
+        self.assertEqual(release_expired_reservations(), (1, 2))
+        self.assertEqual(self.stock(1, 2), [3, 2])
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, 'expired')
+        self.assertEqual(StockReservation.objects.count(), 1)
+
+    def test_checkout_out_of_stock(self):
+        BasketItem.objects.create(user=self.user, product_id=1, quantity=4)
+        self.client.force_login(self.user)
+        response = self.client.post(reverse('orders:orders'))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['products'], [1])
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertTrue(BasketItem.objects.exists())
+
+    def test_checkout_reserves_stock(self):
+        BasketItem.objects.create(user=self.user, product_id=1, quantity=3)
+        self.client.force_login(self.user)
+        response = self.client.post(reverse('orders:orders'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.stock(1), [0])
+        self.assertTrue(StockReservation.objects.filter(order_id=response.json()['orderId'], quantity=3).exists())
+
+    def test_stock_change_invalidates_caches(self):
+        version = get_cache_version()
+        cache.set(FACETS_CACHE_KEY, {'stale': True})
+        with self.captureOnCommitCallbacks(execute=True):
+            reserve_stock(self.order, {1: 1})
+        self.assertNotEqual(get_cache_version(), version)
+        self.assertIsNone(cache.get(FACETS_CACHE_KEY))
+
+    def test_expired_order_is_not_confirmed_or_paid(self):
+        reserve_stock(self.order, {1: 2})
+        StockReservation.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        release_expired_reservations()
+        self.client.force_login(self.user)
+
+        data = {'fullName': 'Buyer', 'phone': '', 'email': '', 'deliveryType': 'ordinary', 'city': 'Moscow',
+                'address': 'Street 1', 'paymentType': 'online'}
+        response = self.client.post(reverse('orders:order_id', args=[self.order.pk]), data,
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        payment = {'number': '12345678', 'name': 'Buyer', 'month': '12', 'year': '2030', 'code': '123'}
+        response = self.client.post(reverse('orders:payment', args=[self.order.pk]), payment,
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, 'expired')
+        self.assertEqual(self.stock(1), [3])
+
+    def test_payment_commits_reservations_once(self):
+        reserve_stock(self.order, {1: 2})
+        self.client.force_login(self.user)
+        payment = {'number': '12345678', 'name': 'Buyer', 'month': '12', 'year': '2030', 'code': '123'}
+        url = reverse('orders:payment', args=[self.order.pk])
+
+        self.assertEqual(self.client.post(url, payment, content_type='application/json').status_code, 200)
+        self.assertEqual(self.client.post(url, payment, content_type='application/json').status_code, 400)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, 'paid')
+        self.assertFalse(StockReservation.objects.exists())
+        self.assertEqual(self.stock(1), [1])
+
+    def test_payment_of_another_users_order(self):
+        reserve_stock(self.order, {1: 2})
+        self.client.force_login(get_user_model().objects.create_user(username='other', password='secret'))
+        payment = {'number': '12345678', 'name': 'Buyer', 'month': '12', 'year': '2030', 'code': '123'}
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('orders:payment', args=[self.order.pk]), payment,
+                                        content_type='application/json')
+        self.assertEqual(response.status_code, 404)
+        # Резервы чужого заказа не читаются и не блокируются
+        self.assertFalse([query for query in queries if StockReservation._meta.db_table in query['sql']])
+
+
+class CheckoutTestCase(TestCase):
+    """Оформление заказа в одной транзакции минимальным числом запросов"""
+    fixtures = ['categories', 'tags', 'products']
+
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user(username='buyer', password='secret', email='b@example.com')
+        BasketItem.objects.create(user=self.user, product_id=1, quantity=2)
+        BasketItem.objects.create(user=self.user, product_id=2, quantity=1)
+
+    def test_queries(self):
+        # Транзакция (2), корзина с ценами, теги, заказ, строки заказа, резерв (4), удаление корзины
+        with self.assertNumQueries(11):
+            order = checkout(user=self.user)
+        self.assertEqual(order.totalCost, Decimal('120000.00') * 2 + Decimal('15000.00'))
+        self.assertEqual(order.email, 'b@example.com')
+        self.assertEqual(
+            list(order.products.order_by('product_id').values_list('product_id', 'count', 'price')),
+            [(1, 2, Decimal('240000.00')), (2, 1, Decimal('15000.00'))],
+        )
+        self.assertFalse(BasketItem.objects.exists())
+
+    def test_anonymous_basket(self):
+        self.client.post(reverse('orders:basket'), {'id': 2, 'count': 3}, content_type='application/json')
+
+        response = self.client.post(reverse('orders:orders'))
+        order = Order.objects.get(pk=response.json()['orderId'])
+        self.assertIsNone(order.user)
+        self.assertEqual(order.totalCost, Decimal('45000.00'))
+        self.assertEqual(self.client.session['orderId'], order.pk)
+        self.assertEqual(self.client.get(reverse('orders:basket')).json(), [])
+
+    def test_line_added_during_checkout_is_kept(self):
+        added = []
+
+        def add_line_after_basket_read(execute, sql, params, many, context):
+            result = execute(sql, params, many, context)
+            # Параллельный запрос добавляет товар в корзину, когда оформление её уже прочитало и создаёт заказ
+            if not added and sql.lstrip().startswith(f'INSERT INTO "{Order._meta.db_table}"'):
+                added.append(BasketItem.objects.create(user=self.user, product_id=3, quantity=1))
+            return result
+
+        with connection.execute_wrapper(add_line_after_basket_read):
+            order = checkout(user=self.user)
+        self.assertTrue(added)
+        self.assertEqual(sorted(order.products.values_list('product_id', flat=True)), [1, 2])
+        self.assertEqual(list(BasketItem.objects.values_list('product_id', 'quantity')), [(3, 1)])
+
+    def test_deleted_product_is_not_sold(self):
+        Product.objects.filter(pk=2).update(is_deleted=True)
+        self.client.force_login(self.user)
+        self.assertEqual([item['id'] for item in self.client.get(reverse('orders:basket')).json()], [1])
+
+        order = checkout(user=self.user)
+        self.assertEqual(list(order.products.values_list('product_id', flat=True)), [1])
+        self.assertEqual(order.totalCost, Decimal('240000.00'))
+
+
+class PricingTestCase(TestCase):
+    """Расчёт стоимости заказа по закэшированным в процессе настройкам доставки"""
+    fixtures = ['categories', 'tags', 'products']
+
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user(username='buyer', password='secret')
+        self.delivery = DeliveryType.objects.get()
+
+    def test_rules_cached_in_process(self):
+        get_delivery_rules()
+        # Повторно читаем только номер версии из общего кэша
+        with self.assertNumQueries(0):
+            self.assertEqual(quote([(Decimal('500.00'), 2)], 'ordinary'),
+                             Quote(Decimal('1000.00'), Decimal('200.00'), Decimal('1200.00')))
+
+    def test_rules_reloaded_after_save(self):
+        self.assertEqual(quote([(Decimal('100.00'), 1)], 'express').delivery, Decimal('500.00'))
+        self.delivery.cost_express_delivery = Decimal('700.00')
+        self.delivery.save()
+        self.assertEqual(quote([(Decimal('100.00'), 1)], 'express').delivery, Decimal('700.00'))
+
+    def test_rules_expire_without_version_change(self):
+        # Изменение в другом процессе с кэшем в памяти процесса: версия здесь не меняется
+        get_delivery_rules()
+        DeliveryType.objects.update(cost_express_delivery=Decimal('700.00'))
+        self.assertEqual(quote([(Decimal('100.00'), 1)], 'express').delivery, Decimal('500.00'))
+        with override_settings(PRICING_RULES_MAX_AGE=0):
+            self.assertEqual(quote([(Decimal('100.00'), 1)], 'express').delivery, Decimal('700.00'))
+
+    def test_free_ordinary_delivery(self):
+        self.assertEqual(quote([(Decimal('1000.00'), 2)], 'ordinary').delivery, Decimal('0.00'))
+
+    def test_basket_total(self):
+        BasketItem.objects.create(user=self.user, product_id=2, quantity=1)
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('orders:basket_total'), {'deliveryType': 'express'})
+        self.assertEqual(response.json(), {
+            'count': 1, 'deliveryType': 'express', 'subtotal': '15000.00', 'delivery': '500.00', 'total': '15500.00',
+        })
+
+    def test_confirm_order_is_idempotent(self):
+        BasketItem.objects.create(user=self.user, product_id=2, quantity=1)
+        self.client.force_login(self.user)
+        order_id = self.client.post(reverse('orders:orders')).json()['orderId']
+        data = {'fullName': 'Buyer', 'phone': '', 'email': '', 'deliveryType': 'express', 'city': 'Moscow',
+                'address': 'Street 1', 'paymentType': 'online'}
+        for _ in range(2):
+            self.client.post(reverse('orders:order_id', args=[order_id]), data, content_type='application/json')
+        self.assertEqual(Order.objects.get(pk=order_id).totalCost, Decimal('15500.00'))
+
+
+class BasketStoreTestCase(TestCase):
+    """Хранилища анонимной корзины и перенос корзины при входе"""
+    fixtures = ['categories', 'tags', 'products']
+
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user(username='buyer', password='secret')
+
+    def test_incomplete_store_is_not_instantiated(self):
+        class ReadOnlyStore(BasketStore):
+            def lines(self):
+                return {}
+
+        with self.assertRaises(TypeError):
+            ReadOnlyStore()
+
+    def change_basket(self, method, product_id, count):
+        return getattr(self.client, method)(reverse('orders:basket'), {'id': product_id, 'count': count},
+                                            content_type='application/json')
+
+    def get_basket(self) -> dict:
+        return {item['id']: item['count'] for item in self.client.get(reverse('orders:basket')).json()}
+
+    def check_anonymous_basket(self):
+        self.change_basket('post', 1, 1)
+        self.change_basket('post', 2, 2)
+        self.change_basket('post', 1, 2)
+        self.change_basket('delete', 2, 1)
+        self.assertEqual(self.get_basket(), {1: 3, 2: 1})
+        self.change_basket('delete', 2, 5)
+        self.assertEqual(self.get_basket(), {1: 3})
+        # Анонимная корзина не пишется в сессию
+        self.assertNotIn(settings.SESSION_COOKIE_NAME, self.client.cookies)
+
+    def test_cookie_store(self):
+        self.check_anonymous_basket()
+
+    @override_settings(BASKET_ANONYMOUS_STORE='cache')
+    def test_cache_store(self):
+        self.check_anonymous_basket()
+
+    def test_merge_on_login(self):
+        BasketItem.objects.create(user=self.user, product_id=1, quantity=1)
+        self.change_basket('post', 1, 2)
+        self.change_basket('post', 2, 1)
+        self.client.post(reverse('accounts:sign-in'), {'username': 'buyer', 'password': 'secret'},
+                         content_type='application/json')
+        self.assertEqual(DatabaseBasketStore(self.user).lines(), {1: 3, 2: 1})
+        self.client.logout()
+        self.assertEqual(self.get_basket(), {})
+
+
+class BasketBatchTestCase(TestCase):
+    """Пакетное изменение корзины"""
+    fixtures = ['categories', 'tags', 'products']
+
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user(username='buyer', password='secret')
+        self.operations = [
+            {'op': 'add', 'id': 1, 'count': 2},
+            {'op': 'add', 'id': 2, 'count': 1},
+            {'op': 'set', 'id': 3, 'count': 4},
+            {'op': 'remove', 'id': 1, 'count': 1},
+            {'op': 'remove', 'id': 4, 'count': 1},
+        ]
+
+    def batch(self, operations, **params):
+        return self.client.post(reverse('orders:basket_batch'), {'operations': operations, **params},
+                                content_type='application/json')
+
+    def test_user_basket(self):
+        BasketItem.objects.create(user=self.user, product_id=4, quantity=1)
+        self.client.force_login(self.user)
+        response = self.batch(self.operations, response='diff')
+        self.assertEqual(response.json(), {
+            'changed': [{'id': 1, 'count': 1}, {'id': 2, 'count': 1}, {'id': 3, 'count': 4}],
+            'removed': [4],
+        })
+        self.assertEqual(DatabaseBasketStore(self.user).lines(), {1: 1, 2: 1, 3: 4})
+
+    def test_user_basket_queries(self):
+        BasketItem.objects.create(user=self.user, product_id=4, quantity=1)
+        BasketItem.objects.create(user=self.user, product_id=1, quantity=1)
+        self.client.force_login(self.user)
+        self.client.get(reverse('orders:basket_total'))
+        # Сессия и пользователь, корзина, товары с ценами, один upsert изменённых строк и удаление опустевших
+        with self.assertNumQueries(6):
+            self.batch(self.operations, response='diff')
+
+    def test_anonymous_basket_full_response(self):
+        response = self.batch(self.operations)
+        self.assertEqual({item['id']: item['count'] for item in response.json()}, {1: 1, 2: 1, 3: 4})
+
+    def test_totals(self):
+        response = self.batch([{'op': 'add', 'id': 2, 'count': 2}], response='totals', deliveryType='express')
+        self.assertEqual(response.json(), {
+            'count': 2, 'deliveryType': 'express', 'subtotal': '30000.00', 'delivery': '500.00', 'total': '30500.00',
+        })
+
+    def test_unknown_product(self):
+        response = self.batch([{'op': 'add', 'id': 1, 'count': 1}, {'op': 'add', 'id': 999, 'count': 1}])
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json()['products'], [999])
+        self.assertEqual(self.client.get(reverse('orders:basket')).json(), [])
+
+
+class LineChangeTestCase(TestCase):
+    """Свёртка операций пакета над товаром в одно изменение"""
+
+    def test_fold_operations(self):
+        changes = fold_operations([
+            {'op': 'add', 'id': 1, 'count': 3},
+            {'op': 'remove', 'id': 1, 'count': 5},
+            {'op': 'add', 'id': 1, 'count': 1},
+            {'op': 'set', 'id': 2, 'count': 4},
+            {'op': 'remove', 'id': 2, 'count': 1},
+        ])
+        # max(q + 3 - 5, 0) + 1 для любого текущего количества q
+        for quantity in range(6):
+            self.assertEqual(changes[1].apply(quantity), max(quantity - 2, 0) + 1)
+        self.assertEqual(changes[2], LineChange(absolute=3))
+
+    def test_interleaved_batches_keep_both_changes(self):
+        # Оба пакета прочитали корзину до того, как другой записал изменения
+        user = get_user_model().objects.create_user(username='buyer', password='secret')
+        category = Category.objects.create(title='Phones')
+        product = Product.objects.create(category=category, title='Phone', price='100.00', count=10)
+        first, second = DatabaseBasketStore(user), DatabaseBasketStore(user)
+        first.add(product.pk, 2)
+        before = first.lines()
+
+        self.assertEqual(first.apply([{'op': 'add', 'id': product.pk, 'count': 1}], before), {product.pk: 3})
+        second.apply([{'op': 'remove', 'id': product.pk, 'count': 1}], before)
+        self.assertEqual(second.lines(), {product.pk: 2})
+        second.apply([{'op': 'remove', 'id': product.pk, 'count': 5}], before)
+        self.assertEqual(BasketItem.objects.filter(user=user).count(), 0)
+
+
+class BasketUpsertConcurrencyTestCase(TransactionTestCase):
+    """Параллельное добавление товара в одну корзину не создаёт дублей и не теряет количество"""
+    threads = 8
+    additions = 25
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='buyer', password='secret')
+        category = Category.objects.create(title='Phones')
+        self.product = Product.objects.create(category=category, title='Phone', price='100.00', count=10)
+
+    def add_to_basket(self, errors: list):
+        try:
+            store = DatabaseBasketStore(self.user)
+            for _ in range(self.additions):
+                store.add(self.product.pk, 1)
+        except Exception as exp:
+            errors.append(exp)
+        finally:
+            connection.close()
+
+    def test_concurrent_add(self):
+        errors = []
+        workers = [threading.Thread(target=self.add_to_basket, args=(errors,)) for _ in range(self.threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(
+            list(BasketItem.objects.filter(user=self.user).values_list('product_id', 'quantity')),
+            [(self.product.pk, self.threads * self.additions)],
+        )
+
+
+class OrderHistoryTestCase(TestCase):
+    """Краткая история заказов с пагинацией по ключу"""
+    fixtures = ['categories', 'tags', 'products']
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='buyer', password='secret')
+        for index in range(5):
+            order = Order.objects.create(user=self.user, totalCost=100 * (index + 1))
+            OrderProduct.objects.bulk_create([
+                OrderProduct(order=order, product_id=1, count=index + 1, price=100),
+                OrderProduct(order=order, product_id=2, count=1, price=100),
+            ])
+        Order.objects.create(user=self.user, is_deleted=True)
+        self.client.force_login(self.user)
+
+    def get_summary(self, **params):
+        return self.client.get(reverse('orders:orders'), {'view': 'summary', 'limit': 2, **params}).json()
+
+    def test_pages(self):
+        expected = list(Order.objects.filter(is_deleted=False).order_by('-createdAt', '-id').values_list(
+            'id', flat=True))
+        ids, page = [], self.get_summary()
+        while True:
+            ids += [item['id'] for item in page['items']]
+            if not page['nextCursor']:
+                break
+            page = self.get_summary(cursor=page['nextCursor'])
+        self.assertEqual(ids, expected)
+        self.assertEqual(page['lastPage'], 3)
+
+    def test_summary_fields(self):
+        with self.assertNumQueries(4):   # сессия, пользователь, страница заказов, количество заказов
+            item = self.get_summary()['items'][0]
+        order = Order.objects.get(pk=item['id'])
+        self.assertEqual(set(item), {'id', 'createdAt', 'status', 'totalCost', 'itemsCount'})
+        self.assertEqual(item['itemsCount'], sum(order.products.values_list('count', flat=True)))
+        self.assertEqual(item['totalCost'], f'{order.totalCost:.2f}')
+
+
+class OrderHistoryQueryPlanTestCase(QueryPlanMixin, TestCase):
+    """История заказов читается по частичному индексу (user, -createdAt, -id)"""
+
+    @classmethod
+    def setUpTestData(cls):
+        users = [get_user_model().objects.create(username=f'buyer{index}') for index in range(20)]
+        Order.objects.bulk_create([Order(user=users[index % 20], is_deleted=index % 7 == 0) for index in range(3000)])
+        cls.user = users[0]
+
+    def test_history(self):
+        orders = Order.objects.filter(user=self.user, is_deleted=False)
+        self.assertUsesIndex(orders.order_by('-createdAt', '-id')[:20])
+        self.assertUsesIndex(orders.order_by())
+
+
+class OrderSnapshotTestCase(TestCase):
+    """Строки заказа отображаются по данным товара, сохранённым при покупке"""
+    fixtures = ['categories', 'tags', 'products', 'product_images']
+
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user(username='buyer', password='secret')
+        BasketItem.objects.create(user=self.user, product_id=10, quantity=2)
+        self.order = checkout(user=self.user)
+        self.client.force_login(self.user)
+
+    def test_snapshot(self):
+        line = self.order.products.get()
+        self.assertEqual((line.title, line.unitPrice, line.categoryId, line.freeDelivery),
+                         ('Laptop backpack 15.6"', Decimal('5500.00'), 2, True))
+        self.assertEqual(line.image, 'products/product_10/images/Laptop_backpack_15.622_1.png')
+
+    def test_order_does_not_change_with_product(self):
+        before = self.client.get(reverse('orders:order_id', args=[self.order.pk])).json()
+        Product.objects.filter(pk=10).update(title='Renamed', price=1, freeDelivery=False)
+        # Сессия, пользователь, заказ и строки заказа - без запросов к товарам
+        with self.assertNumQueries(4):
+            after = self.client.get(reverse('orders:order_id', args=[self.order.pk])).json()
+        self.assertEqual(after, before)
+        self.assertEqual(after['products'][0]['title'], 'Laptop backpack 15.6"')
+        self.assertEqual(after['products'][0]['images'][0]['src'],
+                         '/media/products/product_10/images/Laptop_backpack_15.622_1.png')
+
+    def test_response_fields(self):
+        line = self.client.get(reverse('orders:order_id', args=[self.order.pk])).json()['products'][0]
+        self.assertEqual(set(line), {'id', 'category', 'price', 'count', 'date', 'title', 'description',
+                                     'freeDelivery', 'images', 'tags', 'reviews', 'rating'})
+        self.assertEqual(parse_datetime(line['date']), Product.objects.get(pk=10).date)
+        product = Product.objects.get(pk=10)
+        tags = [{'id': tag.pk, 'name': tag.name} for tag in product.tags.order_by('pk')]
+        self.assertEqual((line['tags'], line['reviews'], line['rating']),
+                         (tags, product.reviews_count, str(product.rating)))
+
+    def test_snapshot_does_not_change_with_tags(self):
+        before = self.client.get(reverse('orders:order_id', args=[self.order.pk])).json()['products'][0]
+        Product.objects.get(pk=10).tags.clear()
+        Product.objects.filter(pk=10).update(reviews_count=100, rating=Decimal('1.00'))
+        after = self.client.get(reverse('orders:order_id', args=[self.order.pk])).json()['products'][0]
+        self.assertEqual((after['tags'], after['reviews'], after['rating']),
+                         (before['tags'], before['reviews'], before['rating']))
+
+    def test_line_without_snapshot(self):
+        OrderProduct.objects.filter(order=self.order).update(unitPrice=None, title='', productDate=None, tags=None,
+                                                             reviewsCount=None, rating=None)
+        line = self.client.get(reverse('orders:order_id', args=[self.order.pk])).json()['products'][0]
+        product = Product.objects.get(pk=10)
+        self.assertEqual((line['price'], line['title']), ('5500.00', 'Laptop backpack 15.6"'))
+        self.assertEqual(parse_datetime(line['date']), product.date)
+        tag_ids = list(product.tags.order_by('pk').values_list('pk', flat=True))
+        self.assertEqual([tag['id'] for tag in line['tags']], tag_ids)
+        self.assertEqual((line['reviews'], line['rating']), (product.reviews_count, str(product.rating)))
+
+    def test_lines_without_snapshot_queries(self):
+        for product_id in (1, 2, 3):
+            BasketItem.objects.create(user=self.user, product_id=product_id, quantity=1)
+        checkout(user=self.user)
+        OrderProduct.objects.update(unitPrice=None, productDate=None, tags=None, reviewsCount=None, rating=None)
+        # Сессия, пользователь, страница заказов, количество заказов, товары и теги незаполненных строк
+        with self.assertNumQueries(6):
+            orders = self.client.get(reverse('orders:orders')).json()
+        self.assertEqual(sum(len(order['products']) for order in orders), 4)
+        with self.assertNumQueries(6):
+            self.client.get(reverse('orders:order_id', args=[self.order.pk]))
+
+
+class OrderEndpointBudgetTestCase(EndpointBudgetMixin, TestCase):
+    """Бюджеты SQL-запросов и задержки эндпоинтов корзины и заказов на синтетическом наборе данных"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.get(username=f'{SEED_USERNAME_PREFIX}0')
+        self.products = list(Product.objects.visible().filter(count__gte=10).order_by('pk')[:3])
+        BasketItem.objects.bulk_create([BasketItem(user=self.user, product=product, quantity=2)
+                                        for product in self.products])
+        self.order = Order.objects.filter(user=self.user, is_deleted=False).exclude(status='expired').first()
+        self.client.force_login(self.user)
+
+    def test_basket(self):
+        url = reverse('orders:basket')
+        line = {'id': self.products[0].pk, 'count': 1}
+        self.assertWithinBudget('get', url, 6, 50)
+        self.assertWithinBudget('post', url, 10, 50, line, content_type='application/json')
+        self.assertWithinBudget('delete', url, 10, 50, line, content_type='application/json')
+        self.assertWithinBudget('get', reverse('orders:basket_total'), 4, 50, {'deliveryType': 'express'})
+        operations = [{'op': 'add', 'id': product.pk, 'count': 1} for product in self.products]
+        self.assertWithinBudget('post', reverse('orders:basket_batch'), 5, 50,
+                                {'operations': operations, 'response': 'totals'}, content_type='application/json')
+
+    def test_anonymous_basket(self):
+        self.client.logout()
+        line = {'id': self.products[0].pk, 'count': 1}
+        self.assertWithinBudget('post', reverse('orders:basket'), 6, 50, line, content_type='application/json')
+        self.assertWithinBudget('get', reverse('orders:basket'), 3, 50)
+
+    def test_orders(self):
+        self.assertWithinBudget('get', reverse('orders:orders'), 4, 100)
+        self.assertWithinBudget('get', reverse('orders:orders'), 4, 50, {'view': 'summary'})
+        self.assertWithinBudget('get', reverse('orders:order_id', args=[self.order.pk]), 4, 50)
+
+    def test_checkout(self):
+        self.assertWithinBudget('post', reverse('orders:orders'), 13, 100)
+        data = {'fullName': 'Buyer', 'phone': '', 'email': '', 'deliveryType': 'express', 'city': 'Moscow',
+                'address': 'Street 1', 'paymentType': 'online'}
+        self.assertWithinBudget('post', reverse('orders:order_id', args=[self.order.pk]), 6, 50, data,
+                                content_type='application/json')
+        payment = {'number': '12345678', 'name': 'Buyer', 'month': '12', 'year': '2030', 'code': '123'}
+        self.assertWithinBudget('post', reverse('orders:payment', args=[self.order.pk]), 10, 50, payment,
+                                content_type='application/json')
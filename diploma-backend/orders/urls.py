@@ -1,11 +1,13 @@
 from django.urls import path
 
-from .views import OrderAPIView, OrdersAPIView, BasketAPIView, PaymentAPIView
+from .views import OrderAPIView, OrdersAPIView, BasketAPIView, BasketBatchAPIView, BasketTotalAPIView, PaymentAPIView
 
 app_name = 'orders'
 
 urlpatterns = [
     path('basket', BasketAPIView.as_view(), name='basket'),
+    path('basket/batch', BasketBatchAPIView.as_view(), name='basket_batch'),
+    path('basket/total', BasketTotalAPIView.as_view(), name='basket_total'),
     path('order/<int:pk>', OrderAPIView.as_view(), name='order_id'),
     path('orders', OrdersAPIView.as_view(), name='orders'),
     path('payment/<int:pk>', PaymentAPIView.as_view(), name='payment'),
@@ -4,16 +4,27 @@ from rest_framework.response import Response
 from rest_framework.request import Request
 from rest_framework import status
 
-from django.db.models import Avg, Value, Count, Prefetch, Sum
+from django.db import transaction
+from django.db.models import Prefetch, Sum
 from django.db.models.functions import Coalesce
 from django.shortcuts import get_object_or_404
 
-from .models import Order, BasketItem, OrderProduct, DeliveryType
-from .serializers import OrderSerializer, PaymentSerializer, BasketItemResponseSerializer, OrderProductSerializer
+from .basket import get_anonymous_basket_store, get_basket_store
+from .checkout import checkout, get_basket_lines, get_user_basket_lines
+from .inventory import OutOfStock, commit_reservations, lock_reservations
+from .models import Order, BasketItem
+from .pricing import quote
+from .serializers import (OrderSerializer, PaymentSerializer, BasketItemResponseSerializer, OrderProductSerializer,
+                          QuoteSerializer, BasketBatchSerializer, OrderSummarySerializer, prefetch_incomplete_lines)
 
 from products.models import Product
+from products.pagination import KeysetPagination
 from products.serializers import ProductShortSerializer
 
+ORDER_DELIVERY_FIELDS = ('fullName', 'phone', 'email', 'deliveryType', 'city', 'address', 'paymentType')
+CONFIRMABLE_STATUSES = ('created', 'accepted', 'confirmed')     # заказ можно подтвердить (и изменить) до оплаты
+PAYABLE_STATUSES = CONFIRMABLE_STATUSES
+
 
 class BasketAPIView(APIView):
     """
@@ -21,23 +32,18 @@ class BasketAPIView(APIView):
     - получить список товаров в корзине
     - добавить товары в корзину
     - удалить товар из корзины
-    Для анонимных пользователей в качестве временного хранилища корзины используем сессию,
-    для авторизованных - БД
+    Для анонимных пользователей корзина хранится в cookie или кэше, для авторизованных - в БД (см. basket.py)
     """
     permission_classes = [AllowAny]  # ← Полный доступ для всех
 
     def get_basket_queryset(self):
-        return BasketItem.objects.prefetch_related(
+        return BasketItem.objects.filter(product__is_deleted=False).prefetch_related(
             Prefetch(
                 'product',
-                queryset=Product.objects.select_related('category').prefetch_related(
-                    'images', 'tags').annotate(rating=Coalesce(Avg('reviews__rate'), Value(0.00)),
-                                               reviews_count=Count('reviews'))))
+                queryset=Product.objects.select_related('category').prefetch_related('images', 'tags')))
 
     def get_queryset_product(self):
-        return Product.objects.select_related('category').prefetch_related(
-                    'images', 'tags').annotate(rating=Coalesce(Avg('reviews__rate'), Value(0.00)),
-                                               reviews_count=Count('reviews'))
+        return Product.objects.visible().select_related('category').prefetch_related('images', 'tags')
 
     def get(self, request: Request) -> Response:
         if request.user.is_authenticated:
@@ -46,163 +52,150 @@ class BasketAPIView(APIView):
             serializer_products = BasketItemResponseSerializer(basket, many=True)
             return Response(serializer_products.data, status=status.HTTP_200_OK)
         else:
-            # Корзина из сессии
-            basket = request.session.get('basket', [])
-            products_ids = [item['product'] for item in basket]
-            products = {product.id: product for product in self.get_queryset_product().filter(id__in=products_ids)}
+            # Анонимная корзина
+            lines = get_anonymous_basket_store(request).lines()
+            products = {product.id: product for product in self.get_queryset_product().filter(id__in=lines)}
 
             serializer_products = []
-            for item in basket:
-                product = products.get(item['product'])
-                product.count = item['quantity']
-                product.price *= item['quantity']
+            for product_id, quantity in lines.items():
+                product = products.get(product_id)
+                if product is None:
+                    continue
+                product.count = quantity
+                product.price = product.effective_price * quantity
                 serializer_products.append(ProductShortSerializer(product).data)
             return Response(serializer_products, status=status.HTTP_200_OK)
 
     def post(self, request: Request) -> Response:
         product = get_object_or_404(self.get_queryset_product(), id=request.data['id'])
-        quantity = request.data['count']
-        if request.user.is_authenticated:
-            # Сохраняем продукт в корзину БД
-            basket_item, created = BasketItem.objects.get_or_create(
-                user=request.user,
-                product=product,
-                defaults={'quantity': quantity}
-            )
-            if not created:
-                basket_item.quantity += quantity
-                basket_item.save()
-
-        else:
-            # Сохраняем продукт в сессию корзины
-            basket = request.session.get('basket', [])
-            for item in basket:
-                if item['product'] == product.id:
-                    item['quantity'] += quantity
-                    break
-            else:
-                basket.append({
-                    'product': product.id,
-                    'quantity': quantity
-                })
-
-            request.session['basket'] = basket
+        get_basket_store(request).add(product.id, request.data['count'])
         return self.get(request)
 
     def delete(self, request: Request) -> Response:
-        product = get_object_or_404(self.get_queryset_product(), id=request.data['id'])
-        quantity = request.data['count']
+        # Удалить из корзины можно и товар, который уже снят с продажи
+        product = get_object_or_404(Product.objects.only('pk'), id=request.data['id'])
+        # Уменьшаем количество товара в корзине или удаляем его
+        get_basket_store(request).remove(product.id, request.data['count'])
+        return self.get(request)
+
+
+class BasketBatchAPIView(BasketAPIView):
+    """
+    Пакетное изменение корзины: операции add/remove/set для нескольких товаров за один запрос.
+    Товары проверяются одним запросом, изменения записываются в хранилище корзины одной операцией
+    (в БД add/remove - относительными изменениями, поэтому параллельные пакеты не теряют изменения друг друга).
+    В ответ - корзина целиком, только изменения (response=diff) или стоимость (response=totals)
+    """
+    http_method_names = ['post', 'options']
+
+    def post(self, request: Request) -> Response:
+        serializer = BasketBatchSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        operations = serializer.validated_data['operations']
+
+        store = get_basket_store(request)
+        before = store.lines()
+
+        # Одним запросом проверяем товары операций и получаем цены всех товаров корзины
+        product_ids = {operation['id'] for operation in operations}
+        prices = dict(Product.objects.visible().filter(
+            pk__in=product_ids | set(before)).values_list('pk', 'effective_price'))
+        unknown = sorted(product_ids - set(prices))
+        if unknown:
+            return Response({'error': 'Products not found', 'products': unknown}, status=status.HTTP_404_NOT_FOUND)
+
+        changes = store.apply(operations, before)
+        after = {**before, **changes}
+
+        if serializer.validated_data['response'] == 'diff':
+            return Response({
+                'changed': [{'id': product_id, 'count': quantity}
+                            for product_id, quantity in changes.items() if quantity > 0],
+                'removed': [product_id for product_id, quantity in changes.items() if quantity <= 0],
+            }, status=status.HTTP_200_OK)
+        if serializer.validated_data['response'] == 'totals':
+            lines = [(product_id, quantity, prices[product_id])
+                     for product_id, quantity in after.items() if quantity > 0 and product_id in prices]
+            return Response(get_quote_data(lines, serializer.validated_data['deliveryType']),
+                            status=status.HTTP_200_OK)
+        return self.get(request)
+
+
+def get_quote_data(lines, delivery_type: str) -> dict:
+    """Стоимость корзины по строкам (id товара, количество, цена)"""
+    order_quote = quote([(price, quantity) for _, quantity, price in lines], delivery_type)
+    return QuoteSerializer({
+        'count': sum(quantity for _, quantity, _ in lines),
+        'deliveryType': delivery_type,
+        **order_quote._asdict(),
+    }).data
+
+
+class BasketTotalAPIView(APIView):
+    """
+    Предварительный расчёт стоимости корзины с доставкой.
+    Тип доставки передаётся в параметре deliveryType (по умолчанию - обычная)
+    """
+    permission_classes = [AllowAny]
+
+    def get(self, request: Request) -> Response:
         if request.user.is_authenticated:
-            # Удаляем продукт из корзины БД или изменяем его количество
-            basket_item = get_object_or_404(BasketItem, user=request.user, product_id=product.id)
-            if basket_item.quantity > quantity:
-                basket_item.quantity -= quantity
-                basket_item.save()
-            else:
-                basket_item.delete()
+            lines = get_user_basket_lines(request.user)
         else:
-            # Удаляем продукт из сессии корзины или изменяем его количество
-            basket = request.session.get('basket', [])
-            for item in basket:
-                if item['product'] == product.id:
-                    if item['quantity'] > quantity:
-                        item['quantity'] -= quantity
-                    else:
-                        basket.remove(item)
-            request.session['basket'] = basket
-        return self.get(request)
+            lines = get_basket_lines(get_anonymous_basket_store(request).lines())
+
+        delivery_type = request.query_params.get('deliveryType', 'ordinary')
+        return Response(get_quote_data(lines, delivery_type), status=status.HTTP_200_OK)
 
 
 class OrdersAPIView(APIView):
     """
     Действия с заказами:
-    - получить список активных заказов
+    - получить список активных заказов (с view=summary - краткую историю заказов постранично)
     - создать заказ
     """
     permission_classes = [AllowAny]
 
     def get_queryset(self):
-        return Order.objects.prefetch_related(
-            Prefetch(
-                'products__product',
-                queryset=Product.objects.select_related('category').annotate(
-                    reviews_count=Count('reviews'),
-                    rating=Coalesce(Avg('reviews__rate'), Value(0.0))
-                ).prefetch_related('images', 'tags')
-            )
-        ).order_by('-createdAt')
+        return Order.objects.prefetch_related('products').order_by('-createdAt')
 
     def get(self, request: Request) -> Response:
-        orders = self.get_queryset().filter(user=request.user, is_deleted=False)
+        if request.query_params.get('view') == 'summary':
+            return self.get_summary(request)
+        orders = list(self.get_queryset().filter(user=request.user, is_deleted=False))
+        prefetch_incomplete_lines(orders)
         serializer = OrderSerializer(orders, many=True)
         return Response(serializer.data, status=status.HTTP_200_OK)
 
-    def post(self, request: Request) -> Response:
+    def get_summary(self, request: Request) -> Response:
+        """
+        История заказов без строк заказа: номер, дата, статус, стоимость и количество товаров
+        одним агрегирующим запросом, постранично по ключу (createdAt, id)
+        """
         if not request.user.is_authenticated:
-            # Создаём заказ
-            order = Order.objects.create()
+            return Response(status=status.HTTP_401_UNAUTHORIZED)
+        orders = Order.objects.filter(user=request.user, is_deleted=False).order_by('-createdAt', '-id').values(
+            'id', 'createdAt', 'status', 'totalCost',
+        ).annotate(itemsCount=Coalesce(Sum('products__count'), 0))
 
-            # Сохраняем orderId в сессии
-            request.session['orderId'] = order.id
+        paginator = KeysetPagination()
+        page = paginator.paginate_queryset(orders, request, view=self)
+        return paginator.get_paginated_response(OrderSummarySerializer(page, many=True).data)
 
-            # Корзина из сессии
-            basket = request.session.get('basket', [])
-            if basket:
-                products_ids = [item['product'] for item in basket]
-                products = {product.id: product for product in Product.objects.select_related('category'
-                                                                                              ).prefetch_related(
-                    'images', 'tags').annotate(rating=Coalesce(Avg('reviews__rate'), Value(0.00)),
-                                               reviews_count=Count('reviews')).filter(id__in=products_ids)}
-                order_products = []
-                for basket_item in basket:
-                    # Получаем продукт
-                    product = products.get(basket_item['product'])
-
-                    # Создаём OrderProduct
-                    order_products.append(OrderProduct(
-                        order=order,
-                        product=product,
-                        count=basket_item['quantity'],
-                        price=float(product.price * basket_item['quantity'])))
-
-                # Удаляем корзину из сессии
-                del request.session['basket']
-
-        else:
-            # Создаём заказ
-            order = Order.objects.create(
-                user=request.user,
-                fullName=request.user.fullName or request.user.first_name + request.user.last_name or request.user.username.title(),
-                email=request.user.email or '',
-                phone=request.user.phone or '',
-            )
-
-            # Получаем корзину из БД
-            basket = BasketItem.objects.filter(user=request.user).prefetch_related(Prefetch(
-                'product',
-                queryset=Product.objects.select_related('category').annotate(
-                    reviews_count=Count('reviews'),
-                    rating=Coalesce(Avg('reviews__rate'), Value(0.0))
-                ).prefetch_related('images', 'tags')
-            ))
-
-            # Создаём OrderProduct'ы
-            order_products = [OrderProduct(
-                order=order,
-                product=basket_item.product,
-                count=basket_item.quantity,
-                price=float(basket_item.product.price * basket_item.quantity)
-            ) for basket_item in basket
-            ]
-
-            # Очищаем корзину в БД
-            basket.delete()
-
-        OrderProduct.objects.bulk_create(order_products)
-
-        # Определяем общую стоимость заказа
-        order.totalCost = float(sum(product.price for product in order_products))
-        order.save()
+    def post(self, request: Request) -> Response:
+        user = request.user if request.user.is_authenticated else None
+        store = get_basket_store(request)
+        try:
+            order = checkout(user=user, basket=None if user else store.lines())
+        except OutOfStock as exp:
+            return Response({'error': 'Not enough products in stock', 'products': exp.product_ids},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        if user is None:
+            # Сохраняем orderId в сессии и очищаем анонимную корзину
+            request.session['orderId'] = order.id
+            store.clear()
 
         return Response({'orderId': order.id}, status=status.HTTP_200_OK)
 
@@ -216,50 +209,31 @@ class OrderAPIView(APIView):
     permission_classes = [AllowAny]
 
     def get_queryset(self):
-        return Order.objects.select_related('user').prefetch_related(
-            Prefetch(
-                'products__product',
-                queryset=Product.objects.select_related('category').annotate(
-                    reviews_count=Count('reviews'),
-                    rating=Coalesce(Avg('reviews__rate'), Value(0.0))
-                ).prefetch_related('images', 'tags')
-            )
-        )
+        return Order.objects.prefetch_related('products')
 
     def get(self, request: Request, pk) -> Response:
         order = get_object_or_404(self.get_queryset(), id=pk)
+        prefetch_incomplete_lines([order])
         serializer = OrderSerializer(order)
         return Response(serializer.data, status=status.HTTP_200_OK)
 
     def post(self, request: Request, pk) -> Response:
-        order = get_object_or_404(self.get_queryset(), id=pk)
+        order = get_object_or_404(Order.objects.prefetch_related('products'), id=pk)
+        if order.status not in CONFIRMABLE_STATUSES:
+            return Response({'error': f'Order is {order.status}'}, status=status.HTTP_400_BAD_REQUEST)
 
         # Обновляем данные заказа
-        if request.data['fullName']:
-            order.fullName = request.data['fullName']
-        if request.data['phone']:
-            order.phone = request.data['phone']
-        if request.data['email']:
-            order.email = request.data['email']
-        if request.data['deliveryType']:
-            order.deliveryType = request.data['deliveryType']
-        if request.data['city']:
-            order.city = request.data['city']
-        if request.data['address']:
-            order.address = request.data['address']
-        if request.data['paymentType']:
-            order.paymentType = request.data['paymentType']
-
-        # Определяем общую стоимость заказа с учетом доставки
-        delivery = get_object_or_404(DeliveryType)
-        if request.data['deliveryType'] == 'ordinary':
-            if order.totalCost < delivery.min_cost_order_by_free_delivery:
-                order.totalCost += delivery.cost_ordinary_delivery
-        elif request.data['deliveryType'] == 'express':
-            order.totalCost += delivery.cost_express_delivery
-
-        order.status = 'confirmed'
-        order.save()
+        fields = {name: request.data[name] for name in ORDER_DELIVERY_FIELDS if request.data.get(name)}
+        delivery_type = fields.get('deliveryType', order.deliveryType)
+
+        # Определяем общую стоимость заказа с учетом доставки (price строки заказа - стоимость всех единиц товара)
+        fields['totalCost'] = quote([(line.price, 1) for line in order.products.all()], delivery_type).total
+
+        # Статус меняется условно: заказ, просроченный или оплаченный параллельно, не подтверждается
+        updated = Order.objects.filter(pk=order.pk, status__in=CONFIRMABLE_STATUSES).update(
+            status='confirmed', **fields)
+        if not updated:
+            return Response({'error': 'Order status has changed'}, status=status.HTTP_400_BAD_REQUEST)
 
         return Response({'orderId': order.id}, status=status.HTTP_200_OK)
 
@@ -269,16 +243,24 @@ class PaymentAPIView(APIView):
     permission_classes = [IsAuthenticated]
 
     def post(self, request: Request, pk) -> Response:
-        # Получаем заказ
-        order = get_object_or_404(Order, id=pk, user=request.user)
-
-        # Сериализуем данные и если они валидны, сохраняем в БД информацию по оплате заказа
-        serializer = PaymentSerializer(data=request.data)
-        if serializer.is_valid():
+        # Сначала проверяем владельца: резервы чужих заказов не блокируем
+        get_object_or_404(Order.objects.only('pk'), id=pk, user=request.user)
+        with transaction.atomic():
+            # Блокируем резервы, затем заказ (см. lock_reservations)
+            lock_reservations(pk)
+            order = Order.objects.select_for_update().get(id=pk)
+            if order.status not in PAYABLE_STATUSES:
+                error = 'Order reservation has expired' if order.status == 'expired' else f'Order is {order.status}'
+                return Response({'error': error}, status=status.HTTP_400_BAD_REQUEST)
+
+            # Сериализуем данные и если они валидны, сохраняем в БД информацию по оплате заказа
+            serializer = PaymentSerializer(data=request.data)
+            if not serializer.is_valid():
+                return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
             serializer.save(order=order)
 
             # Меняем статус заказа на "оплачен"
             order.status = 'paid'
-            order.save()
-            return Response(serializer.data, status=status.HTTP_200_OK)
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+            order.save(update_fields=['status'])
+            commit_reservations(order)
+        return Response(serializer.data, status=status.HTTP_200_OK)
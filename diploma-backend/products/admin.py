@@ -1,6 +1,9 @@
 from django.contrib import admin
 from django.db.models import QuerySet
 
+from .cache import bump_cache_version
+from .categories import get_children, get_subtree_filter
+from .facets import invalidate_facets
 from .models import Product, ProductImage, Specification, Category, Tag, Review, Sale
 
 
@@ -15,11 +18,16 @@ class SpecificationInline(admin.TabularInline):
 @admin.action(description='Mark deleted')
 def soft_delete(modeladmin: admin.ModelAdmin, request, queryset: QuerySet):
     queryset.update(is_deleted=True)
+    # update() не отправляет сигналы: закэшированные списки и фасеты сбрасываем явно
+    bump_cache_version()
+    invalidate_facets()
 
 
 @admin.action(description='Restore')
 def restore(modeladmin: admin.ModelAdmin, request, queryset: QuerySet):
     queryset.update(is_deleted=False)
+    bump_cache_version()
+    invalidate_facets()
 
 
 @admin.register(Category)
@@ -46,26 +54,23 @@ class CategoryWithSubcategoriesFilter(admin.SimpleListFilter):
 
     def lookups(self, request, model_admin):
         # Показываем только корневые категории
-        return [(c.id, c.title) for c in Category.objects.filter(parent__isnull=True)]
+        return [(row['id'], row['title']) for row in get_children(include_deleted=True)[None]]
 
     def queryset(self, request, queryset):
-        if self.value():
-            category_id = self.value()
-            # Получаем ID подкатегорий
-            subcategory_ids = Category.objects.filter(parent_id=category_id).values_list('id', flat=True)
-            # Включаем саму категорию + подкатегории
-            all_category_ids = [category_id] + list(subcategory_ids)
-            return queryset.filter(category_id__in=all_category_ids)
+        if self.value() and self.value().isdigit():
+            # Сама категория + подкатегории любой глубины
+            return queryset.filter(get_subtree_filter(int(self.value())))
         return queryset
 
 
 @admin.register(Product)
 class ProductAdmin(admin.ModelAdmin):
-    list_display = 'pk', 'title', 'category', 'price', 'count', 'description', 'freeDelivery', 'is_deleted'
+    list_display = 'pk', 'title', 'category', 'price', 'count', 'description', 'freeDelivery', 'rating', 'is_deleted'
     list_display_links = 'pk', 'title',
     list_filter = 'is_deleted', 'freeDelivery', CategoryWithSubcategoriesFilter, 'tags'
     search_fields = 'title', 'description'
     ordering = 'pk', 'title'
+    readonly_fields = 'rating', 'reviews_count', 'effective_price'   # пересчитываются по отзывам и скидкам
     actions = [soft_delete, restore]
     inlines = [ProductImageInline, SpecificationInline]
 
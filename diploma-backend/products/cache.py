@@ -0,0 +1,89 @@
+"""
+Кэш ответов read-only эндпоинтов товаров.
+
+Ответы хранятся в кэше Django (CACHES['default']) по ключу из версии, имени представления,
+параметров URL и нормализованных query-параметров. Версия увеличивается при любом изменении
+товаров, категорий, тегов, скидок, отзывов и изображений (см. signals.py), поэтому устаревшие
+записи просто перестают читаться и вытесняются по таймауту PRODUCTS_CACHE_TIMEOUT.
+С локальным кэшем (по умолчанию) версия своя в каждом процессе, поэтому при нескольких воркерах
+нужен общий кэш (DJANGO_REDIS_URL), иначе устаревание ограничено таймаутом.
+Каждый ответ получает ETag, и на If-None-Match с тем же значением возвращается 304 без тела.
+"""
+import hashlib
+import json
+import time
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework import status
+from rest_framework.request import Request
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+CACHE_VERSION_KEY = 'products:response-version'
+
+
+def get_cache_version() -> int:
+    """Текущая версия кэша ответов"""
+    version = cache.get(CACHE_VERSION_KEY)
+    if version is None:
+        # Версия вытеснена из кэша: начинаем с метки времени, чтобы не вернуться к старым записям
+        cache.add(CACHE_VERSION_KEY, int(time.time() * 1000), None)
+        version = cache.get(CACHE_VERSION_KEY)
+    return version
+
+
+def bump_cache_version():
+    """Делаем все закэшированные ответы устаревшими"""
+    try:
+        cache.incr(CACHE_VERSION_KEY)
+    except ValueError:
+        get_cache_version()
+
+
+def get_etag(data) -> str:
+    """ETag ответа по его JSON-представлению"""
+    content = json.dumps(data, cls=JSONEncoder, sort_keys=True, separators=(',', ':'))
+    return '"{}"'.format(hashlib.md5(content.encode()).hexdigest())
+
+
+class CachedResponseMixin:
+    """Кэширование ответа GET-запроса представления DRF с поддержкой ETag/If-None-Match"""
+    cache_timeout = None                  # по умолчанию PRODUCTS_CACHE_TIMEOUT
+
+    def get_cache_key(self, request: Request) -> str:
+        params = urlencode(sorted(
+            (key, value) for key, values in request.query_params.lists() for value in values
+        ))
+        kwargs = urlencode(sorted(self.kwargs.items()))
+        # Хост входит в ключ: ссылки на изображения строятся абсолютными по запросу
+        raw_key = f'{request.get_host()}/{type(self).__name__}?{kwargs}&{params}'
+        return 'products:response:{}:{}'.format(get_cache_version(), hashlib.md5(raw_key.encode()).hexdigest())
+
+    def get(self, request: Request, *args, **kwargs) -> Response:
+        cache_key = self.get_cache_key(request)
+        cached = cache.get(cache_key)
+        if cached is None:
+            response = super().get(request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            cached = (response.data, get_etag(response.data))
+            timeout = self.cache_timeout if self.cache_timeout is not None else settings.PRODUCTS_CACHE_TIMEOUT
+            cache.set(cache_key, cached, timeout)
+
+        data, etag = cached
+        if self.etag_matches(request, etag):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = Response(data, status=status.HTTP_200_OK)
+        response['ETag'] = etag
+        return response
+
+    @staticmethod
+    def etag_matches(request: Request, etag: str) -> bool:
+        header = request.headers.get('If-None-Match')
+        if not header:
+            return False
+        candidates = [value.strip().removeprefix('W/') for value in header.split(',')]
+        return '*' in candidates or etag in candidates
@@ -0,0 +1,251 @@
+"""
+Потоковый импорт и экспорт каталога товаров в CSV и JSONL (см. команды import_catalog и export_catalog).
+
+Одна запись - один товар:
+{"id": 1, "category": 7, "title": "...", "description": "...", "fullDescription": "...", "price": "120000.00",
+ "count": 10, "freeDelivery": true, "is_deleted": false, "tags": ["Sale"],
+ "specifications": [{"name": "...", "value": "..."}], "images": [{"src": "products/...png", "alt": ""}],
+ "sale": {"salePrice": "108000.00", "dateFrom": "2025-10-31", "dateTo": "2025-11-08"}}
+В CSV вложенные поля (tags, specifications, images, sale) записываются как JSON.
+Товары с id обновляются или создаются с этим id, без id - создаются.
+Вложенные данные товара заменяются целиком, если поле есть в записи, и не меняются, если его нет.
+"""
+import csv
+import json
+from decimal import Decimal, InvalidOperation
+from typing import Iterable, Iterator, List
+
+from django.core.management.color import no_style
+from django.db import connection, transaction
+
+from .cache import bump_cache_version
+from .facets import invalidate_facets
+from .models import Category, Product, ProductImage, Sale, Specification, Tag
+from .search import get_search_backend
+
+PRODUCT_FIELDS = ('category', 'title', 'description', 'fullDescription', 'price', 'count', 'freeDelivery',
+                  'is_deleted')
+NESTED_FIELDS = ('tags', 'specifications', 'images', 'sale')
+CSV_COLUMNS = ('id',) + PRODUCT_FIELDS + NESTED_FIELDS
+
+
+class CatalogRecordError(ValueError):
+    """Некорректная запись каталога; index - номер записи в пачке (с 0), если ошибка относится к одной записи"""
+
+    def __init__(self, message: str, index: int = None):
+        super().__init__(message)
+        self.index = index
+
+
+def read_records(file, file_format: str) -> Iterator[dict]:
+    """Читаем записи из открытого файла по одной"""
+    if file_format == 'jsonl':
+        for line in file:
+            if line.strip():
+                yield json.loads(line)
+    else:
+        for row in csv.DictReader(file):
+            record = {key: value for key, value in row.items() if value not in (None, '')}
+            for field in NESTED_FIELDS:
+                if field in record:
+                    record[field] = json.loads(record[field])
+            yield record
+
+
+def write_records(file, file_format: str, records: Iterable[dict]) -> int:
+    """Записываем записи в открытый файл, возвращаем их количество"""
+    written = 0
+    if file_format == 'jsonl':
+        for record in records:
+            file.write(json.dumps(record, ensure_ascii=False, default=str) + '\n')
+            written += 1
+    else:
+        writer = csv.DictWriter(file, fieldnames=CSV_COLUMNS)
+        writer.writeheader()
+        for record in records:
+            writer.writerow({
+                key: json.dumps(value, ensure_ascii=False, default=str) if key in NESTED_FIELDS else value
+                for key, value in record.items()
+            })
+            written += 1
+    return written
+
+
+def parse_bool(value) -> bool:
+    if isinstance(value, str):
+        return value.strip().lower() in ('1', 'true', 'yes')
+    return bool(value)
+
+
+def build_product(record: dict) -> Product:
+    """Товар из записи каталога"""
+    try:
+        return Product(
+            id=int(record['id']) if record.get('id') not in (None, '') else None,
+            category_id=int(record['category']),
+            title=record['title'],
+            description=record.get('description', ''),
+            fullDescription=record.get('fullDescription', ''),
+            price=Decimal(str(record.get('price', 0))),
+            count=int(record.get('count', 0)),
+            freeDelivery=parse_bool(record.get('freeDelivery', False)),
+            is_deleted=parse_bool(record.get('is_deleted', False)),
+        )
+    except (KeyError, TypeError, ValueError, InvalidOperation) as exp:
+        raise CatalogRecordError(f'{type(exp).__name__}: {exp}')
+
+
+def get_tag_ids(names: Iterable[str]) -> dict:
+    """id тегов по названиям, недостающие теги создаются"""
+    names = set(names)
+    if not names:
+        return {}
+    Tag.objects.bulk_create([Tag(name=name) for name in names], ignore_conflicts=True)
+    return dict(Tag.objects.filter(name__in=names).values_list('name', 'id'))
+
+
+@transaction.atomic
+def import_batch(records: List[dict]) -> int:
+    """
+    Сохраняем пачку записей в одной транзакции:
+    товары - одним upsert (INSERT ... ON CONFLICT (id) DO UPDATE), вложенные данные - удалением и bulk_create
+    """
+    products = []
+    for index, record in enumerate(records):
+        try:
+            products.append(build_product(record))
+        except CatalogRecordError as exp:
+            raise CatalogRecordError(str(exp), index)
+
+    # Ошибку внешнего ключа категории БД сообщила бы только для всей пачки - проверяем заранее
+    category_ids = set(Category.objects.filter(
+        pk__in={product.category_id for product in products}).values_list('pk', flat=True))
+    for index, product in enumerate(products):
+        if product.category_id not in category_ids:
+            raise CatalogRecordError(f'Unknown category {product.category_id}', index)
+
+    existing_id_products = [product for product in products if product.id is not None]
+    if existing_id_products:
+        Product.objects.bulk_create(
+            existing_id_products,
+            update_conflicts=True,
+            unique_fields=['id'],
+            update_fields=list(field if field != 'category' else 'category_id' for field in PRODUCT_FIELDS),
+        )
+        # Иначе товары без id (в этой же пачке или дальше) получат id, уже занятые вставленными явно
+        reset_product_sequence()
+    Product.objects.bulk_create([product for product in products if product.id is None])
+
+    def replaced(field):
+        return [(product, record[field]) for product, record in zip(products, records) if field in record]
+
+    tags = replaced('tags')
+    if tags:
+        tag_ids = get_tag_ids(name for _, names in tags for name in names)
+        Product.tags.through.objects.filter(product__in=[product.pk for product, _ in tags]).delete()
+        Product.tags.through.objects.bulk_create([
+            Product.tags.through(product_id=product.pk, tag_id=tag_ids[name])
+            for product, names in tags for name in set(names)
+        ])
+
+    specifications = replaced('specifications')
+    if specifications:
+        Specification.objects.filter(product__in=[product.pk for product, _ in specifications]).delete()
+        Specification.objects.bulk_create([
+            Specification(product_id=product.pk, name=item['name'], value=item['value'])
+            for product, items in specifications for item in items
+        ])
+
+    images = replaced('images')
+    if images:
+        # django_cleanup удаляет файл вместе с записью, поэтому изображения с тем же файлом оставляем
+        wanted = {(product.pk, item['src']): item.get('alt', '') for product, items in images for item in items}
+        existing = {}
+        for image in ProductImage.objects.filter(product__in=[product.pk for product, _ in images]):
+            key = (image.product_id, image.src.name)
+            if key in wanted and key not in existing:
+                existing[key] = image
+            else:
+                image.delete()
+        changed = []
+        for key, image in existing.items():
+            if image.alt != wanted[key]:
+                image.alt = wanted[key]
+                changed.append(image)
+        ProductImage.objects.bulk_update(changed, ['alt'])
+        ProductImage.objects.bulk_create([
+            ProductImage(product_id=product_id, src=src, alt=alt)
+            for (product_id, src), alt in wanted.items() if (product_id, src) not in existing
+        ])
+
+    sales = replaced('sale')
+    if sales:
+        Sale.objects.filter(product__in=[product.pk for product, _ in sales]).delete()
+        Sale.objects.bulk_create([
+            Sale(product_id=product.pk, salePrice=Decimal(str(sale['salePrice'])),
+                 dateFrom=sale['dateFrom'], dateTo=sale['dateTo'])
+            for product, sale in sales if sale
+        ])
+
+    # bulk-операции не отправляют сигналы: пересчитываем текущие цены, обновляем поисковый индекс,
+    # кэши сбрасываются в finish_import
+    Product.objects.filter(pk__in=[product.pk for product in products]).refresh_effective_price()
+    get_search_backend().index(products)
+    return len(products)
+
+
+def reset_product_sequence():
+    """Продолжаем последовательность id товаров после наибольшего id (нужно в PostgreSQL)"""
+    with connection.cursor() as cursor:
+        for sql in connection.ops.sequence_reset_sql(no_style(), [Product]):
+            cursor.execute(sql)
+
+
+def finish_import():
+    """Действия после импорта: сброс кэшей"""
+    bump_cache_version()
+    invalidate_facets()
+
+
+def export_records(batch_size: int = 1000) -> Iterator[dict]:
+    """Записи каталога по товарам в порядке id, пачками по batch_size"""
+    last_id = 0
+    while True:
+        products = list(Product.objects.filter(pk__gt=last_id).order_by('pk').values('id', *(
+            field if field != 'category' else 'category_id' for field in PRODUCT_FIELDS))[:batch_size])
+        if not products:
+            return
+        ids = [product['id'] for product in products]
+
+        tags, specifications, images, sales = {}, {}, {}, {}
+        for product_id, name in Product.tags.through.objects.filter(
+                product__in=ids).order_by('product_id', 'tag_id').values_list('product_id', 'tag__name'):
+            tags.setdefault(product_id, []).append(name)
+        for product_id, name, value in Specification.objects.filter(
+                product__in=ids).order_by('pk').values_list('product_id', 'name', 'value'):
+            specifications.setdefault(product_id, []).append({'name': name, 'value': value})
+        for product_id, src, alt in ProductImage.objects.filter(
+                product__in=ids).order_by('pk').values_list('product_id', 'src', 'alt'):
+            images.setdefault(product_id, []).append({'src': src, 'alt': alt})
+        for product_id, sale_price, date_from, date_to in Sale.objects.filter(
+                product__in=ids).values_list('product_id', 'salePrice', 'dateFrom', 'dateTo'):
+            sales[product_id] = {'salePrice': str(sale_price), 'dateFrom': str(date_from), 'dateTo': str(date_to)}
+
+        for product in products:
+            product_id = product['id']
+            yield {
+                'id': product_id,
+                'category': product['category_id'],
+                'title': product['title'],
+                'description': product['description'],
+                'fullDescription': product['fullDescription'],
+                'price': str(product['price']),
+                'count': product['count'],
+                'freeDelivery': product['freeDelivery'],
+                'is_deleted': product['is_deleted'],
+                'tags': tags.get(product_id, []),
+                'specifications': specifications.get(product_id, []),
+                'images': images.get(product_id, []),
+                'sale': sales.get(product_id),
+            }
+        last_id = ids[-1]
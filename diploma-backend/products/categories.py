@@ -0,0 +1,88 @@
+"""
+Дерево категорий, собранное в памяти из одного запроса всех категорий.
+Строки категорий кэшируются и сбрасываются при изменении категорий (см. signals.py)
+"""
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+from django.core.cache import cache
+from django.db.models import Q
+
+from .models import Category, subtree_filter
+
+CATEGORY_ROWS_CACHE_KEY = 'products:category-rows'
+CATEGORY_ROWS_CACHE_TIMEOUT = 60 * 60
+
+
+def get_category_rows() -> List[dict]:
+    """Все категории (id, title, image, parent_id, is_deleted, path) в порядке id"""
+    rows = cache.get(CATEGORY_ROWS_CACHE_KEY)
+    if rows is None:
+        rows = list(Category.objects.order_by('pk').values(
+            'id', 'title', 'image', 'parent_id', 'is_deleted', 'path'))
+        cache.set(CATEGORY_ROWS_CACHE_KEY, rows, CATEGORY_ROWS_CACHE_TIMEOUT)
+    return rows
+
+
+def invalidate_category_tree():
+    """Сбрасываем кэшированные строки категорий"""
+    cache.delete(CATEGORY_ROWS_CACHE_KEY)
+
+
+def get_children(include_deleted: bool = False) -> Dict[int, List[dict]]:
+    """Строки категорий, сгруппированные по id родителя (None - корневые)"""
+    children = defaultdict(list)
+    for row in get_category_rows():
+        if include_deleted or not row['is_deleted']:
+            children[row['parent_id']].append(row)
+    return children
+
+
+def get_category_tree() -> List[dict]:
+    """
+    Дерево неудалённых категорий любой глубины в формате CategorySerializer:
+    подкатегории удалённой категории в дерево не попадают
+    """
+    storage = Category._meta.get_field('image').storage
+    children = get_children()
+
+    def build(parent_id):
+        return [
+            {
+                'id': row['id'],
+                'title': row['title'],
+                'image': {
+                    'src': storage.url(row['image']) if row['image'] else None,
+                    'alt': row['title'],
+                },
+                'subcategories': build(row['id']),
+            }
+            for row in children[parent_id]
+        ]
+
+    return build(None)
+
+
+def get_category_path(category_id: int) -> Optional[str]:
+    """Материализованный путь категории по кэшированным строкам"""
+    for row in get_category_rows():
+        if row['id'] == category_id:
+            return row['path']
+    return None
+
+
+def get_subtree_filter(category_id: int, field: str = 'category__path') -> Q:
+    """Условие на товары (по умолчанию) категории и всех её подкатегорий любой глубины"""
+    path = get_category_path(category_id)
+    if not path:
+        return Q(pk__in=[])
+    return subtree_filter(path, field)
+
+
+def get_descendant_ids(category_id: int, include_deleted: bool = True) -> List[int]:
+    """id категории и всех её подкатегорий любой глубины"""
+    children = get_children(include_deleted)
+    ids = [category_id]
+    for parent_id in ids:
+        ids.extend(row['id'] for row in children[parent_id])
+    return ids
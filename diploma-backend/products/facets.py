@@ -0,0 +1,96 @@
+"""
+Фасеты каталога: количество товаров по категориям и тегам, диапазон цен,
+количество товаров с бесплатной доставкой и в наличии.
+Считаются двумя сгруппированными запросами: по категориям и по тегам.
+Сводка по всем категориям кэшируется и сбрасывается при изменении товаров и тегов (см. signals.py)
+"""
+from collections import defaultdict
+
+from django.core.cache import cache
+from django.db.models import Count, Max, Min, Q, QuerySet
+
+from .categories import get_descendant_ids
+from .models import Product
+
+FACETS_CACHE_KEY = 'products:catalog-facets'
+FACETS_CACHE_TIMEOUT = 60 * 5
+
+
+def _category_rows(queryset: QuerySet) -> QuerySet:
+    """Количество товаров, диапазон цен, бесплатная доставка и наличие по категориям"""
+    return queryset.order_by().values('category').annotate(
+        products_count=Count('id', distinct=True),
+        min_price=Min('effective_price'),
+        max_price=Max('effective_price'),
+        free_delivery=Count('id', filter=Q(freeDelivery=True), distinct=True),
+        available=Count('id', filter=Q(count__gt=0), distinct=True),
+    ).order_by('category')
+
+
+def _tag_rows(products: QuerySet, *group_by: str) -> QuerySet:
+    """Количество товаров по тегам"""
+    return Product.tags.through.objects.filter(
+        product__in=products.order_by().values('pk')
+    ).values(*group_by, 'tag', 'tag__name').annotate(
+        products_count=Count('product', distinct=True)
+    ).order_by('tag')
+
+
+def _build_facets(category_rows, tag_counts: dict) -> dict:
+    """Собираем ответ из строк по категориям и словаря {id тега: (название, количество)}"""
+    min_prices = [row['min_price'] for row in category_rows if row['min_price'] is not None]
+    max_prices = [row['max_price'] for row in category_rows if row['max_price'] is not None]
+    return {
+        'count': sum(row['products_count'] for row in category_rows),
+        'categories': [{'id': row['category'], 'count': row['products_count']} for row in category_rows],
+        'tags': [
+            {'id': tag_id, 'name': name, 'count': count}
+            for tag_id, (name, count) in sorted(tag_counts.items())
+        ],
+        'price': {
+            'min': f'{min(min_prices):.2f}' if min_prices else None,
+            'max': f'{max(max_prices):.2f}' if max_prices else None,
+        },
+        'freeDelivery': sum(row['free_delivery'] for row in category_rows),
+        'available': sum(row['available'] for row in category_rows),
+    }
+
+
+def compute_facets(queryset: QuerySet) -> dict:
+    """Считаем фасеты для отфильтрованного набора товаров"""
+    tag_counts = {row['tag']: (row['tag__name'], row['products_count']) for row in _tag_rows(queryset)}
+    return _build_facets(list(_category_rows(queryset)), tag_counts)
+
+
+def get_category_summary() -> dict:
+    """
+    Сводка фасетов по всем категориям из кэша:
+    {id категории: (строка по категории, {id тега: (название, количество)})}
+    """
+    summary = cache.get(FACETS_CACHE_KEY)
+    if summary is None:
+        products = Product.objects.visible()
+        tags = defaultdict(dict)
+        for row in _tag_rows(products, 'product__category'):
+            tags[row['product__category']][row['tag']] = (row['tag__name'], row['products_count'])
+        summary = {row['category']: (row, tags[row['category']]) for row in _category_rows(products)}
+        cache.set(FACETS_CACHE_KEY, summary, FACETS_CACHE_TIMEOUT)
+    return summary
+
+
+def get_category_facets(category_id: int = None) -> dict:
+    """Фасеты всего каталога или категории вместе с подкатегориями по кэшированной сводке"""
+    summary = get_category_summary()
+    if category_id is not None:
+        summary = {pk: summary[pk] for pk in sorted(get_descendant_ids(category_id)) if pk in summary}
+
+    tag_counts = {}
+    for _, category_tags in summary.values():
+        for tag_id, (name, count) in category_tags.items():
+            tag_counts[tag_id] = (name, tag_counts.get(tag_id, (name, 0))[1] + count)
+    return _build_facets([row for row, _ in summary.values()], tag_counts)
+
+
+def invalidate_facets():
+    """Сбрасываем кэшированную сводку фасетов"""
+    cache.delete(FACETS_CACHE_KEY)
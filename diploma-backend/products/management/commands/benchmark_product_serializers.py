@@ -0,0 +1,53 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory
+
+from products.models import Product
+from products.serializers import PRODUCT_SHORT_VALUES, ProductShortSerializer, ProductShortReadSerializer
+
+
+class Command(BaseCommand):
+    """Сравнить время сериализации списков товаров ProductShortSerializer и ProductShortReadSerializer"""
+    help = 'Benchmark ProductShortSerializer against ProductShortReadSerializer on product lists'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[20, 100], help='List sizes')
+        parser.add_argument('--repeat', type=int, default=50, help='Runs per list size and serializer')
+
+    def handle(self, *args, **options):
+        context = {'request': APIRequestFactory().get('/api/catalog', HTTP_HOST='127.0.0.1')}
+        renderer = JSONRenderer()
+
+        def model_serializer(size):
+            products = Product.objects.prefetch_related('images', 'tags').order_by('-date', '-id')[:size]
+            return renderer.render(ProductShortSerializer(products, many=True, context=context).data)
+
+        def read_serializer(size):
+            rows = Product.objects.order_by('-date', '-id').values(*PRODUCT_SHORT_VALUES)[:size]
+            return renderer.render(ProductShortReadSerializer(rows, many=True, context=context).data)
+
+        for size in options['sizes']:
+            available = Product.objects.count()
+            if available < size:
+                raise CommandError(f'Need at least {size} products, database has {available}')
+            if model_serializer(size) != read_serializer(size):
+                raise CommandError(f'Serializers produce different JSON for {size} products')
+
+            results = {}
+            for name, serialize in (('ProductShortSerializer', model_serializer),
+                                    ('ProductShortReadSerializer', read_serializer)):
+                timings = []
+                for _ in range(options['repeat']):
+                    started = time.perf_counter()
+                    serialize(size)
+                    timings.append((time.perf_counter() - started) * 1000)
+                timings.sort()
+                results[name] = timings[len(timings) // 2]
+                self.stdout.write(
+                    f'{size:>5} items  {name:<28} median {results[name]:8.2f} ms  '
+                    f'p95 {timings[int(len(timings) * 0.95) - 1]:8.2f} ms'
+                )
+            speedup = results['ProductShortSerializer'] / results['ProductShortReadSerializer']
+            self.stdout.write(self.style.SUCCESS(f'{size:>5} items  speedup x{speedup:.1f}'))
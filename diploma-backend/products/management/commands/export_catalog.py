@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from products.catalog_io import export_records, write_records
+
+
+class Command(BaseCommand):
+    """Потоковый экспорт каталога в CSV или JSONL"""
+    help = 'Export products with tags, specifications, images and sales to a CSV or JSONL file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='File to write')
+        parser.add_argument('--format', choices=('jsonl', 'csv'), help='File format (by extension by default)')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Products per query')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or ('csv' if path.endswith('.csv') else 'jsonl')
+
+        started = time.monotonic()
+        with open(path, 'w', newline='', encoding='utf-8') as file:
+            exported = write_records(file, file_format, export_records(options['batch_size']))
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Exported {exported} records in {elapsed:.1f}s ({exported / max(elapsed, 1e-6):.0f} records/s)'
+        ))
@@ -0,0 +1,61 @@
+import json
+import os
+import time
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError
+
+from products.catalog_io import CatalogRecordError, finish_import, import_batch, read_records
+
+
+class Command(BaseCommand):
+    """Потоковый импорт каталога из CSV или JSONL пачками, с возможностью продолжить прерванный импорт"""
+    help = 'Import products with tags, specifications, images and sales from a CSV or JSONL file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='File to import')
+        parser.add_argument('--format', choices=('jsonl', 'csv'), help='File format (by extension by default)')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Records per transaction')
+        parser.add_argument('--resume', action='store_true', help='Skip records imported before an interruption')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or ('csv' if path.endswith('.csv') else 'jsonl')
+        batch_size = options['batch_size']
+        checkpoint_path = f'{path}.checkpoint'
+
+        # В файле отметки хранится количество записей, сохранённых до прерывания импорта
+        done = 0
+        if options['resume'] and os.path.exists(checkpoint_path):
+            with open(checkpoint_path) as checkpoint:
+                done = json.load(checkpoint)['records']
+            self.stdout.write(f'Resuming after {done} records')
+
+        started = time.monotonic()
+        imported = 0
+        with open(path, newline='', encoding='utf-8') as file:
+            records = islice(read_records(file, file_format), done, None)
+            while True:
+                batch = list(islice(records, batch_size))
+                if not batch:
+                    break
+                first = done + imported + 1
+                try:
+                    imported += import_batch(batch)
+                except CatalogRecordError as exp:
+                    if exp.index is None:
+                        raise CommandError(f'Batch starting at record {first}: {exp}')
+                    raise CommandError(f'Record {first + exp.index}: {exp}')
+                except (IntegrityError, KeyError, ValueError) as exp:
+                    raise CommandError(f'Batch starting at record {first}: {exp}')
+                with open(checkpoint_path, 'w') as checkpoint:
+                    json.dump({'records': done + imported}, checkpoint)
+                elapsed = time.monotonic() - started
+                self.stdout.write(f'{done + imported} records, {imported / elapsed:.0f} records/s')
+
+        finish_import()
+        if os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(f'Imported {imported} records in {elapsed:.1f}s'))
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from products.models import Product
+
+
+class Command(BaseCommand):
+    """Пересчитать сохранённые рейтинг и количество отзывов всех товаров"""
+    help = 'Rebuild stored rating and reviews_count of products from reviews'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000, help='Products per UPDATE statement')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        product_ids = Product.objects.order_by('pk').values_list('pk', flat=True)
+
+        updated = 0
+        last_id = 0
+        while True:
+            # Обрабатываем товары диапазонами первичного ключа, чтобы не держать длинную транзакцию
+            batch = list(product_ids.filter(pk__gt=last_id)[:batch_size])
+            if not batch:
+                break
+            with transaction.atomic():
+                updated += Product.objects.filter(pk__gte=batch[0], pk__lte=batch[-1]).refresh_rating()
+            last_id = batch[-1]
+
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt rating of {updated} products'))
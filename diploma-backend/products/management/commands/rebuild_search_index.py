@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from products.search import get_search_backend
+
+
+class Command(BaseCommand):
+    """Перестроить индекс полнотекстового поиска товаров"""
+    help = 'Rebuild the product full-text search index'
+
+    def handle(self, *args, **options):
+        backend = get_search_backend()
+        indexed = backend.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'{type(backend).__name__}: indexed {indexed} products'))
@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from products.cache import bump_cache_version
+from products.facets import invalidate_facets
+from products.models import Product
+
+
+class Command(BaseCommand):
+    """Пересчитать текущие цены товаров с учётом скидок, действующих на сегодня"""
+    help = 'Recompute stored effective prices of products from active sales'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--every', type=int, default=0,
+                            help='Run as a worker: refresh every N seconds')
+
+    def handle(self, *args, **options):
+        while True:
+            # Скидки начинаются и заканчиваются по датам, поэтому команду достаточно запускать после полуночи
+            updated = Product.objects.refresh_effective_price()
+            if updated:
+                invalidate_facets()
+                bump_cache_version()
+            self.stdout.write(self.style.SUCCESS(f'Effective prices changed for {updated} products'))
+            if not options['every']:
+                break
+            time.sleep(options['every'])
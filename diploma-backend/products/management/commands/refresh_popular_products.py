@@ -0,0 +1,25 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from products.popular import refresh_popular_products
+
+
+class Command(BaseCommand):
+    """Пересчитать рейтинг популярных товаров"""
+    help = 'Recompute the stored popular products ranking'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=settings.POPULAR_PRODUCTS_LIMIT,
+                            help='Number of products to keep in the ranking')
+        parser.add_argument('--every', type=int, default=0,
+                            help='Run as a worker: refresh every N seconds')
+
+    def handle(self, *args, **options):
+        while True:
+            count = refresh_popular_products(options['limit'])
+            self.stdout.write(self.style.SUCCESS(f'Popular products ranking refreshed: {count} products'))
+            if not options['every']:
+                break
+            time.sleep(options['every'])
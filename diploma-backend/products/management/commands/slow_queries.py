@@ -0,0 +1,39 @@
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from megano.slow_queries import aggregate, read_log
+
+
+class Command(BaseCommand):
+    """Отпечатки медленных SQL-запросов с наибольшим суммарным временем по журналу SLOW_QUERY_LOG_PATH"""
+    help = 'Show the slow query fingerprints with the largest total time'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=10, help='Number of fingerprints to show')
+        parser.add_argument('--log', help='Slow query log (SLOW_QUERY_LOG_PATH by default)')
+        parser.add_argument('--fingerprint', help='Show only this fingerprint')
+        parser.add_argument('--plans', action='store_true', help='Show the latest EXPLAIN plan')
+
+    def handle(self, *args, **options):
+        stats = aggregate(read_log(Path(options['log'] or settings.SLOW_QUERY_LOG_PATH)))
+        if options['fingerprint']:
+            stats = [item for item in stats if item.fingerprint == options['fingerprint']]
+        if not stats:
+            self.stdout.write('No slow queries logged')
+            return
+
+        for item in stats[:options['top']]:
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                f'{item.fingerprint}  total {item.total_ms:10.1f} ms  count {item.count:6}  '
+                f'mean {item.mean_ms:8.1f} ms  max {item.max_ms:8.1f} ms'
+            ))
+            self.stdout.write(f'  {item.sql}')
+            for call_site in item.call_sites[:3]:
+                self.stdout.write(f'  at {call_site}')
+            if options['plans']:
+                self.stdout.write('  plan:' if item.plan else '  plan: not captured')
+                for line in (item.plan or '').splitlines():
+                    self.stdout.write(f'    {line}')
+            self.stdout.write('')
@@ -0,0 +1,45 @@
+# Generated by Django 4.2.28 on 2026-10-17 18:26
+
+from django.db import migrations, models
+from django.db.models import Avg, Count, OuterRef, Subquery, Value
+from django.db.models.functions import Cast, Coalesce, Round
+
+
+def fill_product_rating(apps, schema_editor):
+    Product = apps.get_model('products', 'Product')
+    Review = apps.get_model('products', 'Review')
+
+    reviews = Review.objects.filter(product=OuterRef('pk')).order_by().values('product')
+    rating_field = models.DecimalField(max_digits=3, decimal_places=2)
+    Product.objects.update(
+        rating=Coalesce(
+            Cast(Round(Subquery(reviews.annotate(value=Avg('rate')).values('value')), 2), rating_field),
+            Value(0),
+            output_field=rating_field,
+        ),
+        reviews_count=Coalesce(Subquery(reviews.annotate(value=Count('id')).values('value')), Value(0)),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='rating',
+            field=models.DecimalField(db_index=True, decimal_places=2, default=0, max_digits=3),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='reviews_count',
+            field=models.PositiveIntegerField(db_index=True, default=0),
+        ),
+        migrations.RunPython(
+            fill_product_rating,
+            reverse_code=migrations.RunPython.noop,
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 4.2.28 on 2026-10-17 18:27
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0002_product_rating_reviews_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PopularProduct',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('position', models.PositiveSmallIntegerField(unique=True)),
+                ('score', models.DecimalField(decimal_places=2, max_digits=3)),
+                ('refreshed_at', models.DateTimeField(db_index=True)),
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='popularity', to='products.product')),
+            ],
+            options={
+                'ordering': ('position',),
+            },
+        ),
+    ]
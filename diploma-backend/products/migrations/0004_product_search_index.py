@@ -0,0 +1,45 @@
+from django.db import migrations
+
+SQLITE_TABLE = 'products_product_fts'
+POSTGRES_INDEX = 'products_product_search_idx'
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute(
+            f'CREATE VIRTUAL TABLE IF NOT EXISTS {SQLITE_TABLE} '
+            f'USING fts5(title, description, fullDescription, tokenize="unicode61 remove_diacritics 2")'
+        )
+        schema_editor.execute(
+            f'INSERT INTO {SQLITE_TABLE} (rowid, title, description, fullDescription) '
+            f'SELECT id, title, description, "fullDescription" FROM products_product'
+        )
+    elif vendor == 'postgresql':
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS {POSTGRES_INDEX} ON products_product USING GIN ('
+            f"(to_tsvector('simple'::regconfig, coalesce(title, '') || ' ' || coalesce(description, '') || ' ' || "
+            f"coalesce(\"fullDescription\", ''))))"
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute(f'DROP TABLE IF EXISTS {SQLITE_TABLE}')
+    elif vendor == 'postgresql':
+        schema_editor.execute(f'DROP INDEX IF EXISTS {POSTGRES_INDEX}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0003_popularproduct'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            create_search_index,
+            reverse_code=drop_search_index,
+        ),
+    ]
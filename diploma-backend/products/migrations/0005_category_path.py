@@ -0,0 +1,43 @@
+# Generated by Django 4.2.28 on 2026-10-17 18:34
+
+from django.db import migrations, models
+
+
+def fill_category_paths(apps, schema_editor):
+    Category = apps.get_model('products', 'Category')
+    parents = dict(Category.objects.values_list('pk', 'parent_id'))
+    paths = {}
+
+    def build_path(pk):
+        if pk not in paths:
+            parent_id = parents[pk]
+            paths[pk] = (build_path(parent_id) if parent_id else '/') + f'{pk}/'
+        return paths[pk]
+
+    categories = list(Category.objects.all())
+    for category in categories:
+        category.path = build_path(category.pk)
+    Category.objects.bulk_update(categories, ['path'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0004_product_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='path',
+            field=models.CharField(blank=True, editable=False, max_length=255),
+        ),
+        migrations.RunPython(
+            fill_category_paths,
+            reverse_code=migrations.RunPython.noop,
+        ),
+        migrations.AddIndex(
+            model_name='category',
+            index=models.Index(fields=['path'], name='products_category_path_idx', opclasses=['varchar_pattern_ops']),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 4.2.28 on 2026-10-17 18:42
+
+from django.db import migrations, models
+from django.db.models import F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+
+def fill_effective_price(apps, schema_editor):
+    Product = apps.get_model('products', 'Product')
+    Sale = apps.get_model('products', 'Sale')
+
+    today = timezone.localdate()
+    sale_price = Sale.objects.filter(
+        product=OuterRef('pk'), dateFrom__lte=today, dateTo__gte=today,
+    ).values('salePrice')[:1]
+    Product.objects.update(effective_price=Coalesce(
+        Subquery(sale_price), F('price'), output_field=models.DecimalField(max_digits=10, decimal_places=2),
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0005_category_path'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='effective_price',
+            field=models.DecimalField(db_index=True, decimal_places=2, default=0, max_digits=10),
+        ),
+        migrations.RunPython(
+            fill_effective_price,
+            reverse_code=migrations.RunPython.noop,
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 4.2.28 on 2026-10-17 18:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0006_product_effective_price'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['category', 'effective_price'], name='products_live_cat_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['date', 'id'], name='products_live_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['effective_price', 'id'], name='products_live_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['rating', 'id'], name='products_live_rating_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('count__gt', 0), ('is_deleted', False)), fields=['count'], name='products_in_stock_count_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['product', 'rate'], name='products_review_rate_idx'),
+        ),
+    ]
@@ -1,4 +1,8 @@
-from django.db import models
+from django.core.exceptions import ValidationError
+from django.db import connection, models
+from django.db.models import Avg, Count, DecimalField, F, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Cast, Coalesce, Concat, Round, Substr
+from django.utils import timezone
 
 
 def category_image_directory_path(instance: 'Category', filename: str) -> str:
@@ -10,7 +14,11 @@ def category_image_directory_path(instance: 'Category', filename: str) -> str:
 
 
 class Category(models.Model):
-    """Модель Category представляет собой категорию товаров"""
+    """
+    Модель Category представляет собой категорию товаров
+    path - материализованный путь из id предков и самой категории ('/1/5/12/'),
+    по нему подкатегории любой глубины выбираются одним индексируемым условием (см. subtree_filter)
+    """
     title = models.CharField(max_length=100)
     image = models.ImageField(upload_to=category_image_directory_path, null=True, blank=True)
     parent = models.ForeignKey(
@@ -21,13 +29,61 @@ class Category(models.Model):
             related_name='subcategories'
         )
     is_deleted = models.BooleanField(default=False, db_index=True)   # для мягкого удаления
+    path = models.CharField(max_length=255, blank=True, editable=False)
 
     class Meta:
         verbose_name_plural = "Categories"                           # множественное число названия модели
+        indexes = [
+            # varchar_pattern_ops - для LIKE 'path%' в PostgreSQL, остальные БД создают обычный индекс
+            models.Index(fields=['path'], name='products_category_path_idx', opclasses=['varchar_pattern_ops']),
+        ]
 
     def __str__(self):
         return self.title
 
+    def clean(self):
+        """Категорию нельзя переместить в саму себя или в свою подкатегорию"""
+        if self.pk is not None and self.parent_id is not None:
+            parent_path = Category.objects.filter(pk=self.parent_id).values_list('path', flat=True).first() or ''
+            if f'/{self.pk}/' in parent_path or self.parent_id == self.pk:
+                raise ValidationError({'parent': 'Category cannot be moved into itself or its subcategory'})
+
+    def save(self, *args, **kwargs):
+        """Сохраняем категорию и обновляем материализованные пути её и всех подкатегорий при перемещении"""
+        if self.pk is None:
+            # Путь включает id, поэтому новая категория получает его после вставки
+            super().save(*args, **kwargs)
+            self.path = self.build_path()
+            Category.objects.filter(pk=self.pk).update(path=self.path)
+            return
+
+        old_path = self.path
+        self.path = self.build_path()
+        super().save(*args, **kwargs)
+        if old_path and old_path != self.path:
+            # Переносим поддерево: заменяем старый префикс пути подкатегорий на новый
+            Category.objects.filter(subtree_filter(old_path)).exclude(pk=self.pk).update(
+                path=Concat(Value(self.path), Substr('path', len(old_path) + 1))
+            )
+
+    def build_path(self) -> str:
+        """Путь категории по пути родителя"""
+        parent_path = '/'
+        if self.parent_id is not None:
+            parent_path = Category.objects.filter(pk=self.parent_id).values_list('path', flat=True).first() or '/'
+        return f'{parent_path}{self.pk}/'
+
+
+def subtree_filter(path: str, field: str = 'path') -> Q:
+    """
+    Условие на путь категории и всех её подкатегорий (все их пути начинаются с path).
+    В SQLite LIKE регистронезависим и не использует индекс, поэтому - диапазон путей;
+    в остальных БД - LIKE 'path%' по индексу с varchar_pattern_ops
+    """
+    if connection.vendor == 'sqlite':
+        return Q(**{f'{field}__range': (path, path + '\uffff')})
+    return Q(**{f'{field}__startswith': path})
+
 
 class Tag(models.Model):
     """Модель Tag представляет собой тег"""
@@ -37,8 +93,53 @@ class Tag(models.Model):
         return self.name
 
 
+class ProductQuerySet(models.QuerySet):
+    """QuerySet товаров"""
+
+    def refresh_rating(self) -> int:
+        """
+        Пересчитываем сохранённые рейтинг и количество отзывов товаров одним UPDATE
+        по коррелированным подзапросам к отзывам
+        """
+        reviews = Review.objects.filter(product=OuterRef('pk')).order_by().values('product')
+        average_rate = reviews.annotate(value=Avg('rate')).values('value')
+        reviews_count = reviews.annotate(value=Count('id')).values('value')
+        return self.update(
+            rating=Coalesce(
+                Cast(Round(Subquery(average_rate), 2), DecimalField(max_digits=3, decimal_places=2)),
+                Value(0),
+                output_field=DecimalField(max_digits=3, decimal_places=2),
+            ),
+            reviews_count=Coalesce(Subquery(reviews_count), Value(0)),
+        )
+
+    def refresh_effective_price(self, today=None) -> int:
+        """
+        Пересчитываем сохранённую текущую цену товаров: цена действующей на дату скидки или обычная цена.
+        Обновляем одним UPDATE только товары, у которых цена изменилась, и возвращаем их количество
+        """
+        today = today or timezone.localdate()
+        sale_price = Sale.objects.filter(
+            product=OuterRef('pk'), dateFrom__lte=today, dateTo__gte=today,
+        ).values('salePrice')[:1]
+        effective_price = Coalesce(
+            Subquery(sale_price), F('price'), output_field=DecimalField(max_digits=10, decimal_places=2),
+        )
+        return self.exclude(effective_price=effective_price).update(effective_price=effective_price)
+
+    def visible(self) -> 'ProductQuerySet':
+        """Товары, которые показываются покупателям (не удалённые)"""
+        return self.filter(is_deleted=False)
+
+
 class Product(models.Model):
-    """Модель Product представляет собой товар"""
+    """
+    Модель Product представляет собой товар
+    rating, reviews_count - средняя оценка и количество отзывов,
+    пересчитываются при изменении отзывов (см. signals.py)
+    effective_price - текущая цена с учётом действующей скидки, пересчитывается при изменении товара
+    и скидки и на границах дат скидок командой refresh_effective_prices
+    """
     category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='products')
     title = models.CharField(max_length=150, db_index=True)
     description = models.TextField(null=False, blank=True)
@@ -49,6 +150,25 @@ class Product(models.Model):
     date = models.DateTimeField(auto_now_add=True, db_index=True)
     tags = models.ManyToManyField(Tag, blank=True, related_name='products')
     is_deleted = models.BooleanField(default=False, db_index=True)
+    rating = models.DecimalField(default=0, max_digits=3, decimal_places=2, db_index=True)
+    reviews_count = models.PositiveIntegerField(default=0, db_index=True)
+    effective_price = models.DecimalField(default=0, max_digits=10, decimal_places=2, db_index=True)
+
+    objects = ProductQuerySet.as_manager()
+
+    class Meta:
+        # Составные и частичные индексы под запросы витрины: каталог фильтрует неудалённые товары
+        # по категории и цене и сортирует по дате, цене или рейтингу с id, лимитированные товары - по остатку
+        indexes = [
+            models.Index(fields=['category', 'effective_price'], condition=Q(is_deleted=False),
+                         name='products_live_cat_price_idx'),
+            models.Index(fields=['date', 'id'], condition=Q(is_deleted=False), name='products_live_date_idx'),
+            models.Index(fields=['effective_price', 'id'], condition=Q(is_deleted=False),
+                         name='products_live_price_idx'),
+            models.Index(fields=['rating', 'id'], condition=Q(is_deleted=False), name='products_live_rating_idx'),
+            models.Index(fields=['count'], condition=Q(is_deleted=False, count__gt=0),
+                         name='products_in_stock_count_idx'),
+        ]
 
     def __str__(self):
         return self.title
@@ -91,6 +211,12 @@ class Review(models.Model):
     rate = models.PositiveSmallIntegerField()
     date = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        # Пересчёт рейтинга (среднее rate по товару) читает только индекс
+        indexes = [
+            models.Index(fields=['product', 'rate'], name='products_review_rate_idx'),
+        ]
+
     def __str__(self):
         return f'Review {self.author} on {self.product.title}'
 
@@ -104,3 +230,20 @@ class Sale(models.Model):
 
     def __str__(self):
         return f'Sale on {self.product.title}'
+
+
+class PopularProduct(models.Model):
+    """
+    Модель PopularProduct представляет собой позицию товара в рейтинге популярных товаров
+    Рейтинг пересчитывается командой refresh_popular_products
+    """
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, related_name='popularity')
+    position = models.PositiveSmallIntegerField(unique=True)
+    score = models.DecimalField(max_digits=3, decimal_places=2)
+    refreshed_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        ordering = ('position',)
+
+    def __str__(self):
+        return f'Popular #{self.position}: {self.product.title}'
@@ -1,5 +1,13 @@
-from rest_framework.pagination import PageNumberPagination
+import base64
+import binascii
+import json
+import math
+
+from django.db.models import Q, QuerySet
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
 from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 
 
 class CustomPagination(PageNumberPagination):
@@ -15,3 +23,143 @@ class CustomPagination(PageNumberPagination):
             'currentPage': self.page.number,
             'lastPage': self.page.paginator.num_pages,
         })
+
+
+class KeysetPagination(BasePagination):
+    """
+    Пагинация по ключу (cursor): следующая страница выбирается условием по полям сортировки
+    последнего товара текущей страницы, а не через OFFSET, поэтому её стоимость не зависит от номера страницы.
+    Сортировка берётся из queryset и дополняется полем id для однозначности.
+    Ответ совпадает с CustomPagination и дополнительно содержит nextCursor/prevCursor.
+    Параметр count=estimate отключает COUNT(*): lastPage тогда равен номеру следующей страницы, если она есть
+    """
+    page_size = CustomPagination.page_size
+    page_size_query_param = CustomPagination.page_size_query_param
+    max_page_size = CustomPagination.max_page_size
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset: QuerySet, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(queryset)
+        self.queryset = queryset.order_by(*self.ordering)
+
+        cursor = self.decode_cursor(request)
+        if cursor is None:
+            self.page_number, reverse = 1, False
+            items = list(self.queryset[:self.page_size + 1])
+        else:
+            self.page_number, reverse = cursor['page'], cursor['reverse']
+            condition = self.build_condition(cursor['values'], reverse)
+            if reverse:
+                ordering = [self.reverse_field(field) for field in self.ordering]
+                items = list(self.queryset.filter(condition).order_by(*ordering)[:self.page_size + 1])
+            else:
+                items = list(self.queryset.filter(condition)[:self.page_size + 1])
+
+        has_more = len(items) > self.page_size
+        items = items[:self.page_size]
+        if reverse:
+            items.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, cursor is not None
+
+        self.items = items
+        return items
+
+    def get_paginated_response(self, data):
+        return Response({
+            'items': data,
+            'currentPage': self.page_number,
+            'lastPage': self.get_last_page(),
+            'nextCursor': self.get_next_cursor(),
+            'prevCursor': self.get_previous_cursor(),
+        })
+
+    def get_page_size(self, request) -> int:
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(page_size, self.max_page_size) if page_size > 0 else self.page_size
+
+    def get_ordering(self, queryset: QuerySet) -> list:
+        """Поля сортировки queryset с полем id в конце"""
+        ordering = [field for field in queryset.query.order_by if isinstance(field, str)]
+        if not any(field.lstrip('-') in ('id', 'pk') for field in ordering):
+            descending = ordering and ordering[-1].startswith('-')
+            ordering.append('-id' if descending else 'id')
+        return ordering
+
+    def get_last_page(self) -> int:
+        if self.request.query_params.get(self.count_query_param) == 'estimate':
+            return self.page_number + 1 if self.has_next else self.page_number
+        return max(math.ceil(self.queryset.count() / self.page_size), 1)
+
+    def get_next_cursor(self):
+        if not self.has_next or not self.items:
+            return None
+        return self.encode_cursor(self.items[-1], self.page_number + 1, reverse=False)
+
+    def get_previous_cursor(self):
+        if not self.has_previous or not self.items:
+            return None
+        return self.encode_cursor(self.items[0], self.page_number - 1, reverse=True)
+
+    def get_next_link(self):
+        return self.get_link(self.get_next_cursor())
+
+    def get_previous_link(self):
+        return self.get_link(self.get_previous_cursor())
+
+    def get_link(self, cursor):
+        if cursor is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def build_condition(self, values: list, reverse: bool) -> Q:
+        """
+        Условие «строго после» (или «строго до» при reverse) позиции values в порядке сортировки:
+        (a > x) OR (a = x AND b > y) OR ...
+        """
+        condition = Q()
+        equal = Q()
+        for field, value in zip(self.ordering, values):
+            name = field.lstrip('-')
+            descending = field.startswith('-') != reverse
+            condition |= equal & Q(**{f'{name}__{"lt" if descending else "gt"}': value})
+            equal &= Q(**{name: value})
+        return condition
+
+    def encode_cursor(self, item, page: int, reverse: bool) -> str:
+        values = [self.get_value(item, field.lstrip('-')) for field in self.ordering]
+        payload = json.dumps({'v': values, 'p': page, 'r': reverse}, default=str, separators=(',', ':'))
+        return base64.urlsafe_b64encode(payload.encode()).decode()
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+            values, page, reverse = payload['v'], int(payload['p']), bool(payload['r'])
+        except (binascii.Error, ValueError, TypeError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+        if len(values) != len(self.ordering) or page < 1:
+            raise NotFound(self.invalid_cursor_message)
+        return {'values': values, 'page': page, 'reverse': reverse}
+
+    @staticmethod
+    def get_value(item, field: str):
+        """Значение поля сортировки у объекта модели или строки .values()"""
+        for part in field.split('__'):
+            item = item[part] if isinstance(item, dict) else getattr(item, part)
+        return item
+
+    @staticmethod
+    def reverse_field(field: str) -> str:
+        return field[1:] if field.startswith('-') else f'-{field}'
@@ -0,0 +1,47 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import QuerySet
+from django.utils import timezone
+
+from .cache import bump_cache_version
+from .models import Product, PopularProduct
+from .serializers import PRODUCT_SHORT_VALUES
+
+
+def popular_products_queryset() -> QuerySet:
+    """Живой запрос популярных товаров: по рейтингу и количеству отзывов"""
+    return Product.objects.visible().order_by('-rating', '-reviews_count', 'pk')
+
+
+def refresh_popular_products(limit: int = None) -> int:
+    """Пересчитываем рейтинг популярных товаров и сохраняем первые limit позиций"""
+    limit = limit or settings.POPULAR_PRODUCTS_LIMIT
+    refreshed_at = timezone.now()
+    ranking = popular_products_queryset().values_list('pk', 'rating')[:limit]
+
+    with transaction.atomic():
+        PopularProduct.objects.all().delete()
+        PopularProduct.objects.bulk_create(
+            PopularProduct(product_id=product_id, position=position, score=rating, refreshed_at=refreshed_at)
+            for position, (product_id, rating) in enumerate(ranking, start=1)
+        )
+    bump_cache_version()
+    return PopularProduct.objects.count()
+
+
+def get_popular_products(limit: int = None) -> list:
+    """
+    Получаем строки популярных товаров (для ProductShortReadSerializer) из сохранённого рейтинга.
+    Если рейтинг пуст или устарел (старше POPULAR_PRODUCTS_MAX_AGE секунд), выполняем живой запрос.
+    Товары, удалённые после пересчёта, пропускаются сразу, не дожидаясь следующего пересчёта
+    """
+    limit = limit or settings.POPULAR_PRODUCTS_LIMIT
+    fresh_after = timezone.now() - timedelta(seconds=settings.POPULAR_PRODUCTS_MAX_AGE)
+    products = list(Product.objects.visible().filter(
+        popularity__refreshed_at__gte=fresh_after
+    ).order_by('popularity__position').values(*PRODUCT_SHORT_VALUES)[:limit])
+    if not products:
+        products = list(popular_products_queryset().values(*PRODUCT_SHORT_VALUES)[:limit])
+    return products
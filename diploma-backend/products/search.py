@@ -0,0 +1,134 @@
+"""
+Полнотекстовый поиск товаров по названию и описаниям.
+
+Бэкенд выбирается настройкой PRODUCT_SEARCH_BACKEND (путь к классу),
+по умолчанию - по типу базы данных:
+- SQLite: виртуальная таблица FTS5 products_product_fts, синхронизируется сигналами (см. signals.py);
+- PostgreSQL: GIN-индекс по выражению to_tsvector, обновляется самой БД;
+- остальные БД: title__icontains.
+Каждое слово запроса ищется как префикс, результаты аннотируются полем search_rank (чем больше, тем лучше).
+"""
+import re
+from functools import lru_cache
+from typing import Iterable, List
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import BooleanField, FloatField, QuerySet, Value
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+
+from .models import Product
+
+SEARCH_RANK_FIELD = 'search_rank'
+
+
+def get_search_terms(query: str) -> List[str]:
+    """Разбиваем запрос на слова, отбрасывая спецсимволы языков запросов FTS"""
+    return re.findall(r'\w+', query)
+
+
+class IcontainsSearchBackend:
+    """Поиск подстроки в названии товара (без индекса и ранжирования)"""
+
+    def filter(self, queryset: QuerySet, query: str) -> QuerySet:
+        return queryset.filter(title__icontains=query.strip()).annotate(
+            **{SEARCH_RANK_FIELD: Value(0.0, output_field=FloatField())})
+
+    def index(self, products: Iterable[Product]):
+        pass
+
+    def remove(self, product_ids: Iterable[int]):
+        pass
+
+    def rebuild(self) -> int:
+        return 0
+
+
+class SQLiteSearchBackend(IcontainsSearchBackend):
+    """Поиск по виртуальной таблице SQLite FTS5, rowid которой совпадает с id товара"""
+    table = 'products_product_fts'
+
+    def filter(self, queryset: QuerySet, query: str) -> QuerySet:
+        terms = get_search_terms(query)
+        if not terms:
+            return super().filter(queryset, query)
+
+        # "слово"* - поиск по префиксу, слова объединяются через AND
+        match = ' '.join(f'"{term}"*' for term in terms)
+        product_id = f'{connection.ops.quote_name(Product._meta.db_table)}.{connection.ops.quote_name("id")}'
+        return queryset.filter(
+            id__in=RawSQL(f'SELECT rowid FROM {self.table} WHERE {self.table} MATCH %s', [match])
+        ).annotate(**{SEARCH_RANK_FIELD: RawSQL(
+            # bm25 тем меньше, чем лучше совпадение; веса: название, описание, полное описание
+            f'(SELECT -bm25({self.table}, 10.0, 2.0, 1.0) FROM {self.table} '
+            f'WHERE {self.table} MATCH %s AND rowid = {product_id})',
+            [match],
+            output_field=FloatField(),
+        )})
+
+    def index(self, products: Iterable[Product]):
+        rows = [(product.pk, product.title, product.description, product.fullDescription) for product in products]
+        if not rows:
+            return
+        with connection.cursor() as cursor:
+            cursor.executemany(f'DELETE FROM {self.table} WHERE rowid = %s', [(row[0],) for row in rows])
+            cursor.executemany(
+                f'INSERT INTO {self.table} (rowid, title, description, fullDescription) VALUES (%s, %s, %s, %s)',
+                rows,
+            )
+
+    def remove(self, product_ids: Iterable[int]):
+        with connection.cursor() as cursor:
+            cursor.executemany(f'DELETE FROM {self.table} WHERE rowid = %s', [(pk,) for pk in product_ids])
+
+    def rebuild(self) -> int:
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table}')
+            cursor.execute(
+                f'INSERT INTO {self.table} (rowid, title, description, fullDescription) '
+                f'SELECT id, title, description, "fullDescription" FROM {Product._meta.db_table}'
+            )
+            return cursor.rowcount
+
+
+class PostgresSearchBackend(IcontainsSearchBackend):
+    """
+    Поиск по tsvector в PostgreSQL.
+    Выражение VECTOR совпадает с выражением GIN-индекса products_product_search_idx (см. миграцию)
+    """
+    config = 'simple'
+    vector = (
+        "to_tsvector('simple'::regconfig, "
+        "coalesce({table}.title, '') || ' ' || coalesce({table}.description, '') || ' ' || "
+        "coalesce({table}.\"fullDescription\", ''))"
+    )
+
+    def filter(self, queryset: QuerySet, query: str) -> QuerySet:
+        terms = get_search_terms(query)
+        if not terms:
+            return super().filter(queryset, query)
+
+        # слово:* - поиск по префиксу, слова объединяются через AND
+        tsquery = ' & '.join(f'{term}:*' for term in terms)
+        vector = self.vector.format(table=connection.ops.quote_name(Product._meta.db_table))
+        return queryset.filter(
+            RawSQL(f"{vector} @@ to_tsquery('{self.config}'::regconfig, %s)", [tsquery],
+                   output_field=BooleanField())
+        ).annotate(**{SEARCH_RANK_FIELD: RawSQL(
+            f"ts_rank({vector}, to_tsquery('{self.config}'::regconfig, %s))", [tsquery],
+            output_field=FloatField(),
+        )})
+
+
+@lru_cache(maxsize=None)
+def get_search_backend() -> IcontainsSearchBackend:
+    """Получаем бэкенд поиска из настроек или по типу базы данных"""
+    backend_path = getattr(settings, 'PRODUCT_SEARCH_BACKEND', None)
+    if backend_path:
+        return import_string(backend_path)()
+    if connection.vendor == 'sqlite':
+        return SQLiteSearchBackend()
+    if connection.vendor == 'postgresql':
+        return PostgresSearchBackend()
+    return IcontainsSearchBackend()
@@ -1,7 +1,24 @@
+from collections import defaultdict
+
 from rest_framework import serializers
 
 from .models import Tag, Category, ProductImage, Product, Specification, Sale, Review
 
+# Поля товара, которых достаточно для ProductShortReadSerializer (см. .values());
+# в списках цена товара - текущая, с учётом скидки: по ней фильтрует и сортирует каталог и считается корзина
+PRODUCT_SHORT_VALUES = (
+    'id',
+    'category_id',
+    'effective_price',
+    'count',
+    'date',
+    'title',
+    'description',
+    'freeDelivery',
+    'reviews_count',
+    'rating',
+)
+
 
 class TagSerializer(serializers.ModelSerializer):
     """Сериализатор тегов"""
@@ -38,8 +55,8 @@ class CategorySerializer(serializers.ModelSerializer):
 
     def get_subcategories(self, obj):
         """Получаем подкатегории"""
-        # Получаем только неудалённые подкатегории
-        subcategories = obj.subcategories.filter(is_deleted=False)
+        # Получаем только неудалённые подкатегории (без запроса, если они предзагружены)
+        subcategories = [subcategory for subcategory in obj.subcategories.all() if not subcategory.is_deleted]
         return CategorySerializer(subcategories, many=True, context=self.context).data
 
     def get_image(self, obj):
@@ -67,6 +84,7 @@ class ProductShortSerializer(serializers.ModelSerializer):
     """Сериализатор общей информации о продуктах"""
     images = ImageSerializer(many=True)
     tags = TagSerializer(many=True)
+    price = serializers.DecimalField(max_digits=10, decimal_places=2, source='effective_price')
     reviews = serializers.IntegerField(source='reviews_count')
     rating = serializers.DecimalField(max_digits=3, decimal_places=2, default=0.00)
 
@@ -88,6 +106,79 @@ class ProductShortSerializer(serializers.ModelSerializer):
         )
 
 
+class ProductShortListSerializer(serializers.ListSerializer):
+    """
+    Сериализатор списка товаров без создания полей DRF на каждую строку:
+    строки товаров (словари .values() или объекты модели) превращаются в словари напрямую,
+    изображения и теги загружаются двумя запросами на весь список.
+    Результат совпадает с ProductShortSerializer(many=True)
+    """
+    # Поля DRF, используемые только для форматирования значений
+    price_field = serializers.DecimalField(max_digits=10, decimal_places=2)
+    rating_field = serializers.DecimalField(max_digits=3, decimal_places=2)
+    date_field = serializers.DateTimeField()
+
+    def to_representation(self, data):
+        rows = [row if isinstance(row, dict) else self.get_row(row) for row in data]
+        product_ids = [row['id'] for row in rows]
+
+        images = defaultdict(list)
+        if product_ids:
+            storage = ProductImage._meta.get_field('src').storage
+            request = self.context.get('request')
+            for image in ProductImage.objects.filter(product_id__in=product_ids).order_by('pk').values(
+                    'product_id', 'src', 'alt'):
+                url = storage.url(image['src']) if image['src'] else None
+                if url and request is not None:
+                    url = request.build_absolute_uri(url)
+                images[image['product_id']].append({'src': url, 'alt': image['alt']})
+
+        tags = defaultdict(list)
+        if product_ids:
+            for tag in Product.tags.through.objects.filter(product_id__in=product_ids).order_by(
+                    'product_id', 'tag_id').values('product_id', 'tag_id', 'tag__name'):
+                tags[tag['product_id']].append({'id': tag['tag_id'], 'name': tag['tag__name']})
+
+        price = self.price_field.to_representation
+        rating = self.rating_field.to_representation
+        date = self.date_field.to_representation
+        return [
+            {
+                'id': row['id'],
+                'category': row['category_id'],
+                'price': price(row['effective_price']),
+                'count': row['count'],
+                'date': date(row['date']),
+                'title': row['title'],
+                'description': row['description'],
+                'freeDelivery': row['freeDelivery'],
+                'images': images[row['id']],
+                'tags': tags[row['id']],
+                'reviews': row['reviews_count'],
+                'rating': rating(row['rating']),
+            }
+            for row in rows
+        ]
+
+    @staticmethod
+    def get_row(product: Product) -> dict:
+        return {field: getattr(product, field) for field in PRODUCT_SHORT_VALUES}
+
+
+class ProductShortReadSerializer(ProductShortSerializer):
+    """
+    Быстрый read-only сериализатор общей информации о продуктах для списков.
+    Поля описаны в ProductShortSerializer (для схемы OpenAPI), сериализация - в ProductShortListSerializer
+    """
+
+    class Meta(ProductShortSerializer.Meta):
+        list_serializer_class = ProductShortListSerializer
+
+    def to_representation(self, instance):
+        return ProductShortListSerializer(child=ProductShortSerializer(), context=self.context).to_representation(
+            [instance])[0]
+
+
 class SpecificationSerializer(serializers.ModelSerializer):
     """Сериализатор спецификаций"""
 
@@ -107,6 +198,8 @@ class ProductFullSerializer(serializers.ModelSerializer):
     reviews = ReviewSerializer(many=True)
     specifications = SpecificationSerializer(many=True)
     rating = serializers.DecimalField(max_digits=3, decimal_places=2, default=0.00)
+    # Текущая цена с учётом скидки - как в списках, корзине и заказе
+    price = serializers.DecimalField(max_digits=10, decimal_places=2, source='effective_price')
 
     class Meta:
         model = Product
@@ -0,0 +1,86 @@
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+
+from .cache import bump_cache_version
+from .categories import invalidate_category_tree
+from .facets import invalidate_facets
+from .models import Category, Product, ProductImage, Review, Sale, Specification, Tag
+from .search import get_search_backend
+
+
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def refresh_product_rating(sender, instance: Review, raw: bool = False, **kwargs):
+    """Пересчитываем рейтинг и количество отзывов товара при добавлении, изменении и удалении отзыва"""
+    # При loaddata данные товаров приходят из фикстуры целиком
+    if raw:
+        return
+    Product.objects.filter(pk=instance.product_id).refresh_rating()
+
+
+@receiver(post_save, sender=Product)
+def refresh_product_effective_price(sender, instance: Product, raw: bool = False, **kwargs):
+    """Пересчитываем текущую цену товара при изменении товара"""
+    if raw:
+        return
+    Product.objects.filter(pk=instance.pk).refresh_effective_price()
+
+
+@receiver(post_save, sender=Sale)
+@receiver(post_delete, sender=Sale)
+def refresh_sale_effective_price(sender, instance: Sale, raw: bool = False, **kwargs):
+    """Пересчитываем текущую цену товара при добавлении, изменении и удалении скидки"""
+    if raw:
+        return
+    Product.objects.filter(pk=instance.product_id).refresh_effective_price()
+
+
+@receiver(post_save, sender=Product)
+def index_product(sender, instance: Product, **kwargs):
+    """Обновляем товар в индексе полнотекстового поиска"""
+    get_search_backend().index([instance])
+
+
+@receiver(post_delete, sender=Product)
+def unindex_product(sender, instance: Product, **kwargs):
+    """Удаляем товар из индекса полнотекстового поиска"""
+    get_search_backend().remove([instance.pk])
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(post_save, sender=Sale)
+@receiver(post_delete, sender=Sale)
+@receiver(m2m_changed, sender=Product.tags.through)
+def reset_facets(sender, **kwargs):
+    """Сбрасываем кэш фасетов каталога при изменении товаров, скидок и тегов"""
+    invalidate_facets()
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def reset_category_tree(sender, **kwargs):
+    """Сбрасываем кэш дерева категорий при изменении категорий"""
+    invalidate_category_tree()
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(post_save, sender=Sale)
+@receiver(post_delete, sender=Sale)
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+@receiver(post_save, sender=Specification)
+@receiver(post_delete, sender=Specification)
+@receiver(m2m_changed, sender=Product.tags.through)
+def reset_response_cache(sender, **kwargs):
+    """Сбрасываем кэш ответов эндпоинтов товаров при изменении каталога"""
+    bump_cache_version()
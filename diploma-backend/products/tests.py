@@ -1,3 +1,862 @@
-from django.test import TestCase
+import base64
+import gzip
+import json
+import math
+import re
+import tempfile
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from pathlib import Path
+from time import monotonic
 
-# Create your tests here.
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.db.models import Avg
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from megano import slow_queries
+from megano.instrumentation import metrics
+from megano.testing import EndpointBudgetMixin
+from orders.seed import SEED_USERNAME_PREFIX
+
+from .admin import restore, soft_delete
+from .categories import get_category_tree, get_descendant_ids
+from .facets import FACETS_CACHE_KEY
+from .models import Category, PopularProduct, Product, Review, Sale, Specification, Tag
+from .popular import get_popular_products, refresh_popular_products
+from .search import SQLiteSearchBackend
+from .serializers import CategorySerializer, PRODUCT_SHORT_VALUES, ProductShortSerializer, ProductShortReadSerializer
+from .views import ProductCatalogListAPIView, ProductsLimitedListAPIView
+
+
+class ProductShortReadSerializerTestCase(TestCase):
+    """Быстрый сериализатор списков товаров выдаёт тот же JSON, что и ProductShortSerializer"""
+    fixtures = ['categories', 'tags', 'products', 'product_images']
+
+    def setUp(self):
+        cache.clear()
+        self.context = {'request': APIRequestFactory().get('/api/catalog', HTTP_HOST='testserver')}
+        self.ordering = ('-date', '-id')
+
+    def render_model_serializer(self, context) -> bytes:
+        products = Product.objects.prefetch_related('images', 'tags').order_by(*self.ordering)
+        return JSONRenderer().render(ProductShortSerializer(products, many=True, context=context).data)
+
+    def render_read_serializer(self, rows, context) -> bytes:
+        return JSONRenderer().render(ProductShortReadSerializer(rows, many=True, context=context).data)
+
+    def test_values_rows(self):
+        rows = Product.objects.order_by(*self.ordering).values(*PRODUCT_SHORT_VALUES)
+        self.assertEqual(self.render_read_serializer(rows, self.context), self.render_model_serializer(self.context))
+
+    def test_model_instances(self):
+        products = Product.objects.order_by(*self.ordering)
+        self.assertEqual(
+            self.render_read_serializer(products, self.context),
+            self.render_model_serializer(self.context),
+        )
+
+    def test_without_request(self):
+        rows = Product.objects.order_by(*self.ordering).values(*PRODUCT_SHORT_VALUES)
+        self.assertEqual(self.render_read_serializer(rows, {}), self.render_model_serializer({}))
+
+    def test_product_without_images_and_tags_with_reviews(self):
+        product = Product.objects.create(category_id=1, title='Cable', price='99.90', count=2)
+        for rate in (5, 4, 4):
+            Review.objects.create(product=product, author='Anna', email='anna@example.com', text='Ok', rate=rate)
+        self.assertEqual(
+            self.render_read_serializer(Product.objects.order_by(*self.ordering).values(*PRODUCT_SHORT_VALUES),
+                                        self.context),
+            self.render_model_serializer(self.context),
+        )
+
+    def test_single_product(self):
+        product = Product.objects.prefetch_related('images', 'tags').get(pk=1)
+        self.assertEqual(
+            ProductShortReadSerializer(product, context=self.context).data,
+            ProductShortSerializer(product, context=self.context).data,
+        )
+
+    def test_empty_list(self):
+        self.assertEqual(ProductShortReadSerializer([], many=True).data, [])
+
+    def test_queries(self):
+        rows = list(Product.objects.values(*PRODUCT_SHORT_VALUES))
+        # Изображения и теги - по одному запросу на весь список
+        with self.assertNumQueries(2):
+            ProductShortReadSerializer(rows, many=True, context=self.context).data
+
+    def test_catalog_response(self):
+        response = self.client.get(reverse('products:catalog'), {'limit': 100})
+        expected = b'{"items":' + self.render_model_serializer(self.context) + b',"currentPage":1,"lastPage":1}'
+        self.assertEqual(response.content, expected)
+
+
+class SoftDeleteTestCase(TestCase):
+    """Удалённые товары не показываются и не продаются; действия админки сбрасывают кэш списков"""
+    fixtures = ['categories', 'tags', 'products', 'sales']
+
+    def setUp(self):
+        cache.clear()
+        self.product_id = Sale.objects.values_list('product_id', flat=True).first()
+
+    def get_ids(self, name: str) -> set:
+        data = self.client.get(reverse(f'products:{name}'), {'limit': 100}).json()
+        return {item['id'] for item in (data['items'] if isinstance(data, dict) else data)}
+
+    def test_soft_delete_action(self):
+        refresh_popular_products(limit=100)
+        self.assertIn(self.product_id, self.get_ids('catalog'))
+        self.assertIn(self.product_id, self.get_ids('sales'))
+        self.assertIn(self.product_id, self.get_ids('products-popular'))
+
+        soft_delete(None, None, Product.objects.filter(pk=self.product_id))
+        self.assertNotIn(self.product_id, self.get_ids('catalog'))
+        self.assertNotIn(self.product_id, self.get_ids('sales'))
+        # Сохранённый рейтинг ещё не пересчитан, но удалённый товар из него не отдаётся
+        self.assertTrue(PopularProduct.objects.filter(product_id=self.product_id).exists())
+        self.assertNotIn(self.product_id, self.get_ids('products-popular'))
+        self.assertEqual(self.client.get(reverse('products:product-details', args=[self.product_id])).status_code, 404)
+
+        restore(None, None, Product.objects.filter(pk=self.product_id))
+        self.assertIn(self.product_id, self.get_ids('catalog'))
+        self.assertEqual(self.client.get(reverse('products:product-details', args=[self.product_id])).status_code, 200)
+
+
+class CategoryTreeTestCase(TestCase):
+    """Дерево категорий собирается одним запросом и совпадает с CategorySerializer"""
+    fixtures = ['categories']
+
+    def setUp(self):
+        cache.clear()
+        # Третий уровень вложенности и удалённая подкатегория
+        self.nested = Category.objects.create(title='Gaming laptops', parent_id=8, image='laptops.png')
+        self.deleted = Category.objects.create(title='Old', parent_id=8, is_deleted=True)
+        Category.objects.create(title='Under deleted', parent=self.deleted)
+
+    def test_tree_matches_serializer(self):
+        roots = Category.objects.filter(parent__isnull=True, is_deleted=False).order_by('pk')
+        self.assertEqual(get_category_tree(), CategorySerializer(roots, many=True).data)
+
+    def test_categories_endpoint_queries(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('products:categories'))
+        self.assertEqual(response.json(), get_category_tree())
+
+    def test_tree_invalidated_on_category_change(self):
+        get_category_tree()
+        self.nested.delete()
+        self.assertNotIn(self.nested.pk, get_descendant_ids(8))
+
+    def test_descendant_ids(self):
+        self.assertEqual(set(get_descendant_ids(8, include_deleted=False)), {8, self.nested.pk})
+        self.assertEqual(len(get_descendant_ids(8)), 4)
+
+
+class CategorySubtreeTestCase(TestCase):
+    """Материализованный путь категорий и фильтрация каталога по поддереву"""
+    fixtures = ['categories', 'tags', 'products']
+
+    def setUp(self):
+        cache.clear()
+
+    def get_catalog_categories(self, category_id) -> set:
+        response = self.client.get(reverse('products:catalog'), {'category': category_id, 'limit': 100})
+        return {item['category'] for item in response.json()['items']}
+
+    def test_catalog_includes_subcategories(self):
+        # Clothings (4) -> Shoes (11) -> Sneakers (12)
+        expected = set(Product.objects.filter(category__in=get_descendant_ids(4)).values_list('category', flat=True))
+        self.assertEqual(self.get_catalog_categories(4), expected)
+        self.assertIn(12, expected)
+
+    def test_new_category_path(self):
+        category = Category.objects.create(title='Running', parent_id=12)
+        self.assertEqual(category.path, f'/4/11/12/{category.pk}/')
+
+    def test_move_subtree(self):
+        category = Category.objects.get(pk=11)
+        category.parent_id = 5
+        category.save()
+        self.assertEqual(Category.objects.get(pk=12).path, '/5/11/12/')
+        self.assertIn(12, self.get_catalog_categories(5))
+        self.assertNotIn(12, self.get_catalog_categories(4))
+
+
+class EffectivePriceTestCase(TestCase):
+    """Текущая цена товара с учётом действующей скидки"""
+    fixtures = ['categories', 'tags', 'products']
+
+    def setUp(self):
+        cache.clear()
+        self.today = timezone.localdate()
+
+    def effective_price(self, pk) -> Decimal:
+        return Product.objects.get(pk=pk).effective_price
+
+    def test_sale_changes_effective_price(self):
+        sale = Sale.objects.create(product_id=2, salePrice='9000.00',
+                                   dateFrom=self.today - timedelta(days=1), dateTo=self.today + timedelta(days=1))
+        self.assertEqual(self.effective_price(2), Decimal('9000.00'))
+        sale.delete()
+        self.assertEqual(self.effective_price(2), Decimal('15000.00'))
+
+    def test_refresh_at_date_boundary(self):
+        Sale.objects.create(product_id=2, salePrice='9000.00',
+                            dateFrom=self.today + timedelta(days=1), dateTo=self.today + timedelta(days=2))
+        self.assertEqual(self.effective_price(2), Decimal('15000.00'))
+        self.assertEqual(Product.objects.refresh_effective_price(today=self.today + timedelta(days=1)), 1)
+        self.assertEqual(self.effective_price(2), Decimal('9000.00'))
+        # Повторный пересчёт ничего не меняет
+        self.assertEqual(Product.objects.refresh_effective_price(today=self.today + timedelta(days=1)), 0)
+
+    def test_catalog_price_filter_and_sort(self):
+        Sale.objects.create(product_id=1, salePrice='10.00',
+                            dateFrom=self.today, dateTo=self.today)
+        response = self.client.get(reverse('products:catalog'), {
+            'filter[maxPrice]': '100', 'sort': 'price', 'sortType': 'inc', 'limit': 100,
+        })
+        # Цена в списке - со скидкой, как у фильтра и сортировки
+        item = response.json()['items'][0]
+        self.assertEqual((item['id'], item['price']), (1, '10.00'))
+
+    def test_detail_price_matches_catalog(self):
+        Sale.objects.create(product_id=1, salePrice='108000.00', dateFrom=self.today, dateTo=self.today)
+        detail = self.client.get(reverse('products:product-details', args=[1])).json()
+        item = next(item for item in self.client.get(reverse('products:catalog'), {'limit': 100}).json()['items']
+                    if item['id'] == 1)
+        self.assertEqual((detail['price'], item['price']), ('108000.00', '108000.00'))
+
+    def test_catalog_cursor_price_sort(self):
+        Sale.objects.create(product_id=1, salePrice='10.00', dateFrom=self.today, dateTo=self.today)
+        for sort_type in ('inc', 'dec'):
+            with self.subTest(sort_type=sort_type):
+                params = {'sort': 'price', 'sortType': sort_type, 'pagination': 'cursor', 'limit': 2}
+                first = self.client.get(reverse('products:catalog'), params)
+                self.assertEqual(first.status_code, 200)
+                second = self.client.get(reverse('products:catalog'), {**params, 'cursor': first.json()['nextCursor']})
+                self.assertEqual(second.status_code, 200)
+
+                prices = [Decimal(item['price']) for item in first.json()['items'] + second.json()['items']]
+                self.assertEqual(prices, sorted(prices, reverse=sort_type == 'dec'))
+                self.assertEqual(len({item['id'] for item in first.json()['items'] + second.json()['items']}), 4)
+
+
+class KeysetPaginationTestCase(TestCase):
+    """Пагинация каталога по ключу: страницы вперёд и назад при одинаковых значениях поля сортировки"""
+    fixtures = ['categories', 'tags', 'products']
+    sort_fields = {'date': 'date', 'price': 'effective_price', 'rating': 'rating', 'reviews': 'reviews_count'}
+
+    def setUp(self):
+        cache.clear()
+        # Значения полей сортировки повторяются, порядок внутри группы задаёт id
+        date = timezone.now()
+        for index, pk in enumerate(Product.objects.order_by('pk').values_list('pk', flat=True)):
+            Product.objects.filter(pk=pk).update(date=date - timedelta(days=index % 3), effective_price=index % 4,
+                                                 rating=index % 2, reviews_count=index % 3)
+
+    def get_page(self, params: dict, cursor: str = None) -> dict:
+        response = self.client.get(reverse('products:catalog'), {**params, **({'cursor': cursor} if cursor else {})})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_pages_forward_and_backward(self):
+        for sort, field in self.sort_fields.items():
+            for sort_type in ('inc', 'dec'):
+                with self.subTest(sort=sort, sort_type=sort_type):
+                    prefix = '-' if sort_type == 'dec' else ''
+                    expected = list(Product.objects.visible().order_by(f'{prefix}{field}', f'{prefix}id')
+                                    .values_list('id', flat=True))
+                    params = {'sort': sort, 'sortType': sort_type, 'pagination': 'cursor', 'limit': 3}
+
+                    pages = [self.get_page(params)]
+                    while pages[-1]['nextCursor']:
+                        pages.append(self.get_page(params, pages[-1]['nextCursor']))
+                    self.assertEqual([item['id'] for page in pages for item in page['items']], expected)
+                    self.assertEqual([page['currentPage'] for page in pages], list(range(1, len(pages) + 1)))
+
+                    # Назад от последней страницы - те же страницы в обратном порядке
+                    page = pages[-1]
+                    for previous in reversed(pages[:-1]):
+                        page = self.get_page(params, page['prevCursor'])
+                        self.assertEqual((page['items'], page['currentPage']),
+                                         (previous['items'], previous['currentPage']))
+                    self.assertIsNone(page['prevCursor'])
+
+    def test_invalid_cursor(self):
+        valid = self.get_page({'pagination': 'cursor', 'limit': 3})['nextCursor']
+        wrong_length = base64.urlsafe_b64encode(b'{"v":[1],"p":2,"r":false}').decode()
+        for cursor in ('not-a-cursor', base64.urlsafe_b64encode(b'[]').decode(), wrong_length, valid[:-4]):
+            with self.subTest(cursor=cursor):
+                response = self.client.get(reverse('products:catalog'), {'cursor': cursor})
+                self.assertEqual(response.status_code, 404)
+
+    def test_count_estimate(self):
+        params = {'pagination': 'cursor', 'limit': 10, 'count': 'estimate'}
+        # Товары, изображения и теги - без COUNT(*)
+        with self.assertNumQueries(3):
+            first = self.get_page(params)
+        self.assertEqual((first['currentPage'], first['lastPage']), (1, 2))
+        last = self.get_page(params, first['nextCursor'])
+        self.assertEqual((last['currentPage'], last['lastPage'], last['nextCursor']), (2, 2, None))
+        self.assertEqual(self.get_page({**params, 'count': 'exact'})['lastPage'],
+                         math.ceil(Product.objects.visible().count() / 10))
+
+
+class ProductSearchTestCase(TestCase):
+    """Полнотекстовый поиск по каталогу: префиксы, ранжирование и синхронизация индекса"""
+    fixtures = ['categories', 'tags', 'products']
+
+    def setUp(self):
+        cache.clear()
+
+    def create_product(self, title: str, full_description: str = '') -> Product:
+        return Product.objects.create(category_id=1, title=title, price=100, count=5, description='',
+                                      fullDescription=full_description)
+
+    def search(self, query: str, **params) -> list:
+        response = self.client.get(reverse('products:catalog'), {'filter[name]': query, 'limit': 100, **params})
+        return [item['id'] for item in response.json()['items']]
+
+    def test_prefix_match(self):
+        self.assertEqual(set(self.search('dres')), {5, 6})
+        self.assertEqual(set(self.search('oversiz')), {7, 8})
+        # Все слова запроса должны совпасть
+        self.assertEqual(self.search('oversize coa'), [8])
+        self.assertEqual(self.search('"oversize" OR'), [])
+
+    def test_relevance_sort(self):
+        in_description = self.create_product('Desk lamp', 'Lamp with a zebra pattern')
+        in_title = self.create_product('Zebra lamp')
+        self.assertEqual(self.search('zebra', sort='relevance', sortType='dec'), [in_title.pk, in_description.pk])
+        self.assertEqual(self.search('zebra', sort='relevance', sortType='inc'), [in_description.pk, in_title.pk])
+
+    def test_relevance_sort_with_cursor(self):
+        for index in range(5):
+            self.create_product(f'Zebra lamp {index}', 'zebra ' * index)
+        params = {'filter[name]': 'zebra', 'sort': 'relevance', 'sortType': 'dec'}
+        expected = self.search('zebra', sort='relevance', sortType='dec')
+
+        page = self.client.get(reverse('products:catalog'), {**params, 'pagination': 'cursor', 'limit': 2}).json()
+        ids = [item['id'] for item in page['items']]
+        while page['nextCursor']:
+            params['cursor'] = page['nextCursor']
+            page = self.client.get(reverse('products:catalog'), {**params, 'limit': 2}).json()
+            ids += [item['id'] for item in page['items']]
+        self.assertEqual(len(expected), 5)
+        self.assertEqual(ids, expected)
+
+    def test_index_follows_product_changes(self):
+        product = self.create_product('Quokka plush')
+        self.assertEqual(self.search('quokka'), [product.pk])
+
+        product.title = 'Wombat plush'
+        product.save()
+        self.assertEqual(self.search('quokka'), [])
+        self.assertEqual(self.search('wombat'), [product.pk])
+
+        product.delete()
+        self.assertEqual(self.search('wombat'), [])
+
+    def test_rebuild_command(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {SQLiteSearchBackend.table}')
+        self.assertEqual(self.search('dress'), [])
+
+        out = StringIO()
+        call_command('rebuild_search_index', stdout=out)
+        self.assertEqual(set(self.search('dress')), {5, 6})
+        self.assertIn(f'SQLiteSearchBackend: indexed {Product.objects.count()} products', out.getvalue())
+
+
+class CatalogFacetsTestCase(TestCase):
+    """Фасеты каталога совпадают с отфильтрованным каталогом; сводка по категориям кэшируется"""
+    fixtures = ['categories', 'tags', 'products']
+
+    def setUp(self):
+        cache.clear()
+
+    def get_facets(self, params: dict = None) -> dict:
+        return self.client.get(reverse('products:catalog-facets'), params or {}).json()
+
+    def expected_facets(self, params: dict) -> dict:
+        """Фасеты, посчитанные по товарам ответа каталога"""
+        items = self.client.get(reverse('products:catalog'), {**params, 'limit': 100}).json()['items']
+        categories, tags = {}, {}
+        for item in items:
+            categories[item['category']] = categories.get(item['category'], 0) + 1
+        for tag_id, name in Product.tags.through.objects.filter(
+                product__in=[item['id'] for item in items]).values_list('tag', 'tag__name'):
+            tags[tag_id] = (name, tags.get(tag_id, (name, 0))[1] + 1)
+        prices = [Decimal(item['price']) for item in items]
+        return {
+            'count': len(items),
+            'categories': [{'id': pk, 'count': count} for pk, count in sorted(categories.items())],
+            'tags': [{'id': pk, 'name': name, 'count': count} for pk, (name, count) in sorted(tags.items())],
+            'price': {'min': f'{min(prices):.2f}' if prices else None, 'max': f'{max(prices):.2f}' if prices else None},
+            'freeDelivery': sum(item['freeDelivery'] for item in items),
+            'available': sum(item['count'] > 0 for item in items),
+        }
+
+    def test_facets_match_catalog(self):
+        Product.objects.filter(pk=3).update(is_deleted=True)
+        for params in ({}, {'category': 4}, {'filter[maxPrice]': '20000'}, {'filter[freeDelivery]': 'true'},
+                       {'filter[available]': 'true', 'tags[]': [1, 2]}, {'filter[name]': 'dress'},
+                       {'filter[maxPrice]': '0'}):
+            with self.subTest(params=params):
+                cache.clear()
+                self.assertEqual(self.get_facets(params), self.expected_facets(params))
+
+    def test_cached_category_summary(self):
+        facets = self.get_facets()
+        self.assertIsNotNone(cache.get(FACETS_CACHE_KEY))
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get_facets(), facets)
+        self.assertEqual(self.get_facets({'category': 4}), self.expected_facets({'category': 4}))
+
+    def test_summary_invalidated_on_product_change(self):
+        before = self.get_facets()
+        product = Product.objects.filter(freeDelivery=False).first()
+        product.freeDelivery = True
+        product.save()
+        self.assertIsNone(cache.get(FACETS_CACHE_KEY))
+        self.assertEqual(self.get_facets()['freeDelivery'], before['freeDelivery'] + 1)
+
+        product.tags.clear()
+        self.assertIsNone(cache.get(FACETS_CACHE_KEY))
+        self.assertEqual(self.get_facets(), self.expected_facets({}))
+
+
+class ResponseCacheTestCase(TestCase):
+    """Кэш ответов эндпоинтов товаров: ETag, ключ с хостом и сброс по сигналам"""
+    fixtures = ['categories', 'tags', 'products', 'product_images', 'sales']
+
+    def setUp(self):
+        cache.clear()
+        self.url = reverse('products:product-details', args=[1])
+
+    def test_etag(self):
+        response = self.client.get(self.url)
+        etag = response['ETag']
+        for header in (etag, f'W/{etag}', f'"other", {etag}', '*'):
+            with self.subTest(header=header):
+                response = self.client.get(self.url, HTTP_IF_NONE_MATCH=header)
+                self.assertEqual((response.status_code, response.content, response['ETag']), (304, b'', etag))
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH='"other"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['id'], 1)
+
+    def test_cached_response(self):
+        first = self.client.get(self.url)
+        with self.assertNumQueries(0):
+            second = self.client.get(self.url)
+        self.assertEqual((second.content, second['ETag']), (first.content, first['ETag']))
+
+    @override_settings(ALLOWED_HOSTS=['a.example', 'b.example'])
+    def test_host_is_part_of_cache_key(self):
+        for host in ('a.example', 'b.example'):
+            with self.subTest(host=host):
+                image = self.client.get(self.url, HTTP_HOST=host).json()['images'][0]['src']
+                self.assertTrue(image.startswith(f'http://{host}/'), image)
+
+    def test_invalidated_by_signals(self):
+        today = timezone.localdate()
+
+        def rename_product():
+            product = Product.objects.get(pk=1)
+            product.title = 'Renamed product'
+            product.save()
+
+        def rename_category():
+            category = Category.objects.get(pk=1)
+            category.title = 'Renamed category'
+            category.save()
+
+        def rename_tag():
+            tag = Tag.objects.get(pk=1)
+            tag.name = 'Renamed tag'
+            tag.save()
+
+        def create_sale():
+            Sale.objects.create(product_id=2, salePrice='1234.56', dateFrom=today, dateTo=today)
+
+        for name, url, change, expected in (
+            ('product', self.url, rename_product, 'Renamed product'),
+            ('category', reverse('products:categories'), rename_category, 'Renamed category'),
+            ('tag', reverse('products:tags'), rename_tag, 'Renamed tag'),
+            ('sale', reverse('products:sales'), create_sale, '1234.56'),
+        ):
+            with self.subTest(change=name):
+                before = self.client.get(url)
+                self.assertNotIn(expected, before.content.decode())
+                change()
+                after = self.client.get(url, HTTP_IF_NONE_MATCH=before['ETag'])
+                self.assertEqual(after.status_code, 200)
+                self.assertIn(expected, after.content.decode())
+
+
+class ProductRatingTestCase(TestCase):
+    """Сохранённые рейтинг и количество отзывов товара"""
+    fixtures = ['categories', 'tags', 'products']
+
+    def rating(self, pk=2) -> tuple:
+        return tuple(Product.objects.values_list('rating', 'reviews_count').get(pk=pk))
+
+    def create_review(self, rate: int, pk=2) -> Review:
+        return Review.objects.create(product_id=pk, author='Buyer', email='b@example.com', text='Review', rate=rate)
+
+    def test_review_changes_rating(self):
+        review = self.create_review(5)
+        self.assertEqual(self.rating(), (Decimal('5.00'), 1))
+        self.create_review(2)
+        self.assertEqual(self.rating(), (Decimal('3.50'), 2))
+
+        review.rate = 3
+        review.save()
+        self.assertEqual(self.rating(), (Decimal('2.50'), 2))
+
+        review.delete()
+        self.assertEqual(self.rating(), (Decimal('2.00'), 1))
+        Review.objects.filter(product_id=2).delete()
+        self.assertEqual(self.rating(), (Decimal('0.00'), 0))
+
+    def test_rebuild_command(self):
+        self.create_review(4)
+        self.create_review(1, pk=3)
+        Product.objects.filter(pk__in=[2, 3]).update(rating=1, reviews_count=10)
+
+        out = StringIO()
+        call_command('rebuild_product_ratings', batch_size=2, stdout=out)
+        self.assertEqual((self.rating(2), self.rating(3)), ((Decimal('4.00'), 1), (Decimal('1.00'), 1)))
+        self.assertEqual(self.rating(1), (Decimal('0.00'), 0))
+        self.assertIn(f'Rebuilt rating of {Product.objects.count()} products', out.getvalue())
+
+
+class PopularProductsTestCase(TestCase):
+    """Сохранённый рейтинг популярных товаров и живой запрос, если рейтинг пуст или устарел"""
+    fixtures = ['categories', 'tags', 'products']
+
+    def setUp(self):
+        cache.clear()
+        Product.objects.update(rating=0, reviews_count=0)
+        Product.objects.filter(pk=3).update(rating=5, reviews_count=1)
+        Product.objects.filter(pk=5).update(rating=4, reviews_count=7)
+        Product.objects.filter(pk=1).update(rating=4, reviews_count=2)
+
+    def popular_ids(self, limit=3) -> list:
+        return [row['id'] for row in get_popular_products(limit)]
+
+    def test_refresh_command(self):
+        out = StringIO()
+        call_command('refresh_popular_products', limit=3, stdout=out)
+        self.assertEqual(list(PopularProduct.objects.values_list('product_id', 'position')), [(3, 1), (5, 2), (1, 3)])
+        self.assertIn('Popular products ranking refreshed: 3 products', out.getvalue())
+
+    def test_stored_ranking(self):
+        refresh_popular_products(3)
+        Product.objects.filter(pk=7).update(rating=5, reviews_count=100)
+        # Свежий рейтинг читается как есть, до следующего пересчёта
+        self.assertEqual(self.popular_ids(), [3, 5, 1])
+        self.assertEqual([item['id'] for item in self.client.get(reverse('products:products-popular')).json()][:3],
+                         [3, 5, 1])
+
+    def test_stale_ranking_falls_back_to_live_query(self):
+        refresh_popular_products(3)
+        Product.objects.filter(pk=7).update(rating=5, reviews_count=100)
+        PopularProduct.objects.update(
+            refreshed_at=timezone.now() - timedelta(seconds=settings.POPULAR_PRODUCTS_MAX_AGE + 1))
+        self.assertEqual(self.popular_ids(), [7, 3, 5])
+
+    def test_empty_ranking_falls_back_to_live_query(self):
+        self.assertFalse(PopularProduct.objects.exists())
+        self.assertEqual(self.popular_ids(), [3, 5, 1])
+
+
+class CatalogImportExportTestCase(TestCase):
+    """Потоковый импорт и экспорт каталога: CSV и JSONL, продолжение прерванного импорта и ошибки записей"""
+    fixtures = ['categories', 'tags', 'products', 'product_images', 'sales', 'specifications']
+
+    def setUp(self):
+        cache.clear()
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def path(self, name: str) -> str:
+        return str(Path(self.directory.name) / name)
+
+    def write_jsonl(self, name: str, records: list) -> str:
+        path = self.path(name)
+        Path(path).write_text(''.join(json.dumps(record) + '\n' for record in records), encoding='utf-8')
+        return path
+
+    def export(self, name: str) -> str:
+        call_command('export_catalog', self.path(name), batch_size=5, stdout=StringIO())
+        return Path(self.path(name)).read_text(encoding='utf-8')
+
+    def test_round_trip(self):
+        for file_format in ('csv', 'jsonl'):
+            with self.subTest(format=file_format):
+                exported = self.export(f'catalog.{file_format}')
+                Product.objects.filter(pk=1).update(title='Changed', price=1, is_deleted=True)
+                Product.objects.get(pk=2).tags.clear()
+                Sale.objects.all().delete()
+                Specification.objects.filter(product=4).delete()
+
+                call_command('import_catalog', self.path(f'catalog.{file_format}'), batch_size=5, stdout=StringIO())
+                self.assertEqual(self.export(f'again.{file_format}'), exported)
+                self.assertFalse(Path(self.path(f'catalog.{file_format}.checkpoint')).exists())
+
+    def test_new_products(self):
+        path = self.write_jsonl('new.jsonl', [
+            {'title': 'Without id', 'category': 1, 'price': '10.00', 'tags': ['Brand new tag']},
+            {'id': 1000, 'title': 'With id', 'category': 1, 'price': '20.00'},
+            {'title': 'Without id again', 'category': 1, 'price': '30.00'},
+        ])
+        call_command('import_catalog', path, batch_size=2, stdout=StringIO())
+        self.assertTrue(Product.objects.filter(pk=1000, title='With id').exists())
+        self.assertGreater(Product.objects.get(title='Without id again').pk, 1000)
+        self.assertEqual(list(Product.objects.get(title='Without id').tags.values_list('name', flat=True)),
+                         ['Brand new tag'])
+
+    def test_invalid_record(self):
+        path = self.write_jsonl('invalid.jsonl', [
+            {'title': 'Valid', 'category': 1, 'price': '10.00'},
+            {'title': 'Unknown category', 'category': 999, 'price': '10.00'},
+        ])
+        with self.assertRaisesMessage(CommandError, 'Record 2: Unknown category 999'):
+            call_command('import_catalog', path, stdout=StringIO())
+        self.assertFalse(Product.objects.filter(title='Valid').exists())
+
+        path = self.write_jsonl('bad_price.jsonl', [{'title': 'Bad price', 'category': 1, 'price': 'free'}])
+        with self.assertRaisesMessage(CommandError, 'Record 1: InvalidOperation'):
+            call_command('import_catalog', path, stdout=StringIO())
+
+    def test_resume(self):
+        # Первые две записи уже импортированы до прерывания: повторно они не читаются
+        path = self.write_jsonl('resume.jsonl', [
+            {'title': 'Imported before', 'category': 999},
+            {'title': 'Imported before', 'category': 999},
+            {'title': 'Last record', 'category': 1, 'price': '10.00'},
+        ])
+        Path(f'{path}.checkpoint').write_text(json.dumps({'records': 2}))
+        out = StringIO()
+        call_command('import_catalog', path, resume=True, stdout=out)
+        self.assertIn('Resuming after 2 records', out.getvalue())
+        self.assertIn('Imported 1 records', out.getvalue())
+        self.assertTrue(Product.objects.filter(title='Last record').exists())
+        self.assertFalse(Path(f'{path}.checkpoint').exists())
+
+
+class QueryPlanMixin:
+    """Проверка плана запроса через EXPLAIN: таблица читается по индексу, а не полным просмотром"""
+
+    def get_full_scans(self, queryset) -> list:
+        """Таблицы, которые план запроса читает полным просмотром"""
+        if connection.vendor == 'postgresql':
+            # На небольшом наборе данных планировщик PostgreSQL предпочитает seq scan даже при наличии индекса
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+            return re.findall(r'Seq Scan on (\w+)', queryset.explain())
+        # SQLite: "SCAN table" без "USING ... INDEX"
+        return re.findall(r'\bSCAN (\w+)$', queryset.explain(), re.MULTILINE)
+
+    def assertUsesIndex(self, queryset):
+        self.assertEqual(self.get_full_scans(queryset), [], queryset.explain())
+
+
+class QueryPlanTestCase(QueryPlanMixin, TestCase):
+    """Запросы витрины используют составные и частичные индексы товаров и отзывов"""
+    fixtures = ['categories']
+
+    @classmethod
+    def setUpTestData(cls):
+        categories = list(Category.objects.all())
+        Product.objects.bulk_create([
+            Product(category=categories[index % len(categories)], title=f'Product {index}', price=index,
+                    effective_price=index, count=index % 50, rating=index % 5, is_deleted=index % 10 == 0)
+            for index in range(3000)
+        ])
+        cls.product = Product.objects.first()
+        Review.objects.bulk_create([
+            Review(product=cls.product, author='buyer', email='buyer@example.com', text='text', rate=index % 5 + 1)
+            for index in range(100)
+        ])
+        cls.category = categories[0]
+
+    def get_catalog_queryset(self, **params):
+        view = ProductCatalogListAPIView()
+        view.request = view.initialize_request(APIRequestFactory().get('/api/catalog', params))
+        return view.get_queryset()
+
+    def test_catalog(self):
+        for sort in ('date', 'price', 'rating'):
+            with self.subTest(sort=sort):
+                self.assertUsesIndex(self.get_catalog_queryset(sort=sort)[:20])
+
+    def test_catalog_category_and_price(self):
+        self.assertUsesIndex(self.get_catalog_queryset(**{
+            'category': self.category.pk, 'filter[minPrice]': '10', 'filter[maxPrice]': '2000',
+        })[:20])
+
+    def test_limited(self):
+        self.assertUsesIndex(ProductsLimitedListAPIView().get_queryset())
+
+    def test_product_rating(self):
+        self.assertUsesIndex(
+            Review.objects.filter(product=self.product).values('product').annotate(value=Avg('rate')))
+
+
+class ProductEndpointBudgetTestCase(EndpointBudgetMixin, TestCase):
+    """Бюджеты SQL-запросов и задержки эндпоинтов товаров на синтетическом наборе данных"""
+
+    def setUp(self):
+        cache.clear()
+        self.product = Product.objects.visible().order_by('-reviews_count', 'pk').first()
+        self.category = Category.objects.filter(parent=None).order_by('pk').last()
+        self.tag = self.product.tags.first() or Product.tags.rel.model.objects.first()
+
+    def test_home_page(self):
+        self.assertWithinBudget('get', reverse('products:banners'), 3, 50)
+        self.assertWithinBudget('get', reverse('products:products-popular'), 3, 50)
+        self.assertWithinBudget('get', reverse('products:products-limited'), 3, 50)
+        self.assertWithinBudget('get', reverse('products:sales'), 3, 50)
+        self.assertWithinBudget('get', reverse('products:categories'), 1, 50)
+        self.assertWithinBudget('get', reverse('products:tags'), 1, 50)
+
+    def test_catalog(self):
+        url = reverse('products:catalog')
+        self.assertWithinBudget('get', url, 4, 100)
+        self.assertWithinBudget('get', url, 5, 100, {
+            'category': self.category.pk, 'filter[minPrice]': '100', 'filter[maxPrice]': '50000',
+            'filter[available]': 'true', 'tags[]': [self.tag.pk], 'sort': 'price', 'sortType': 'inc',
+        })
+        self.assertWithinBudget('get', url, 4, 100, {'filter[name]': 'laptop pro'})
+        self.assertWithinBudget('get', url, 4, 100, {'pagination': 'cursor', 'sort': 'rating'})
+
+    def test_catalog_facets(self):
+        url = reverse('products:catalog-facets')
+        self.assertWithinBudget('get', url, 2, 100)
+        self.assertWithinBudget('get', url, 3, 100, {'category': self.category.pk, 'filter[freeDelivery]': 'true'})
+
+    def test_product(self):
+        self.assertWithinBudget('get', reverse('products:product-details', args=[self.product.pk]), 5, 50)
+
+    def test_review(self):
+        self.client.force_login(get_user_model().objects.get(username=f'{SEED_USERNAME_PREFIX}0'))
+        data = {'author': 'Buyer', 'email': 'buyer@example.com', 'text': 'Good', 'rate': 5}
+        self.assertWithinBudget('post', reverse('products:product-reviews', args=[self.product.pk]), 5, 100, data,
+                                status_code=201, content_type='application/json')
+
+
+class InstrumentationTestCase(TestCase):
+    """Замеры запросов: заголовок Server-Timing, строка лога и метрики по маршруту"""
+
+    def setUp(self):
+        metrics.reset()
+
+    def test_server_timing_and_log(self):
+        with self.assertLogs('megano.instrumentation', 'INFO') as logs:
+            response = self.client.get(reverse('products:tags'))
+        timing = re.fullmatch(r'db;desc="(\d+) queries";dur=[\d.]+, render;desc="serialization";dur=[\d.]+, '
+                              r'total;dur=[\d.]+', response['Server-Timing'])
+        self.assertIsNotNone(timing, response['Server-Timing'])
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual((record['route'], record['status'], record['db_queries']), ('api/tags', 200, int(timing[1])))
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_metrics(self):
+        self.client.get(reverse('products:tags'))
+        self.client.get(reverse('products:product-details', args=[1]))
+
+        content = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer secret').content.decode()
+        self.assertIn('megano_http_requests_total{method="GET",route="api/tags",status="200"} 1', content)
+        self.assertIn('megano_http_requests_total{method="GET",route="api/product/<int:pk>",status="404"} 1', content)
+        self.assertIn('megano_http_request_db_queries_bucket{method="GET",route="api/product/<int:pk>",le="1"} 1',
+                      content)
+        self.assertIn('megano_http_request_duration_seconds_count{method="GET",route="api/tags"} 1', content)
+
+    def test_metrics_access(self):
+        # Локальный адрес (например, запрос через обратный прокси) сам по себе доступа не даёт
+        self.assertEqual(self.client.get(reverse('metrics'), REMOTE_ADDR='127.0.0.1').status_code, 404)
+        self.assertEqual(self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer None').status_code, 404)
+        with override_settings(METRICS_TOKEN='secret'):
+            response = self.client.get(reverse('metrics'), REMOTE_ADDR='10.0.0.1', HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+        with override_settings(METRICS_ALLOWED_IPS=['10.0.0.1']):
+            self.assertEqual(self.client.get(reverse('metrics'), REMOTE_ADDR='10.0.0.1').status_code, 200)
+
+
+class SlowQueryTestCase(TestCase):
+    """Журнал медленных запросов: отпечатки, место вызова, EXPLAIN и сводка команды slow_queries"""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(title='Laptops')
+        Product.objects.create(category=category, title='Laptop', price=100, effective_price=100, count=5)
+
+    def setUp(self):
+        cache.clear()
+        slow_queries.explained_at.clear()
+
+    def test_fingerprint(self):
+        first = slow_queries.normalize_sql('SELECT * FROM t WHERE id IN (%s, %s) AND name = \'a\'  LIMIT 20')
+        second = slow_queries.normalize_sql('SELECT * FROM t WHERE id IN (%s, %s, %s) AND name = \'b\' LIMIT 5')
+        self.assertEqual(first, 'SELECT * FROM t WHERE id IN (?+) AND name = ? LIMIT ?')
+        self.assertEqual(slow_queries.get_fingerprint(first), slow_queries.get_fingerprint(second))
+
+    def test_capture(self):
+        with override_settings(SLOW_QUERY_THRESHOLD_MS=0), self.assertLogs('megano.slow_queries') as logs:
+            self.client.get(reverse('products:catalog'))
+        records = [json.loads(record.getMessage()) for record in logs.records]
+
+        self.assertEqual({(record['route'], record['view']) for record in records},
+                         {('api/catalog', 'products.views.ProductCatalogListAPIView')})
+        self.assertIn('ProductShortReadSerializer(many=True)', {record['serializer'] for record in records})
+        self.assertTrue(all(record.get('plan') for record in records if record['sql'].startswith('SELECT')))
+
+    def test_explained_fingerprints_are_bounded(self):
+        explained_at, max_fingerprints = slow_queries.explained_at, slow_queries.EXPLAINED_MAX_FINGERPRINTS
+        explained_at['stale'] = monotonic() - settings.SLOW_QUERY_EXPLAIN_INTERVAL
+        self.assertTrue(slow_queries.should_explain('first', 'SELECT 1', False))
+        self.assertEqual(list(explained_at), ['first'])
+
+        for index in range(max_fingerprints + 10):
+            slow_queries.should_explain(f'fingerprint-{index}', 'SELECT 1', False)
+        self.assertEqual(len(explained_at), max_fingerprints)
+        self.assertNotIn('first', explained_at)
+        self.assertFalse(slow_queries.should_explain(f'fingerprint-{max_fingerprints}', 'SELECT 1', False))
+
+    def test_threshold(self):
+        with override_settings(SLOW_QUERY_THRESHOLD_MS=60000), self.assertNoLogs('megano.slow_queries'):
+            self.client.get(reverse('products:catalog'))
+
+    def test_command(self):
+        records = [
+            {'fingerprint': 'a', 'duration_ms': 300, 'sql': 'SELECT a', 'view': 'CatalogView', 'plan': 'SCAN a'},
+            {'fingerprint': 'b', 'duration_ms': 250, 'sql': 'SELECT b'},
+            {'fingerprint': 'b', 'duration_ms': 250, 'sql': 'SELECT b'},
+        ]
+        with tempfile.TemporaryDirectory() as log_dir:
+            path = Path(log_dir) / 'slow_queries.log'
+            path.write_text(json.dumps(records[2]))
+            Path(f'{path}.1').write_text(json.dumps(records[1]))
+            with gzip.open(f'{path}.2.gz', 'wt') as backup:
+                backup.write(json.dumps(records[0]))
+            Path(f'{path}.old').write_text(json.dumps(records[0]))
+            stats = slow_queries.aggregate(slow_queries.read_log(path))
+            out = StringIO()
+            call_command('slow_queries', log=str(path), top=1, plans=True, stdout=out)
+
+        self.assertEqual([(item.fingerprint, item.count, item.total_ms) for item in stats],
+                         [('b', 2, 500), ('a', 1, 300)])
+        self.assertIn('b  total      500.0 ms  count      2', out.getvalue())
+        self.assertNotIn('SELECT a', out.getvalue())
@@ -8,6 +8,7 @@ from .views import (
     ProductBannersListAPIView,
     SaleListAPIView,
     ProductCatalogListAPIView,
+    CatalogFacetsAPIView,
     ProductRetrieveAPIView,
     ProductReviewCreateAPIView
 )
@@ -22,6 +23,7 @@ urlpatterns = [
     path('banners', ProductBannersListAPIView.as_view(), name='banners'),
     path('sales', SaleListAPIView.as_view(), name='sales'),
     path('catalog', ProductCatalogListAPIView.as_view(), name='catalog'),
+    path('catalog/facets', CatalogFacetsAPIView.as_view(), name='catalog-facets'),
     path('tags', TagListAPIView.as_view(), name='tags'),
     path('categories', CategoryListAPIView.as_view(), name='categories'),
 ]
@@ -1,14 +1,22 @@
 from rest_framework.generics import ListAPIView, RetrieveAPIView, CreateAPIView
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.request import Request
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from rest_framework import status
 
-from django.db.models import Avg, Value, Count
-from django.db.models.functions import Coalesce
 from django.shortcuts import get_object_or_404
 
-from .models import Tag, Category, Product, Sale, Review
-from .pagination import CustomPagination
+from .cache import CachedResponseMixin
+from .categories import get_category_tree, get_subtree_filter
+from .facets import compute_facets, get_category_facets
+from .models import Tag, Product, Sale, Review
+from .pagination import CustomPagination, KeysetPagination
+from .popular import get_popular_products
+from .search import get_search_backend, SEARCH_RANK_FIELD
 from .serializers import (
-    ProductShortSerializer,
+    PRODUCT_SHORT_VALUES,
+    ProductShortReadSerializer,
     ProductFullSerializer,
     TagSerializer,
     CategorySerializer,
@@ -19,92 +27,87 @@ from .serializers import (
 LIMITED_COUNT_THRESHOLD = 3
 
 
-class TagListAPIView(ListAPIView):
+class TagListAPIView(CachedResponseMixin, ListAPIView):
     """Получить список тегов"""
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
 
 
-class CategoryListAPIView(ListAPIView):
-    """Получить список категорий"""
-    queryset = Category.objects.filter(parent__isnull=True, is_deleted=False).prefetch_related('subcategories').all()
+class CategoryListAPIView(CachedResponseMixin, ListAPIView):
+    """
+    Получить список категорий
+    Дерево собирается из одного запроса всех категорий (см. categories.py)
+    """
     serializer_class = CategorySerializer
 
+    def list(self, request: Request, *args, **kwargs) -> Response:
+        return Response(get_category_tree(), status=status.HTTP_200_OK)
 
-class ProductsPopularListAPIView(ListAPIView):
-    """Получить список популярных продуктов"""
-    serializer_class = ProductShortSerializer
+
+class ProductsPopularListAPIView(CachedResponseMixin, ListAPIView):
+    """
+    Получить список популярных продуктов
+    Читаем сохранённый рейтинг (см. popular.py), при его отсутствии - живой запрос
+    """
+    serializer_class = ProductShortReadSerializer
 
     def get_queryset(self):
-        return Product.objects.select_related('category').prefetch_related(
-            'images', 'tags', 'reviews').annotate(rating=Coalesce(Avg('reviews__rate'), Value(0.00)),
-                                                  reviews_count=Count('reviews')).order_by(
-            '-rating', '-reviews_count').distinct()[:8]
+        return get_popular_products()
 
 
-class ProductsLimitedListAPIView(ListAPIView):
+class ProductsLimitedListAPIView(CachedResponseMixin, ListAPIView):
     """
     Получить список лимитированных продуктов: до 3 шт в наличии
     LIMITED_COUNT_THRESHOLD = 3
     """
-    serializer_class = ProductShortSerializer
+    serializer_class = ProductShortReadSerializer
 
     def get_queryset(self):
-        return Product.objects.select_related('category').prefetch_related(
-            'images', 'tags', 'reviews').annotate(rating=Coalesce(Avg('reviews__rate'), Value(0.00)),
-                                                  reviews_count=Count('reviews')).filter(
-            count__lte=LIMITED_COUNT_THRESHOLD, count__gt=0).distinct()[:16]
+        return Product.objects.visible().filter(
+            count__lte=LIMITED_COUNT_THRESHOLD, count__gt=0).values(*PRODUCT_SHORT_VALUES)[:16]
 
 
-class ProductBannersListAPIView(ListAPIView):
+class ProductBannersListAPIView(CachedResponseMixin, ListAPIView):
     """Получить список продуктов для баннера"""
-    serializer_class = ProductShortSerializer
+    serializer_class = ProductShortReadSerializer
 
     def get_queryset(self):
-        return Product.objects.select_related('category').prefetch_related(
-            'images', 'tags', 'reviews').annotate(rating=Coalesce(Avg('reviews__rate'), Value(0.00)),
-                                                  reviews_count=Count('reviews')).distinct()[:3]
+        return Product.objects.visible().values(*PRODUCT_SHORT_VALUES)[:3]
 
 
-class SaleListAPIView(ListAPIView):
+class SaleListAPIView(CachedResponseMixin, ListAPIView):
     """Получить список продуктов со скидкой"""
     serializer_class = SaleSerializer
     pagination_class = CustomPagination
 
     def get_queryset(self):
-        return Sale.objects.select_related('product').prefetch_related('product__images')
+        return Sale.objects.filter(product__is_deleted=False).select_related('product').prefetch_related(
+            'product__images').order_by('pk')
 
 
-class ProductCatalogListAPIView(ListAPIView):
-    """Получить список отфильтрованных продуктов"""
-    serializer_class = ProductShortSerializer
-    pagination_class = CustomPagination
+class CatalogFilterMixin:
+    """Фильтрация товаров каталога по параметрам запроса"""
 
-    def get_queryset(self):
+    def get_catalog_filters(self) -> dict:
+        """Определяем по каким фильтрам получить продукты"""
         # Получаем фильтры из запроса
         filters_params = self.request.query_params
 
-        # Определяем по каким фильтрам получить продукты
         filters = {}
 
-        # Фильтрация по категории
+        # Фильтрация по категории (вместе с подкатегориями, см. filter_catalog)
         category = filters_params.get('category')
         if category and category.isdigit():
             filters['category'] = int(category)
 
-        # Фильтрация по названию
-        name = filters_params.get('filter[name]')
-        if name and name.strip():
-            filters['title__icontains'] = name.strip()
-
-        # Фильтрация по цене
+        # Фильтрация по текущей цене (с учётом действующей скидки)
         min_price = filters_params.get('filter[minPrice]')
         if min_price not in (None, ''):
-            filters['price__gte'] = float(min_price)
+            filters['effective_price__gte'] = float(min_price)
 
         max_price = filters_params.get('filter[maxPrice]')
         if max_price not in (None, ''):
-            filters['price__lte'] = float(max_price)
+            filters['effective_price__lte'] = float(max_price)
 
         # Фильтрация по бесплатной доставке
         freeDelivery = filters_params.get('filter[freeDelivery]')
@@ -122,44 +125,108 @@ class ProductCatalogListAPIView(ListAPIView):
             tag_ids = [int(tag) for tag in tags]
             filters['tags__id__in'] = tag_ids
 
+        return filters
+
+    def get_search_query(self) -> str:
+        """Строка полнотекстового поиска по названию и описаниям (см. search.py)"""
+        name = self.request.query_params.get('filter[name]')
+        return name.strip() if name else ''
+
+    def filter_catalog(self, queryset):
+        """Применяем фильтры и поиск каталога к queryset товаров"""
+        filters = self.get_catalog_filters()
+        category = filters.pop('category', None)
+        queryset = queryset.filter(**filters)
+
+        # Товары категории и всех её подкатегорий - по материализованному пути категории
+        if category is not None:
+            queryset = queryset.filter(get_subtree_filter(category))
+
+        search = self.get_search_query()
+        if search:
+            queryset = get_search_backend().filter(queryset, search)
+
+        # Соединение с тегами может дублировать товары
+        if 'tags__id__in' in filters:
+            queryset = queryset.distinct()
+        return queryset
+
+
+class ProductCatalogListAPIView(CatalogFilterMixin, ListAPIView):
+    """
+    Получить список отфильтрованных продуктов
+    По умолчанию - постраничная пагинация, с параметром pagination=cursor (или cursor=...) - пагинация по ключу
+    """
+    serializer_class = ProductShortReadSerializer
+    pagination_class = CustomPagination
+
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            params = self.request.query_params
+            if params.get('pagination') == 'cursor' or params.get(KeysetPagination.cursor_query_param):
+                self._paginator = KeysetPagination()
+            else:
+                self._paginator = self.pagination_class()
+        return self._paginator
+
+    def get_queryset(self):
+        filters_params = self.request.query_params
+
         # Сортировка
         sort = filters_params.get('sort', default='datе')
         sort_type = filters_params.get('sortType', default='dec')
 
         sort_mapping = {
             'rating': 'rating',
-            'price': 'price',
+            'price': 'effective_price',
             'date': 'date',
             'reviews': 'reviews_count',
         }
+        # Сортировка по релевантности доступна только при поиске
+        if self.get_search_query():
+            sort_mapping['relevance'] = SEARCH_RANK_FIELD
 
         sort_field = sort_mapping.get(sort, 'date')
 
+        # id - для однозначного порядка товаров с одинаковым значением поля сортировки
+        id_field = 'id'
         if sort_type == 'dec':
             sort_field = f'-{sort_field}'
+            id_field = '-id'
+
+        # Строки .values() для ProductShortReadSerializer; ранг поиска (коррелированный подзапрос к индексу
+        # на каждую строку) выбираем только для сортировки по релевантности - он нужен для пагинации по ключу
+        values = PRODUCT_SHORT_VALUES + ((SEARCH_RANK_FIELD,) if sort_field.lstrip('-') == SEARCH_RANK_FIELD else ())
+        return self.filter_catalog(Product.objects.visible()).order_by(
+            sort_field, id_field
+        ).values(*values)
+
+
+class CatalogFacetsAPIView(CatalogFilterMixin, APIView):
+    """
+    Получить фасеты каталога для текущих фильтров: количество товаров по категориям и тегам,
+    диапазон цен, количество товаров с бесплатной доставкой и в наличии.
+    Без фильтров (или только с категорией) ответ собирается из кэшированной сводки по категориям
+    """
+
+    def get(self, request: Request) -> Response:
+        filters = self.get_catalog_filters()
+        if self.get_search_query() or set(filters) - {'category'}:
+            facets = compute_facets(self.filter_catalog(Product.objects.visible()))
+        else:
+            facets = get_category_facets(filters.get('category'))
+        return Response(facets, status=status.HTTP_200_OK)
+
 
-        return Product.objects.select_related(
-            'category'
-        ).prefetch_related(
-            'images', 'tags'
-        ).annotate(
-            rating=Coalesce(Avg('reviews__rate'), Value(0.00)),
-            reviews_count=Count('reviews')
-        ).filter(
-            **filters
-        ).order_by(
-            sort_field
-        ).distinct()
-
-
-class ProductRetrieveAPIView(RetrieveAPIView):
+class ProductRetrieveAPIView(CachedResponseMixin, RetrieveAPIView):
     """Получить полное описание продукта"""
     serializer_class = ProductFullSerializer
     pagination_class = CustomPagination
 
     def get_queryset(self):
-        return Product.objects.select_related('category').prefetch_related(
-            'images', 'tags', 'reviews').annotate(rating=Coalesce(Avg('reviews__rate'), Value(0.00)))
+        return Product.objects.visible().select_related('category').prefetch_related(
+            'images', 'tags', 'reviews')
 
 
 class ProductReviewCreateAPIView(CreateAPIView):
@@ -169,5 +236,5 @@ class ProductReviewCreateAPIView(CreateAPIView):
     serializer_class = ReviewSerializer
 
     def perform_create(self, serializer):
-        product = get_object_or_404(Product, id=self.kwargs['pk'])
+        product = get_object_or_404(Product.objects.visible(), id=self.kwargs['pk'])
         serializer.save(product=product)
@@ -0,0 +1,87 @@
+"""
+Сравнение двух прогонов нагрузочного теста по файлам статистики Locust (<префикс>_stats.csv):
+запросы в секунду, медиана, 95-й и 99-й перцентили задержки и доля ошибок по каждому эндпоинту.
+
+    python loadtest/compare.py loadtest/results/1.0_stats.csv loadtest/results/1.1_stats.csv
+
+Изменение задержки больше --threshold процентов помечается; с --fail-on-regression скрипт
+завершается с кодом 1, если какой-либо эндпоинт стал медленнее порога (для CI).
+"""
+import argparse
+import csv
+import sys
+from typing import Dict, Optional
+
+COLUMNS = (
+    # (заголовок, столбец Locust, больше - хуже)
+    ('req/s', 'Requests/s', False),
+    ('p50, ms', '50%', True),
+    ('p95, ms', '95%', True),
+    ('p99, ms', '99%', True),
+)
+
+
+def read_stats(path: str) -> Dict[str, dict]:
+    """Строки статистики по имени эндпоинта ('GET /api/catalog'), включая итоговую строку Aggregated"""
+    with open(path, newline='', encoding='utf-8') as file:
+        return {f'{row["Type"]} {row["Name"]}'.strip(): row for row in csv.DictReader(file)}
+
+
+def to_float(value: Optional[str]) -> Optional[float]:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def error_rate(row: dict) -> float:
+    requests = to_float(row.get('Request Count')) or 0
+    return (to_float(row.get('Failure Count')) or 0) / requests * 100 if requests else 0
+
+
+def change(base: Optional[float], new: Optional[float]) -> Optional[float]:
+    """Изменение в процентах"""
+    if not base or new is None:
+        return None
+    return (new - base) / base * 100
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Compare two Locust runs endpoint by endpoint')
+    parser.add_argument('base', help='Stats CSV of the baseline run')
+    parser.add_argument('new', help='Stats CSV of the new run')
+    parser.add_argument('--threshold', type=float, default=10, help='Latency change to flag, percent')
+    parser.add_argument('--fail-on-regression', action='store_true', help='Exit with 1 on a flagged slowdown')
+    args = parser.parse_args()
+
+    base, new = read_stats(args.base), read_stats(args.new)
+    names = sorted(set(base) | set(new), key=lambda name: (name.endswith('Aggregated'), name))
+    width = max(len(name) for name in names)
+
+    print(f'{"endpoint":<{width}}  ' + '  '.join(f'{title:>22}' for title, _, _ in COLUMNS) + f'  {"errors, %":>14}')
+    regressions = []
+    for name in names:
+        if name not in base or name not in new:
+            print(f'{name:<{width}}  {"only in " + ("new" if name in new else "base") + " run"}')
+            continue
+        cells = []
+        for title, column, higher_is_worse in COLUMNS:
+            old_value, new_value = to_float(base[name].get(column)), to_float(new[name].get(column))
+            delta = change(old_value, new_value)
+            mark = ''
+            if delta is not None and higher_is_worse and abs(delta) >= args.threshold:
+                mark = '!' if delta > 0 else '+'
+                if delta > 0:
+                    regressions.append(f'{name} {title}')
+            delta_text = f'{delta:+.0f}%' if delta is not None else '-'
+            cells.append(f'{old_value or 0:>7.1f} → {new_value or 0:>7.1f} {delta_text:>5}{mark:1}')
+        cells.append(f'{error_rate(base[name]):>5.1f} → {error_rate(new[name]):>5.1f}')
+        print(f'{name:<{width}}  ' + '  '.join(cells))
+
+    if regressions:
+        print(f'\nSlower by more than {args.threshold:.0f}%: ' + ', '.join(regressions))
+    return 1 if regressions and args.fail_on_regression else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
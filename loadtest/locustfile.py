@@ -0,0 +1,170 @@
+"""
+Нагрузочные сценарии витрины Megano для Locust.
+
+Сценарии повторяют пути покупателя через API:
+- главная страница: баннеры, популярные и лимитированные товары, категории, теги, скидки;
+- каталог: фильтры по категории, цене, наличию и тегам, сортировки, поиск, фасеты, следующая страница;
+- карточка товара;
+- корзина анонимного посетителя и пользователя: добавление и удаление товаров, предварительный расчёт;
+- оформление заказа, подтверждение и оплата, история заказов (только авторизованные покупатели).
+
+Запускается против runserver или gunicorn на БД, заполненной командой seed_megano
+(покупатели входят как seed-user-N с паролем megano-seed):
+
+    locust -f loadtest/locustfile.py --host http://127.0.0.1:8000 --headless -u 50 -r 10 -t 5m \\
+        --csv loadtest/results/<релиз>
+
+Locust выводит запросы в секунду и перцентили задержки по каждому эндпоинту (URL с id объединены по имени
+маршрута), --csv сохраняет их для сравнения релизов (см. compare.py).
+Переменные окружения: LOADTEST_USERS - количество пользователей seed_megano, LOADTEST_PASSWORD - их пароль.
+"""
+import os
+import random
+
+import requests
+from locust import HttpUser, between, events, task
+
+SEED_USERNAME_PREFIX = 'seed-user-'
+USERS = int(os.getenv('LOADTEST_USERS') or 100)
+PASSWORD = os.getenv('LOADTEST_PASSWORD') or 'megano-seed'
+
+SORTS = ('date', 'price', 'rating', 'reviews')
+SORT_TYPES = ('dec', 'inc')
+SEARCH_QUERIES = ('laptop', 'smartphone pro', 'camera', 'watch ultra', 'mini')
+PAYMENT = {'number': '12345678', 'name': 'Load Test', 'month': '12', 'year': '2030', 'code': '123'}
+DELIVERY = {'fullName': 'Load Test', 'phone': '', 'email': '', 'deliveryType': 'ordinary', 'city': 'Moscow',
+            'address': 'Red Square, 1', 'paymentType': 'online'}
+
+# Справочники каталога загружаются один раз перед началом теста
+catalog = {'categories': [], 'tags': [], 'products': []}
+
+
+def flatten_categories(categories: list) -> list:
+    ids = []
+    for category in categories:
+        ids.append(category['id'])
+        ids += flatten_categories(category.get('subcategories') or [])
+    return ids
+
+
+@events.test_start.add_listener
+def load_catalog(environment, **kwargs):
+    """Категории, теги и товары в наличии, которые выбирают сценарии"""
+    # Обычная сессия requests: запросы подготовки не попадают в статистику
+    host = environment.host.rstrip('/')
+    with requests.Session() as session:
+        catalog['categories'] = flatten_categories(session.get(f'{host}/api/categories').json())
+        catalog['tags'] = [tag['id'] for tag in session.get(f'{host}/api/tags').json()]
+        for page in range(1, 6):
+            items = session.get(f'{host}/api/catalog', params={
+                'filter[available]': 'true', 'currentPage': page, 'limit': 20,
+            }).json()['items']
+            catalog['products'] += [item['id'] for item in items]
+    if not catalog['products']:
+        raise RuntimeError('Catalog is empty: fill the database with "manage.py seed_megano"')
+
+
+class ShopperMixin:
+    """Просмотр витрины и корзина; общие задачи анонимного и авторизованного покупателя"""
+
+    def random_product(self) -> int:
+        return random.choice(catalog['products'])
+
+    @task(3)
+    def home_page(self):
+        for url in ('/api/banners', '/api/products/popular', '/api/products/limited', '/api/categories',
+                    '/api/tags'):
+            self.client.get(url)
+        self.client.get('/api/sales', params={'currentPage': 1})
+
+    @task(6)
+    def browse_catalog(self):
+        params = {'sort': random.choice(SORTS), 'sortType': random.choice(SORT_TYPES), 'limit': 20}
+        if catalog['categories'] and random.random() < 0.6:
+            params['category'] = random.choice(catalog['categories'])
+        if random.random() < 0.4:
+            low = random.randrange(0, 50000, 1000)
+            params.update({'filter[minPrice]': low, 'filter[maxPrice]': low + random.randrange(5000, 50000, 5000)})
+        if random.random() < 0.3:
+            params['filter[available]'] = 'true'
+        if catalog['tags'] and random.random() < 0.2:
+            params['tags[]'] = random.choice(catalog['tags'])
+        self.client.get('/api/catalog', params=params)
+        self.client.get('/api/catalog/facets', params=params)
+
+        # Следующая страница - по ключу
+        page = self.client.get('/api/catalog', params={**params, 'pagination': 'cursor'}, name='/api/catalog?cursor')
+        cursor = page.json().get('nextCursor') if page.ok else None
+        if cursor:
+            self.client.get('/api/catalog', params={**params, 'cursor': cursor}, name='/api/catalog?cursor')
+
+    @task(2)
+    def search_catalog(self):
+        self.client.get('/api/catalog', params={'filter[name]': random.choice(SEARCH_QUERIES), 'sort': 'relevance'},
+                        name='/api/catalog?search')
+
+    @task(5)
+    def view_product(self):
+        self.client.get(f'/api/product/{self.random_product()}', name='/api/product/[id]')
+
+    @task(3)
+    def edit_basket(self):
+        product_id = self.random_product()
+        self.client.post('/api/basket', json={'id': product_id, 'count': random.randint(1, 2)},
+                         headers=self.write_headers())
+        self.client.get('/api/basket')
+        self.client.get('/api/basket/total', params={'deliveryType': random.choice(('ordinary', 'express'))})
+        if random.random() < 0.5:
+            self.client.delete('/api/basket', json={'id': product_id, 'count': 1}, headers=self.write_headers())
+
+    def write_headers(self) -> dict:
+        return {}
+
+
+class AnonymousShopper(ShopperMixin, HttpUser):
+    """Посетитель без входа: витрина и корзина в cookie"""
+    weight = 3
+    wait_time = between(1, 3)
+
+
+class Customer(ShopperMixin, HttpUser):
+    """Покупатель с входом: витрина, корзина в БД, оформление и оплата заказа, история заказов"""
+    weight = 1
+    wait_time = between(1, 3)
+
+    def on_start(self):
+        username = f'{SEED_USERNAME_PREFIX}{random.randrange(USERS)}'
+        response = self.client.post('/api/sign-in', json={'username': username, 'password': PASSWORD})
+        if not response.ok:
+            raise RuntimeError(f'Cannot sign in as {username}: {response.status_code}')
+
+    def write_headers(self) -> dict:
+        # Сессионная аутентификация DRF проверяет CSRF-токен у авторизованных запросов
+        return {'X-CSRFToken': self.client.cookies.get('csrftoken', '')}
+
+    @task(2)
+    def order_history(self):
+        self.client.get('/api/orders', params={'view': 'summary', 'limit': 20}, name='/api/orders?summary')
+
+    @task(1)
+    def checkout(self):
+        for _ in range(random.randint(1, 3)):
+            self.client.post('/api/basket', json={'id': self.random_product(), 'count': 1},
+                             headers=self.write_headers())
+
+        with self.client.post('/api/orders', headers=self.write_headers(), catch_response=True) as response:
+            # Нехватка товара на складе - ожидаемый отказ, а не ошибка сервера
+            if response.status_code == 400 and 'products' in response.json():
+                response.success()
+                self.client.delete('/api/basket', json={'id': response.json()['products'][0], 'count': 100},
+                                   headers=self.write_headers())
+                return
+        if not response.ok:
+            return
+        order_id = response.json()['orderId']
+
+        self.client.get(f'/api/order/{order_id}', name='/api/order/[id]')
+        self.client.post(f'/api/order/{order_id}', json=DELIVERY, headers=self.write_headers(),
+                         name='/api/order/[id]')
+        self.client.post(f'/api/payment/{order_id}', json=PAYMENT, headers=self.write_headers(),
+                         name='/api/payment/[id]')